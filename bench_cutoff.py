@@ -0,0 +1,97 @@
+'''
+Water-level cutoff latency benchmark for pump_idrophonics.
+
+The pump runs on the simulated backend while the level sensor reads "water low"; after a
+random delay a falling edge ("water high") is injected on the sensor pin and the time
+until the pump is switched OFF is measured. Polling and edge-detect modes are compared.
+All the times are in (virtual) milliseconds of the backend clock.
+
+    python bench_cutoff.py --trials 20 --poll-interval 1.0 --json bench_cutoff.json
+'''
+
+import argparse
+import json
+import platform
+import random
+import sys
+import threading
+import time
+
+from hardware_aeroGreenHouse import simBackend, virtualClock
+from bench_timing import make_helper, percentiles
+
+
+
+PUMP_PIN = 27
+SENSOR_PIN = 13
+
+
+def run(mode='edge', trials=10, poll_interval=1.0, speed=10.0, seed=None, config_file='config.yaml'):
+    '''
+    Measure the cutoff latency of <trials> idroponics cycles
+
+    :param mode: edge or poll
+    :param poll_interval: (s), water level poll period
+    :param speed: virtual clock speed (virtual seconds per real second)
+    '''
+    gpio_pins = [{'name': 'IDROPONICS', 'pin': PUMP_PIN, 'what_type': 'pump', 'mode': 'idroponics',
+                  'sensor': 'MOISTURE', 'interval': 2, 'on_time': 60},
+                 {'name': 'MOISTURE', 'pin': SENSOR_PIN, 'what_type': 'sensor'}]
+    backend = simBackend(virtualClock(speed), record=True)
+    ah = make_helper(gpio_pins, backend, config_file)
+    rnd = random.Random(seed)
+
+    latencies = []
+    for _ in range(trials):
+        backend.inject_edge(SENSOR_PIN, 1) # water low
+        cycle = threading.Thread(target=ah.pump_idrophonics,
+                                 kwargs=dict(gpio_pump=PUMP_PIN, gpio_sensor=SENSOR_PIN, max_irrigation_time=60,
+                                             poll_interval=poll_interval, edge_detect=(mode == 'edge')))
+        cycle.start()
+        ah.clock.sleep(rnd.uniform(0.2, 3.0))
+
+        backend.inject_edge(SENSOR_PIN, 0) # water high
+        t_edge = backend.edges[-1][0]
+        cycle.join()
+
+        t_off = next(t for t, pin, value in backend.events if pin == PUMP_PIN and value is True and t >= t_edge)
+        latencies.append((t_off - t_edge) * 1000)
+
+    ah.cleanup_gpios()
+    return percentiles(latencies)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='AeroGreenHouse water-level cutoff latency benchmark')
+    parser.add_argument('--trials', type=int, default=10, help='cycles per mode')
+    parser.add_argument('--poll-interval', type=float, default=1.0, help='water level poll period (s)')
+    parser.add_argument('--speed', type=float, default=10.0, help='virtual clock speed')
+    parser.add_argument('--seed', type=int, default=None, help='seed of the edge delays')
+    parser.add_argument('--config', default='config.yaml', help='base configuration file')
+    parser.add_argument('--json', default=None, help='write the report to this JSON file')
+    args = parser.parse_args(argv)
+
+    report = {
+        'meta': {
+            'benchmark': 'water_level_cutoff',
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'trials': args.trials, 'poll_interval_s': args.poll_interval, 'speed': args.speed,
+        },
+        'cutoff_latency_ms': {},
+    }
+    for mode in ('poll', 'edge'):
+        stats = run(mode, args.trials, args.poll_interval, args.speed, args.seed, args.config)
+        report['cutoff_latency_ms'][mode] = stats
+        print(f"{mode:5s} p50={stats['p50']:8.2f}ms p90={stats['p90']:8.2f}ms p99={stats['p99']:8.2f}ms max={stats['max']:8.2f}ms")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'Report written to {args.json}')
+    return report
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,157 @@
+'''
+Logging latency benchmark.
+
+Measures the time spent inside logger.info() by N actuation-like threads, each logging
+M messages, with the handlers called directly by the caller thread (the original
+basicConfig setup) and with the queue handler + listener thread of
+logqueue_aeroGreenHouse. A slow storage (SD card) can be simulated with a delay on
+every write of the file handler.
+
+    python bench_logging.py --threads 4 --messages 500 --write-delay 0.002 --json bench_logging.json
+'''
+
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+
+from bench_timing import percentiles
+from logqueue_aeroGreenHouse import deferredQueueHandler, dedupFilter
+from logging.handlers import QueueListener
+
+
+
+class slowFileHandler(logging.FileHandler):
+
+    '''
+    FileHandler with a fixed delay on every record (slow storage)
+    '''
+
+    def __init__(self, filename, delay_s=0.0):
+        super().__init__(filename)
+        self.delay_s = delay_s
+
+    def emit(self, record):
+        if self.delay_s:
+            time.sleep(self.delay_s)
+        super().emit(record)
+
+
+def timed_calls(logger, threads, messages):
+    '''
+    Latency (s) of every logger.info call of <threads> threads logging <messages> messages
+    '''
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(k):
+        local = []
+        for i in range(messages):
+            t0 = time.perf_counter()
+            logger.info('zone %d: pump ON for %.1fs (cycle %d)', k, 10.0, i)
+            local.append(time.perf_counter() - t0)
+        with lock:
+            latencies.extend(local)
+
+    workers = [threading.Thread(target=worker, args=(k,)) for k in range(threads)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return latencies
+
+
+def run_mode(mode, threads, messages, write_delay, dedup_window=0.0):
+    '''
+    Percentiles (ms) of the logger.info latency with the <mode> ('direct' | 'queue') setup
+    '''
+    tmp_dir = tempfile.mkdtemp(prefix='aero_bench_log_')
+    handler = slowFileHandler(os.path.join(tmp_dir, f'{mode}.log'), write_delay)
+    handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
+
+    logger = logging.getLogger(f'bench_logging.{mode}')
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+    listener = None
+    if mode == 'direct':
+        logger.addHandler(handler)
+    else:
+        import queue
+        log_queue = queue.SimpleQueue()
+        queue_handler = deferredQueueHandler(log_queue)
+        if dedup_window > 0:
+            queue_handler.addFilter(dedupFilter(dedup_window))
+        listener = QueueListener(log_queue, handler)
+        listener.start()
+        logger.addHandler(queue_handler)
+
+    t0 = time.perf_counter()
+    latencies = timed_calls(logger, threads, messages)
+    t_calls = time.perf_counter() - t0
+    if listener is not None:
+        listener.stop() # waits for the queued records to be written
+    t_total = time.perf_counter() - t0
+
+    for h in list(logger.handlers):
+        logger.removeHandler(h)
+    handler.close()
+
+    with open(handler.baseFilename, 'r') as f:
+        written = sum(1 for _ in f)
+
+    return {
+        'latency_ms': {k: v * 1000 for k, v in percentiles(latencies).items()},
+        'calls_seconds': t_calls,
+        'total_seconds': t_total,
+        'records_written': written,
+    }
+
+
+def run(threads=4, messages=500, write_delay=0.0):
+    '''
+    Run the benchmark and return the report dictionary
+    '''
+    return {
+        'meta': {
+            'benchmark': 'logging',
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'threads': threads,
+            'messages': messages,
+            'write_delay': write_delay,
+        },
+        'direct': run_mode('direct', threads, messages, write_delay),
+        'queue': run_mode('queue', threads, messages, write_delay),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='AeroGreenHouse logging latency benchmark')
+    parser.add_argument('--threads', type=int, default=4, help='number of logging threads')
+    parser.add_argument('--messages', type=int, default=500, help='messages per thread')
+    parser.add_argument('--write-delay', type=float, default=0.0, help='(s) simulated delay of every file write')
+    parser.add_argument('--json', default=None, help='write the report to this JSON file')
+    args = parser.parse_args(argv)
+
+    report = run(args.threads, args.messages, args.write_delay)
+    for mode in ('direct', 'queue'):
+        lat = report[mode]['latency_ms']
+        print(f"{mode:6s}: logger.info p50 {lat['p50']:.4f}ms p99 {lat['p99']:.4f}ms max {lat['max']:.4f}ms"
+              f" ({report[mode]['records_written']} records written)")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'Report written to {args.json}')
+    return report
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
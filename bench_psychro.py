@@ -0,0 +1,90 @@
+'''
+Scalar vs batch psychrometrics micro-benchmark.
+
+Computes VPD (and the T_modifier factor) for N synthetic readings with the scalar
+functions in a Python loop and with the vectorized batch functions, checks that the
+results match and reports the throughput (readings per second) of both.
+The default N is a season (90 days) of 5 s samples.
+
+    python bench_psychro.py --samples 1555200 --json bench_psychro.json
+'''
+
+import argparse
+import json
+import platform
+import sys
+import time
+
+import numpy as np
+
+from psychro_aeroGreenHouse import vpd, t_modifier, psychro_batch
+
+
+
+def timed(func, *args):
+    t0 = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - t0
+
+
+def scalar_loop(T, H, Topt):
+    vpds = [vpd(t, h) for t, h in zip(T, H)]
+    mods = [t_modifier(t, Topt) for t in T]
+    return vpds, mods
+
+
+def run(samples=90 * 17280, Topt=18.0, seed=0):
+    '''
+    Run the benchmark and return the report dictionary
+
+    :param samples: number of readings
+    :param Topt: (°C), optimal temperature of T_modifier
+    '''
+    rng = np.random.default_rng(seed)
+    T = rng.uniform(5, 40, samples)
+    H = rng.uniform(10, 100, samples)
+    T_list, H_list = T.tolist(), H.tolist()
+
+    (vpd_s, mod_s), t_scalar = timed(scalar_loop, T_list, H_list, Topt)
+    batch, t_batch = timed(psychro_batch, T, H, Topt)
+
+    return {
+        'meta': {
+            'benchmark': 'psychrometrics',
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'samples': samples,
+        },
+        'scalar': {'seconds': t_scalar, 'readings_per_s': samples / t_scalar},
+        'batch': {'seconds': t_batch, 'readings_per_s': samples / t_batch},
+        'speedup': t_scalar / t_batch,
+        'max_abs_error': {
+            'VPD': float(np.max(np.abs(batch['VPD'] - np.asarray(vpd_s)))),
+            'T_modifier': float(np.max(np.abs(batch['T_modifier'] - np.asarray(mod_s)))),
+        },
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='AeroGreenHouse psychrometrics micro-benchmark')
+    parser.add_argument('--samples', type=int, default=90 * 17280, help='number of readings')
+    parser.add_argument('--topt', type=float, default=18.0, help='T_modifier optimal temperature')
+    parser.add_argument('--json', default=None, help='write the report to this JSON file')
+    args = parser.parse_args(argv)
+
+    report = run(args.samples, args.topt)
+    print(f"scalar: {report['scalar']['readings_per_s']:12.0f} readings/s ({report['scalar']['seconds']:.3f}s)")
+    print(f"batch : {report['batch']['readings_per_s']:12.0f} readings/s ({report['batch']['seconds']:.3f}s)")
+    print(f"speedup x{report['speedup']:.1f}, max abs error {report['max_abs_error']}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'Report written to {args.json}')
+    return report
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
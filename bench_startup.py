@@ -0,0 +1,172 @@
+'''
+Startup-time benchmark of the daemon and the GUI.
+
+Every measure runs in a fresh interpreter (nothing is already imported) and is repeated
+<repeat> times; the report gives the median and the max of:
+    - import: time to import the entry modules of the daemon (helper, daemon API) and of the GUI
+    - init:   aeroHelper phases (config, logging, core, backend, gpio, runtime, sensors, see
+              aeroHelper.init_timings) on the simulated backend, the time to the daemon API
+              being served and the time to the hardware being ready
+    - gui:    construction of the GUI window (only with a display)
+
+    python bench_startup.py --repeat 5 --runtime asyncio --json bench_startup.json
+'''
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import yaml
+
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+IMPORTS = {
+    'daemon': ['helper_aeroGreenHouse', 'daemon_aeroGreenHouse'],
+    'gui': ['gui'],
+}
+
+# run in the child interpreter: aeroHelper + aeroDaemon on the sim backend, phases as JSON
+INIT_SCRIPT = '''
+import json, sys, time
+t0 = time.perf_counter()
+from helper_aeroGreenHouse import aeroHelper
+from daemon_aeroGreenHouse import aeroDaemon
+t_import = time.perf_counter()
+ah = aeroHelper(sys.argv[1], defer_hardware=True)
+daemon = aeroDaemon(ah, path=sys.argv[2])
+daemon.start()
+t_api = time.perf_counter()
+ah.init_hardware()
+t_ready = time.perf_counter()
+daemon.stop()
+ah.cleanup_gpios()
+print(json.dumps(dict(ah.init_timings, imports=t_import - t0, api_ready=t_api - t0, hardware_ready=t_ready - t0)))
+'''
+
+GUI_SCRIPT = '''
+import json, time
+t0 = time.perf_counter()
+import tkinter as tk
+import gui
+t_import = time.perf_counter()
+root = tk.Tk()
+app = gui.AeroGreenHouseGUI(root)
+root.update()
+t_window = time.perf_counter()
+app.executor.shutdown(wait=False)
+root.destroy()
+print(json.dumps({'imports': t_import - t0, 'window': t_window - t0}))
+'''
+
+
+
+def _python(code, *args):
+    out = subprocess.run([sys.executable, '-c', code, *args], cwd=HERE, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def summarize(samples):
+    '''
+    {key: {median, max}} of a list of {key: seconds}
+    '''
+    return {key: {'median': statistics.median(s[key] for s in samples), 'max': max(s[key] for s in samples)}
+            for key in samples[0]}
+
+
+def measure_imports(modules, repeat):
+    code = ('import json, sys, time\nt = time.perf_counter()\n'
+            + ''.join(f'import {m}\n' for m in modules)
+            + 'print(json.dumps({"import": time.perf_counter() - t, "modules": len(sys.modules)}))')
+    return summarize([_python(code) for _ in range(repeat)])
+
+
+def make_config(config_file, runtime, tmp_dir):
+    '''
+    Base config on the sim backend with a temporary log directory
+    '''
+    with open(config_file, 'r') as f:
+        configs = yaml.safe_load(f)
+    configs['log'] = {'directory': tmp_dir, 'filename': 'bench.log', 'level': 'WARNING'}
+    configs['hardware'] = dict(configs.get('hardware', {}), backend='sim')
+    configs['config_reload_interval'] = 0
+    configs.setdefault('dht22', {}).update(process=False, saving_dir=tmp_dir)
+    configs['journal'] = dict(configs.get('journal', {}), directory=tmp_dir)
+    if runtime is not None:
+        configs.setdefault('controller', {})['runtime'] = runtime
+    path = os.path.join(tmp_dir, 'config.yaml')
+    with open(path, 'w') as f:
+        yaml.dump(configs, f)
+    return path
+
+
+def run(repeat=5, config_file='config.yaml', runtime=None, gui=None):
+    '''
+    Run the benchmark and return the report dictionary
+
+    :param repeat: fresh interpreters per measure
+    :param runtime: controller runtime, threads or asyncio (default: the one in the config)
+    :param gui: measure the GUI window (default: only if a display is available)
+    '''
+    tmp_dir = tempfile.mkdtemp(prefix='aero_startup_')
+    config = make_config(config_file, runtime, tmp_dir)
+    socket = os.path.join(tmp_dir, 'daemon.sock')
+
+    report = {
+        'meta': {
+            'benchmark': 'startup',
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'repeat': repeat,
+            'runtime': runtime,
+        },
+        'import': {name: measure_imports(modules, repeat) for name, modules in IMPORTS.items() if name != 'gui'},
+        'init': summarize([_python(INIT_SCRIPT, config, socket) for _ in range(repeat)]),
+    }
+
+    if gui is None:
+        gui = bool(os.environ.get('DISPLAY') or os.environ.get('WAYLAND_DISPLAY'))
+    if gui:
+        report['gui'] = summarize([_python(GUI_SCRIPT) for _ in range(repeat)])
+    else:
+        # no window without a display: only the imports of the GUI module
+        report['import']['gui'] = measure_imports(IMPORTS['gui'], repeat)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='AeroGreenHouse startup-time benchmark')
+    parser.add_argument('--repeat', type=int, default=5, help='fresh interpreters per measure')
+    parser.add_argument('--runtime', choices=('threads', 'asyncio'), default=None, help='controller runtime')
+    parser.add_argument('--config', default='config.yaml', help='base configuration file')
+    parser.add_argument('--gui', action='store_true', default=None, help='also open the GUI window (needs a display)')
+    parser.add_argument('--json', default=None, help='write the report to this JSON file')
+    args = parser.parse_args(argv)
+
+    report = run(args.repeat, args.config, args.runtime, args.gui)
+
+    for section in ('import', 'init', 'gui'):
+        for name, stats in report.get(section, {}).items():
+            if section == 'import':
+                print(f"import {name:10s} {stats['import']['median']*1000:8.1f}ms (max {stats['import']['max']*1000:.1f}ms)"
+                      f" {stats['modules']['median']:.0f} modules")
+            else:
+                print(f"{section:6s} {name:14s} {stats['median']*1000:8.1f}ms (max {stats['max']*1000:.1f}ms)")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'Report written to {args.json}')
+    return report
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,205 @@
+'''
+Actuation timing-accuracy benchmark.
+
+Runs N aeroponics zones for N cycles on the simulated, recording GPIO backend and
+reports, per zone and overall, the percentiles of:
+    - start latency: pump ON time - scheduled deadline
+    - on-time error: measured ON duration - configured on_time
+    - drift: cumulative slip of the k-th start with respect to the first start + k*interval
+All the times are in (virtual) seconds of the backend clock.
+
+    python bench_timing.py --zones 4 --cycles 10 --speed 60 --json bench_timing.json
+'''
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import yaml
+
+from hardware_aeroGreenHouse import simBackend, virtualClock
+from helper_aeroGreenHouse import aeroHelper
+
+
+
+def percentiles(values, ps=(50, 90, 99)):
+    '''
+    Nearest-rank percentiles, mean and max of <values>
+    '''
+    if not values:
+        return None
+    v = sorted(values)
+    out = {f'p{p}': v[min(len(v) - 1, max(0, int(round(p / 100 * len(v))) - 1))] for p in ps}
+    out['mean'] = sum(v) / len(v)
+    out['max'] = v[-1]
+    out['min'] = v[0]
+    return out
+
+
+def zone_cycles(events, zone, t0):
+    '''
+    Per-cycle start latency, on-time error and drift of <zone> from the recorded events
+
+    :param events: [(time, pin, value)] recorded by simBackend, value False = pump ON
+    :param zone: gpio_pins entry of the zone
+    :param t0: clock time at which the zone was scheduled
+    '''
+    interval = zone['interval']*60
+    starts, durations, t_on = [], [], None
+    for t, pin, value in events:
+        if pin != zone['pin']:
+            continue
+        if value is False and t_on is None:
+            t_on = t
+        elif value is True and t_on is not None:
+            starts.append(t_on)
+            durations.append(t - t_on)
+            t_on = None
+
+    return {
+        'start_latency': [s - (t0 + (k + 1) * interval) for k, s in enumerate(starts)],
+        'on_time_error': [d - zone['on_time'] for d in durations],
+        'drift': [s - (starts[0] + k * interval) for k, s in enumerate(starts)],
+    }
+
+
+def make_helper(gpio_pins, backend, config_file='config.yaml', pool_size=None, runtime=None):
+    '''
+    aeroHelper on <backend> with the base config, a temporary log directory and <gpio_pins>
+    '''
+    with open(config_file, 'r') as f:
+        configs = yaml.safe_load(f)
+
+    tmp_dir = tempfile.mkdtemp(prefix='aero_bench_')
+    configs['log'] = {'directory': tmp_dir, 'filename': 'bench.log', 'level': 'WARNING'}
+    configs['gpio_pins'] = gpio_pins
+    configs['journal'] = dict(configs.get('journal', {}), directory=tmp_dir)
+    if pool_size is not None:
+        configs.setdefault('worker_pool', {})['size'] = pool_size
+    if runtime is not None:
+        configs.setdefault('controller', {})['runtime'] = runtime
+
+    bench_config = os.path.join(tmp_dir, 'config.yaml')
+    with open(bench_config, 'w') as f:
+        yaml.dump(configs, f)
+
+    return aeroHelper(bench_config, backend=backend)
+
+
+def run(zones=4, cycles=10, interval=1, on_time=3, speed=60.0, pool_size=None, config_file='config.yaml', runtime=None):
+    '''
+    Run the benchmark and return the report dictionary
+
+    :param zones: number of concurrent aeroponics zones
+    :param cycles: number of firings per zone
+    :param interval: (min), zone interval
+    :param on_time: (s), zone on_time
+    :param speed: virtual clock speed (virtual seconds per real second)
+    :param pool_size: worker pool size (default: the one in the config)
+    :param runtime: controller runtime, threads or asyncio (default: the one in the config)
+    '''
+    gpio_pins = [{'name': f'ZONE_{i}', 'pin': 100 + i, 'what_type': 'pump', 'mode': 'aeroponics',
+                  'interval': interval, 'on_time': on_time} for i in range(zones)]
+
+    backend = simBackend(virtualClock(speed), record=True)
+    ah = make_helper(gpio_pins, backend, config_file, pool_size, runtime)
+
+    t0 = ah.clock.monotonic()
+    ah.activate_zones()
+
+    real_start = time.perf_counter()
+    ah.clock.sleep(cycles * interval * 60 + on_time + 1)
+    real_elapsed = time.perf_counter() - real_start
+    runtime_stats = ah.pool.stats() if ah.controller is None else {
+        'cycles': sum(z['cycles'] for z in ah.controller.stats().values()),
+        'missed': sum(z['missed'] for z in ah.controller.stats().values()),
+        'threads': 1,
+    }
+    ah.cleanup_gpios()
+
+    events = list(backend.events)
+    keys = ('start_latency', 'on_time_error', 'drift')
+    cycles_by_zone = {z['name']: zone_cycles(events, z, t0) for z in gpio_pins}
+
+    per_zone = {}
+    for name, c in cycles_by_zone.items():
+        per_zone[name] = {key: percentiles(c[key]) for key in keys}
+        per_zone[name]['cycles'] = len(c['drift'])
+        per_zone[name]['final_drift'] = c['drift'][-1] if c['drift'] else None
+
+    return {
+        'meta': {
+            'benchmark': 'actuation_timing',
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'zones': zones, 'cycles': cycles, 'interval_min': interval, 'on_time_s': on_time,
+            'speed': speed, 'real_elapsed_s': real_elapsed, 'runtime': ah.runtime,
+        },
+        'overall': {key: percentiles([v for c in cycles_by_zone.values() for v in c[key]]) for key in keys},
+        'zones': per_zone,
+        'pool': runtime_stats,
+    }
+
+
+def compare(report, baseline, tolerance=0.05):
+    '''
+    Compare the overall p99 (absolute) of <report> with a previous <baseline> report.
+    Returns the list of regressions (metric, baseline, current) larger than <tolerance> seconds.
+    '''
+    regressions = []
+    for key, stats in report['overall'].items():
+        base = baseline.get('overall', {}).get(key)
+        if stats is None or base is None:
+            continue
+        current, previous = abs(stats['p99']), abs(base['p99'])
+        if current > previous + tolerance:
+            regressions.append((key, previous, current))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='AeroGreenHouse actuation timing benchmark')
+    parser.add_argument('--zones', type=int, default=4, help='concurrent aeroponics zones')
+    parser.add_argument('--cycles', type=int, default=10, help='firings per zone')
+    parser.add_argument('--interval', type=float, default=1, help='zone interval (min)')
+    parser.add_argument('--on-time', type=float, default=3, help='zone on_time (s)')
+    parser.add_argument('--speed', type=float, default=60.0, help='virtual clock speed')
+    parser.add_argument('--pool-size', type=int, default=None, help='worker pool size')
+    parser.add_argument('--runtime', choices=('threads', 'asyncio'), default=None, help='controller runtime')
+    parser.add_argument('--config', default='config.yaml', help='base configuration file')
+    parser.add_argument('--json', default=None, help='write the report to this JSON file')
+    parser.add_argument('--baseline', default=None, help='previous JSON report to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.05, help='allowed p99 regression (s)')
+    args = parser.parse_args(argv)
+
+    report = run(args.zones, args.cycles, args.interval, args.on_time, args.speed, args.pool_size, args.config, args.runtime)
+
+    for key, stats in report['overall'].items():
+        if stats is None:
+            print(f'{key:15s} no cycles recorded')
+            continue
+        print(f"{key:15s} p50={stats['p50']:+.4f}s p90={stats['p90']:+.4f}s p99={stats['p99']:+.4f}s max={stats['max']:+.4f}s")
+    print(f"pool: {report['pool']}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'Report written to {args.json}')
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for key, previous, current in regressions:
+            print(f'REGRESSION {key}: |p99| {previous:.4f}s -> {current:.4f}s')
+        if regressions:
+            sys.exit(1)
+    return report
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,247 @@
+'''
+Live reload of config.yaml.
+
+configWatcher checks the file every config_reload_interval seconds on its own thread:
+a stat (mtime + size) first, then a SHA-256 of the content, so an unchanged file costs
+a single stat and a touched-but-identical file is never parsed. A new content is parsed
+and validated on the watcher thread and handed to the callback only if it is valid;
+an invalid file is logged and the running configuration is kept.
+'''
+
+import os
+import hashlib
+import threading
+import logging
+
+from pool_aeroGreenHouse import aeroWorkerPool
+from zones_aeroGreenHouse import zoneRegistry
+
+
+
+WHAT_TYPES = ('pump', 'sensor')
+CUTOFFS = ('edge', 'poll')
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def load_yaml(data):
+    '''
+    Parse a YAML document (str, bytes or open file) with the libyaml C loader when
+    PyYAML was built with it (about 10x faster than the pure-Python one)
+    '''
+    import yaml
+    return yaml.load(data, Loader=getattr(yaml, 'CSafeLoader', yaml.SafeLoader))
+
+
+def validate_config(configs):
+    '''
+    Check the structure and the values of a parsed configuration.
+    Raises ValueError with the list of all the problems found.
+    '''
+    if not isinstance(configs, dict):
+        raise ValueError('the configuration must be a mapping')
+
+    errors = []
+    gpio_pins = configs.get('gpio_pins')
+    if not isinstance(gpio_pins, list):
+        errors.append('gpio_pins must be a list')
+        gpio_pins = []
+
+    names, pins = set(), set()
+    for idx, zone in enumerate(gpio_pins):
+        if not isinstance(zone, dict):
+            errors.append(f'gpio_pins[{idx}] must be a mapping')
+            continue
+        name = zone.get('name')
+        where = f'gpio_pins[{idx}] ({name})'
+        if not isinstance(name, str) or not name:
+            errors.append(f'{where}: name is required')
+        elif name in names:
+            errors.append(f'{where}: duplicated name')
+        names.add(name)
+
+        pin = zone.get('pin')
+        if not isinstance(pin, int) or isinstance(pin, bool) or pin < 0:
+            errors.append(f'{where}: pin must be a GPIO number')
+        elif pin in pins:
+            errors.append(f'{where}: pin {pin} already used')
+        pins.add(pin)
+
+        what_type = zone.get('what_type', 'pump')
+        if what_type not in WHAT_TYPES:
+            errors.append(f'{where}: what_type must be one of {WHAT_TYPES}')
+        if what_type != 'pump':
+            continue
+
+        if not _is_number(zone.get('interval')) or zone['interval'] <= 0:
+            errors.append(f'{where}: interval must be a number > 0 (min)')
+        if not _is_number(zone.get('on_time')) or zone['on_time'] < 0:
+            errors.append(f'{where}: on_time must be a number >= 0 (s)')
+        if zone.get('overlap_policy', 'skip') not in aeroWorkerPool.POLICIES:
+            errors.append(f'{where}: overlap_policy must be one of {aeroWorkerPool.POLICIES}')
+        if zone.get('cutoff', 'poll') not in CUTOFFS:
+            errors.append(f'{where}: cutoff must be one of {CUTOFFS}')
+        if not _is_number(zone.get('poll_interval', 1.0)) or zone.get('poll_interval', 1.0) <= 0:
+            errors.append(f'{where}: poll_interval must be a number > 0 (s)')
+        debounce_ms = zone.get('debounce_ms', 20)
+        if not _is_number(debounce_ms) or debounce_ms != int(debounce_ms) or debounce_ms <= 0:
+            errors.append(f'{where}: debounce_ms must be an integer > 0 (ms)') # RPi.GPIO bouncetime
+
+    if not errors:
+        try:
+            zoneRegistry(gpio_pins) # modes and pump -> sensor references
+        except ValueError as error:
+            errors.append(str(error))
+
+    T_var = configs.get('T_var', {})
+    if not isinstance(T_var, dict):
+        errors.append('T_var must be a mapping')
+        T_var = {}
+    for key, default in (('Topt', 18.0), ('gain', 1.0), ('min_factor', 0.5), ('max_factor', 1.5), ('max_age', 300)):
+        if not _is_number(T_var.get(key, default)):
+            errors.append(f'T_var.{key} must be a number')
+    min_factor, max_factor = T_var.get('min_factor', 0.5), T_var.get('max_factor', 1.5)
+    if _is_number(min_factor) and _is_number(max_factor) and not 0 < min_factor <= max_factor:
+        errors.append('T_var: 0 < min_factor <= max_factor is required')
+
+    journal = configs.get('journal', {})
+    if not isinstance(journal, dict):
+        errors.append('journal must be a mapping')
+    elif not isinstance(journal.get('compact_every', 1000), int) or journal.get('compact_every', 1000) <= 0:
+        errors.append('journal.compact_every must be an integer > 0')
+
+    reload_interval = configs.get('config_reload_interval', 4)
+    if not _is_number(reload_interval) or reload_interval < 0:
+        errors.append('config_reload_interval must be a number >= 0 (s)')
+
+    if errors:
+        raise ValueError('; '.join(errors))
+    return configs
+
+
+def diff_zones(old_pins, new_pins):
+    '''
+    Per-entry diff of two gpio_pins lists, matched by name.
+    Returns a dictionary of name lists: added, removed, changed, unchanged.
+    '''
+    old = {z['name']: z for z in old_pins or []}
+    new = {z['name']: z for z in new_pins or []}
+    return {
+        'added': [name for name in new if name not in old],
+        'removed': [name for name in old if name not in new],
+        'changed': [name for name in new if name in old and new[name] != old[name]],
+        'unchanged': [name for name in new if name in old and new[name] == old[name]],
+    }
+
+
+
+class configWatcher():
+
+    '''
+    Thread watching a YAML configuration file, see the module docstring
+    '''
+
+    def __init__(self, path, on_change, interval=4.0, logger=None):
+        '''
+        :param path: configuration file (config.yaml)
+        :param on_change: function called with the new, validated configuration
+        :param interval: (s), period of the check
+        :param logger: logger of the reload errors (default: module logger)
+        '''
+        self.path = path
+        self.on_change = on_change
+        self.interval = interval
+        self.logger = logger or logging.getLogger(__name__)
+
+        self.reloads = 0
+        self.errors = 0
+        self._stat = self._stat_key()
+        self._digest = self._hash()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run, name='configWatcher', daemon=True)
+            self._thread.start()
+
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+
+
+    def wake(self):
+        '''
+        Check the file now instead of at the next period (e.g. after saving it)
+        '''
+        self._wake.set()
+
+
+    def run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if not self._stop.is_set():
+                self.check()
+
+
+    def check(self):
+        '''
+        Reload the file if its content changed. Returns True if a new configuration was applied.
+        '''
+        stat = self._stat_key()
+        if stat == self._stat or stat is None:
+            return False
+        self._stat = stat
+
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return False
+        digest = hashlib.sha256(data).hexdigest()
+        if digest == self._digest:
+            return False # touched, same content
+        self._digest = digest
+
+        import yaml
+        try:
+            configs = validate_config(load_yaml(data))
+        except (ValueError, yaml.YAMLError) as error:
+            # e.g. a file being written: retried as soon as its content changes again
+            self.errors += 1
+            self.logger.error(f'CONFIG: {self.path} not applied, keeping the running configuration ({error})')
+            return False
+
+        try:
+            self.on_change(configs)
+        except Exception:
+            self.errors += 1
+            self.logger.exception(f'CONFIG: error applying {self.path}')
+            return False
+        self.reloads += 1
+        return True
+
+
+    def _stat_key(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+
+    def _hash(self):
+        try:
+            with open(self.path, 'rb') as f:
+                return hashlib.sha256(f.read()).hexdigest()
+        except OSError:
+            return None
@@ -0,0 +1,367 @@
+'''
+asyncio runtime of the zone controllers (controller: runtime: asyncio in the config).
+
+A single event loop thread runs one task per active zone. A zone task sleeps until its
+deadline and awaits the irrigation cycle, itself a coroutine: the pump on-time, the
+water-level polling and the sensor edge are all awaited, so hundreds of zones cost no
+extra threads and a zone can be stopped at any point of its cycle. Cancelling a zone
+task always drives its pump pin to OFF (GPIO high, active low) before returning.
+
+The GPIO calls (RPi.GPIO output/input) are single register writes/reads and are made
+directly from the loop thread; the sensor edge callbacks run on the GPIO thread and
+hand over to the loop with call_soon_threadsafe.
+'''
+
+import asyncio
+import threading
+import logging
+import concurrent.futures
+
+from hardware_aeroGreenHouse import realClock
+from logqueue_aeroGreenHouse import ACTUATION
+from metrics_aeroGreenHouse import PUMP_CYCLES, PUMP_ON_SECONDS, PUMP_ON_ERROR, SCHEDULER_LATENESS
+
+
+
+class asyncZone():
+
+    '''
+    State of a zone run by asyncController
+    '''
+
+    def __init__(self, name, interval, cycle, kwargs, policy, deadline, pins):
+        self.name = name
+        self.interval = interval # (s)
+        self.cycle = cycle # coroutine function of one irrigation cycle
+        self.kwargs = kwargs
+        self.policy = policy
+        self.deadline = deadline # clock monotonic time of the next cycle
+        self.pins = pins # pump pins, driven OFF when the zone is stopped
+        self.task = None
+        self.changed = None # asyncio.Event, set when interval/cycle are updated
+        self.running = False # cycle in progress
+        self.cycles = 0
+        self.missed = 0
+        self.failed = 0
+
+
+
+class asyncController():
+
+    '''
+    Single-thread asyncio controller of the zones, see the module docstring.
+    Same job description as aeroScheduler.update_jobs, with the cycle coroutine in place
+    of the pool runner.
+    '''
+
+    def __init__(self, gpios, clock=None, logger=None, adapt_on_time=None):
+        '''
+        :param gpios: hardware backend (piBackend / simBackend)
+        :param clock: clock of the backend (virtual clocks are supported through clock.speed)
+        :param logger: logger of the cycles (default: module logger)
+        :param adapt_on_time: function (zone, on_time) -> effective on_time of the aeroponics
+                              cycles with a zone (must not block, see aeroHelper.adaptive_on_time)
+        '''
+        self.gpios = gpios
+        self.clock = clock or realClock()
+        self.logger = logger or logging.getLogger(__name__)
+        self.adapt_on_time = adapt_on_time
+
+        self.zones = {} # {name: asyncZone}, only touched by the loop thread
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run_loop, name='aeroController', daemon=True)
+        self._thread.start()
+        self._closed = False
+
+
+    ###########################################
+    # API (any thread)
+    ###########################################
+
+    def update_jobs(self, remove=(), add=(), timeout=5.0, first_delay=None):
+        '''
+        Stop and add/replace several zones in one step of the loop.
+        A replaced zone keeps its phase (same rule as aeroScheduler.update_jobs) and a
+        cycle in progress is completed with the old parameters.
+
+        :param remove: names of the zones to stop (their pins are driven OFF)
+        :param add: (name, interval, cycle, kwargs, policy, pins) of the zones to start or update
+        :param first_delay: {name: (s)}, delay of the first cycle of the new zones (default: interval)
+        '''
+        for name, interval, *_ in add:
+            if interval <= 0:
+                raise ValueError(f'Job {name}: interval must be > 0, got {interval}')
+        return self._call(self._update(list(remove), list(add), dict(first_delay or {})), timeout)
+
+
+    def stop_zone(self, name, timeout=5.0):
+        '''
+        Cancel the zone <name> immediately, also in the middle of a cycle
+        '''
+        return self.update_jobs(remove=[name], timeout=timeout)
+
+
+    def has_job(self, name):
+        return name in self.zones
+
+
+    def next_deadline(self, name):
+        zone = self.zones.get(name)
+        return None if zone is None else zone.deadline
+
+
+    def interval(self, name):
+        zone = self.zones.get(name)
+        return None if zone is None else zone.interval
+
+
+    def set_interval(self, name, interval):
+        '''
+        Change the interval of the zone <name> keeping its phase (also from the loop thread)
+        '''
+        if threading.current_thread() is self._thread:
+            self._set_interval(name, interval)
+        else:
+            self.loop.call_soon_threadsafe(self._set_interval, name, interval)
+
+
+    def _set_interval(self, name, interval):
+        zone = self.zones.get(name)
+        if zone is None or interval <= 0:
+            return
+        zone.deadline = max(zone.deadline - zone.interval + interval, self.clock.monotonic())
+        zone.interval = interval
+        zone.changed.set()
+
+
+    def stats(self):
+        '''
+        {name: {running, cycles, missed, failed, next_deadline}} of the active zones
+        '''
+        return {name: {'running': z.running, 'cycles': z.cycles, 'missed': z.missed,
+                       'failed': z.failed, 'next_deadline': z.deadline}
+                for name, z in list(self.zones.items())}
+
+
+    def shutdown(self, timeout=5.0):
+        '''
+        Cancel all the zones (pins OFF) and stop the loop thread
+        '''
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._call(self._update(list(self.zones), []), timeout)
+        finally:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            if self._thread is not threading.current_thread():
+                self._thread.join(timeout)
+
+
+    def join(self):
+        '''
+        Block the caller until the loop thread is stopped
+        '''
+        self._thread.join()
+
+
+    ###########################################
+    # Loop thread
+    ###########################################
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+        self.loop.close()
+
+
+    def _call(self, coro, timeout):
+        if threading.current_thread() is self._thread:
+            raise RuntimeError('asyncController API called from the loop thread, await the coroutine instead')
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            self.logger.error('Controller: the event loop did not answer in time')
+            raise
+
+
+    async def _update(self, remove, add, first_delay=None):
+        now = self.clock.monotonic()
+        stopping = []
+        for name in remove:
+            zone = self.zones.pop(name, None)
+            if zone is not None:
+                zone.task.cancel()
+                stopping.append(zone.task)
+
+        for name, interval, cycle, kwargs, policy, pins in add:
+            zone = self.zones.get(name)
+            if zone is None:
+                deadline = now + max((first_delay or {}).get(name, interval), 0)
+                zone = asyncZone(name, interval, cycle, kwargs, policy, deadline, tuple(pins))
+                zone.changed = asyncio.Event()
+                zone.task = self.loop.create_task(self._zone_loop(zone), name=f'zone {name}')
+                self.zones[name] = zone
+                continue
+
+            if interval != zone.interval:
+                zone.deadline = max(zone.deadline - zone.interval + interval, now)
+            if tuple(pins) != zone.pins and not zone.running:
+                self._all_off(zone.pins)
+            zone.interval, zone.cycle, zone.kwargs, zone.policy, zone.pins = interval, cycle, kwargs, policy, tuple(pins)
+            zone.changed.set()
+
+        if stopping:
+            await asyncio.gather(*stopping, return_exceptions=True)
+        return len(stopping)
+
+
+    async def _zone_loop(self, zone):
+        try:
+            while True:
+                delay = zone.deadline - self.clock.monotonic()
+                if delay > 0:
+                    zone.changed.clear()
+                    try:
+                        await asyncio.wait_for(zone.changed.wait(), delay / self.clock.speed)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue # deadline reached or zone updated: check again
+
+                SCHEDULER_LATENESS.observe(self.clock.monotonic() - zone.deadline)
+                zone.running = True
+                try:
+                    await zone.cycle(**zone.kwargs)
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    zone.failed += 1
+                    self.logger.exception(f'Controller: cycle of {zone.name} failed')
+                finally:
+                    zone.running = False
+                    zone.cycles += 1
+
+                zone.deadline += zone.interval # anchored, no drift
+                now = self.clock.monotonic()
+                if zone.deadline <= now:
+                    missed = int((now - zone.deadline) // zone.interval) + 1
+                    if zone.policy == 'skip':
+                        zone.deadline += missed * zone.interval # stay on the original phase
+                        zone.missed += missed
+                        self.logger.warning(f'Controller: {zone.name} is behind, {missed} cycles skipped')
+                    else:
+                        zone.deadline = now # coalesce / queue: one catch-up cycle right away
+                        zone.missed += missed - 1
+        finally:
+            self._all_off(zone.pins) # safe state, whatever interrupted the zone
+
+
+    def _all_off(self, pins):
+        for pin in pins:
+            try:
+                self.gpios.output(pin, True)
+            except Exception:
+                self.logger.exception(f'Controller: could not turn OFF pin {pin}')
+
+
+    async def _sleep(self, seconds, event=None):
+        '''
+        Sleep <seconds> of the backend clock, or until <event> is set. True if the event was set.
+        '''
+        timeout = max(seconds, 0) / self.clock.speed
+        if event is None:
+            await asyncio.sleep(timeout)
+            return False
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return event.is_set()
+
+
+    ###########################################
+    # Irrigation cycles
+    ###########################################
+
+    async def aeroponics_cycle(self, gpio, irrigation_time, zone=None):
+        '''
+        Pump ON for <irrigation_time> seconds (monotonic deadline), OFF also if cancelled.
+        With a <zone> the time is first adapted by adapt_on_time.
+        '''
+        if zone is not None and self.adapt_on_time is not None:
+            irrigation_time = self.adapt_on_time(zone, irrigation_time)
+        t_on = self.clock.monotonic()
+        deadline = t_on + irrigation_time
+        end = 'cancelled'
+        try:
+            self.gpios.output(gpio, False) #turning on pump
+            self.logger.info(f'AEROPONICS: Turning on the pump (zone {zone}, pin {gpio})', extra=ACTUATION)
+            await self._sleep(deadline - self.clock.monotonic())
+            end = 'time'
+        finally:
+            self.gpios.output(gpio, True) #turning off the pump
+            on_time = self.clock.monotonic() - t_on
+            self.logger.info(f'AEROPONICS: Turning off the pump (zone {zone}, pin {gpio})', extra=ACTUATION)
+            PUMP_CYCLES.labels('aeroponics', gpio, end).inc()
+            PUMP_ON_SECONDS.labels('aeroponics', gpio).observe(on_time)
+            if end == 'time':
+                PUMP_ON_ERROR.labels(gpio).observe(on_time - irrigation_time)
+
+
+    async def idroponics_cycle(self, gpio_pump, gpio_sensor, max_irrigation_time, poll_interval=1.0,
+                               edge_detect=False, debounce_ms=20, zone=None):
+        '''
+        Pump ON until the level sensor reports high water or <max_irrigation_time> expires.
+        The falling edge of the sensor cuts the pump directly in the GPIO callback and wakes
+        the cycle; polling every <poll_interval> seconds stays as a fallback.
+        '''
+        cutoff = asyncio.Event()
+        water_high = threading.Event() # set by the GPIO thread, seen before the loop is woken up
+        pump_lock = threading.Lock() # the loop never turns the pump back on after the cutoff
+
+        def on_water_high(channel):
+            with pump_lock:
+                self.gpios.output(gpio_pump, True)
+                water_high.set()
+            self.loop.call_soon_threadsafe(cutoff.set)
+
+        if edge_detect:
+            try:
+                self.gpios.add_event_detect(gpio_sensor, self.gpios.FALLING, callback=on_water_high, bouncetime=debounce_ms)
+            except (RuntimeError, AttributeError, ValueError) as error:
+                self.logger.warning(f'IDROPONICS: edge detection not available ({error}), polling the water level')
+                edge_detect = False
+
+        deadline = self.clock.monotonic() + max_irrigation_time
+        t_on = None # first pump ON of the cycle
+        end = 'cancelled'
+        try:
+            while True:
+                remaining = deadline - self.clock.monotonic()
+                if remaining <= 0:
+                    self.logger.info(f"IDROPONICS: Maximum time reached. Turning OFF the pump (zone {zone}, pin {gpio_pump})",
+                                     extra=ACTUATION)
+                    end = 'time'
+                    break
+                if water_high.is_set() or self.gpios.input(gpio_sensor) == 0:
+                    self.logger.info(f'IDROPONICS: Water level high. pump OFF (zone {zone}, pin {gpio_pump})', extra=ACTUATION)
+                    end = 'water_high'
+                    break
+                with pump_lock:
+                    if water_high.is_set():
+                        continue
+                    self.gpios.output(gpio_pump, False) #turning on pump
+                first = t_on is None
+                if first:
+                    t_on = self.clock.monotonic()
+                # only the first ON of the cycle is an actuation, the repetitions of every poll are rate limited
+                self.logger.info(f'IDROPONICS: Water level low, pump ON (zone {zone}, pin {gpio_pump})',
+                                 extra=ACTUATION if first else None)
+                await self._sleep(min(poll_interval, remaining), cutoff)
+        finally:
+            self.gpios.output(gpio_pump, True)
+            if edge_detect:
+                self.gpios.remove_event_detect(gpio_sensor)
+            PUMP_CYCLES.labels('idroponics', gpio_pump, end).inc()
+            PUMP_ON_SECONDS.labels('idroponics', gpio_pump).observe(0.0 if t_on is None else self.clock.monotonic() - t_on)
@@ -0,0 +1,372 @@
+'''
+Headless control daemon: the aeroHelper (zones, GPIO, ambient readings) served on a
+local Unix socket, so the GUI and other tools are only clients and closing them never
+stops the irrigation.
+
+Protocol: one JSON object per line in each direction.
+    -> {"cmd": "start_zone", "name": "AEROPONICS"}
+    <- {"ok": true, "result": ...}        or        {"ok": false, "error": "..."}
+
+Commands:
+    ping                            "pong"
+    status                          state (initializing / ready), runtime, zones (active, next cycle),
+                                    ambient, latest TH
+    start_zone / stop_zone  name    activate / deactivate a zone
+    th              fresh=False     latest ambient reading (fresh=True reads the sensor now)
+    log             since=None, limit=500
+                                    log lines after the sequence number <since>
+    ambient_start / ambient_stop    periodic ambient reading
+    reload_config                   check config.yaml now
+'''
+
+import os
+import json
+import time
+import socket
+import socketserver
+import threading
+import logging
+from collections import deque
+
+
+
+DEFAULT_SOCKET = '/tmp/aeroGreenHouse.sock'
+
+
+def socket_path(configs):
+    return configs.get('daemon', {}).get('socket', DEFAULT_SOCKET)
+
+
+
+class logRingHandler(logging.Handler):
+
+    '''
+    Last <capacity> formatted log lines with a sequence number, for the log command
+    '''
+
+    def __init__(self, capacity=2000):
+        super().__init__()
+        self.lines = deque(maxlen=capacity) # (seq, line, level)
+        self.seq = 0
+
+    def emit(self, record):
+        try:
+            msg = self.format(record)
+            # emit is called with the handler lock held (see logging.Handler.handle)
+            self.seq += 1
+            self.lines.append((self.seq, msg, record.levelname))
+        except Exception:
+            self.handleError(record)
+
+    def since(self, seq=None, limit=500):
+        '''
+        (last sequence number, [(seq, line, level)] after <seq>), at most <limit> lines
+        '''
+        self.acquire()
+        try:
+            last = self.seq
+            if seq is None:
+                items = list(self.lines)[-limit:]
+            else:
+                items = [item for item in self.lines if item[0] > seq][:limit]
+        finally:
+            self.release()
+        return last, items
+
+
+
+class _requestHandler(socketserver.StreamRequestHandler):
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections.add(self.connection)
+
+    def finish(self):
+        with self.server.lock:
+            self.server.connections.discard(self.connection)
+        super().finish()
+
+    def handle(self):
+        for raw in self.rfile:
+            try:
+                request = json.loads(raw)
+                result = self.server.api.dispatch(request)
+                reply = {'ok': True, 'result': result}
+            except Exception as error:
+                reply = {'ok': False, 'error': f'{type(error).__name__}: {error}'}
+            self.wfile.write(json.dumps(reply).encode() + b'\n')
+            self.wfile.flush()
+
+
+
+class _unixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, handler):
+        self.connections = set() # open client connections, closed by aeroDaemon.stop
+        self.lock = threading.Lock()
+        super().__init__(path, handler)
+
+
+
+class aeroDaemon():
+
+    '''
+    Unix-socket JSON API of an aeroHelper, see the module docstring
+    '''
+
+    def __init__(self, helper, path=None, log_capacity=None):
+        '''
+        :param helper: aeroHelper controlling the hardware
+        :param path: socket path (default: daemon socket in the config)
+        :param log_capacity: log lines kept for the log command (default: log gui_buffer in the config)
+        '''
+        self.ah = helper
+        self.path = path or socket_path(helper.configs)
+        self.started = time.time()
+
+        self.log_handler = logRingHandler(log_capacity or helper.configs.get('log', {}).get('gui_buffer', 2000))
+        self.log_handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
+        self.ah.add_log_handler(self.log_handler)
+
+        self.ambient_stop = threading.Event()
+        self.ambient_thread = None
+
+        self.server = None
+        self._thread = None
+
+
+    def start(self):
+        '''
+        Serve the API on a background thread
+        '''
+        if os.path.exists(self.path):
+            os.unlink(self.path) # stale socket of a previous run
+        self.server = _unixServer(self.path, _requestHandler)
+        self.server.api = self
+        os.chmod(self.path, 0o660)
+        self._thread = threading.Thread(target=self.server.serve_forever, name='aeroDaemon', daemon=True)
+        self._thread.start()
+        self.ah.logger.info(f'DAEMON: listening on {self.path}')
+
+
+    def stop(self):
+        self.stop_ambient()
+        if self.server is not None:
+            self.server.shutdown()
+            with self.server.lock:
+                for conn in self.server.connections:
+                    try:
+                        conn.shutdown(socket.SHUT_RDWR)
+                    except OSError:
+                        pass
+            self.server.server_close()
+            self.server = None
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+
+    def dispatch(self, request):
+        cmd = request.get('cmd')
+        handler = getattr(self, f'cmd_{cmd}', None)
+        if handler is None:
+            raise ValueError(f'unknown command {cmd}')
+        args = {k: v for k, v in request.items() if k != 'cmd'}
+        return handler(**args)
+
+
+    ###########################################
+    # Ambient reading
+    ###########################################
+
+    def start_ambient(self):
+        if self.ambient_thread is not None and self.ambient_thread.is_alive():
+            return False
+        self.ambient_stop = threading.Event()
+        self.ambient_thread = threading.Thread(target=self.ah.ambient_loop, args=(self.ambient_stop,),
+                                               name='ambient', daemon=True)
+        self.ambient_thread.start()
+        return True
+
+
+    def stop_ambient(self):
+        if self.ambient_thread is None or not self.ambient_thread.is_alive():
+            return False
+        self.ambient_stop.set() # the loop wakes up at once and flushes the TH file
+        return True
+
+
+    def ambient_active(self):
+        return self.ambient_thread is not None and self.ambient_thread.is_alive()
+
+
+    ###########################################
+    # Commands
+    ###########################################
+
+    def cmd_ping(self):
+        return 'pong'
+
+
+    def cmd_status(self):
+        if not self.ah.hardware_ready.is_set():
+            return {'state': 'initializing', 'runtime': self.ah.runtime, 'uptime': time.time() - self.started,
+                    'zones': [], 'ambient': False, 'th': None}
+        runtime = self.ah.controller if self.ah.controller is not None else self.ah.scheduler
+        now = self.ah.clock.monotonic()
+        zones = []
+        for name in self.ah.zones.names():
+            zone = self.ah.zones.get(name)
+            deadline = runtime.next_deadline(name)
+            zones.append({'name': name, 'mode': self.ah.zones.mode(name), 'pin': zone['pin'],
+                          'interval': zone['interval'], 'on_time': zone['on_time'],
+                          'active': self.ah.is_zone_active(name),
+                          'next_in': None if deadline is None else max(deadline - now, 0.0)})
+        return {'state': 'ready', 'runtime': self.ah.runtime, 'uptime': time.time() - self.started, 'zones': zones,
+                'ambient': self.ambient_active(), 'th': self.cmd_th()}
+
+
+    def cmd_start_zone(self, name):
+        if name not in self.ah.zones:
+            raise KeyError(f'unknown zone {name}')
+        if self.ah.is_zone_active(name):
+            return False
+        self.ah.activate_zone(name)
+        return True
+
+
+    def cmd_stop_zone(self, name):
+        if not self.ah.is_zone_active(name):
+            return False
+        self.ah.deactivate_zone(name)
+        return True
+
+
+    def cmd_th(self, fresh=False):
+        if fresh:
+            self.ah.read_ambient(save=False)
+        if self.ah.last_ambient is None:
+            return None
+        when, T, H, vpd = self.ah.last_ambient
+        return {'time': when.isoformat(sep=' ', timespec='seconds'), 'T': T, 'H': H, 'VPD': vpd}
+
+
+    def cmd_log(self, since=None, limit=500):
+        last, items = self.log_handler.since(since, limit)
+        return {'last': last, 'lines': [[line, level] for _, line, level in items]}
+
+
+    def cmd_ambient_start(self):
+        return self.start_ambient()
+
+
+    def cmd_ambient_stop(self):
+        return self.stop_ambient()
+
+
+    def cmd_reload_config(self):
+        if self.ah.config_watcher is None:
+            return False
+        self.ah.config_watcher.wake()
+        return True
+
+
+
+class aeroClientError(RuntimeError):
+    '''
+    Error returned by the daemon for a request
+    '''
+
+
+
+class aeroClient():
+
+    '''
+    Client of the daemon API. Each call is a blocking request/response on a persistent
+    connection (reopened if the daemon restarts): call it off the GUI thread.
+    '''
+
+    def __init__(self, path=DEFAULT_SOCKET, timeout=10.0):
+        self.path = path
+        self.timeout = timeout
+        self._sock = None
+        self._rfile = None
+        self._lock = threading.Lock()
+
+
+    def call(self, cmd, **args):
+        request = json.dumps(dict(args, cmd=cmd)).encode() + b'\n'
+        with self._lock:
+            for attempt in (0, 1):
+                try:
+                    if self._sock is None:
+                        self._connect()
+                    self._sock.sendall(request)
+                except OSError:
+                    # stale connection (daemon restarted) or daemon down: one new connection
+                    self.close()
+                    if attempt:
+                        raise
+                    continue
+                # the request is on the wire: never sent again (start_zone, reload_config... are not idempotent)
+                try:
+                    raw = self._rfile.readline()
+                except OSError:
+                    self.close()
+                    raise
+                if not raw:
+                    self.close()
+                    raise ConnectionError('connection closed by the daemon')
+                break
+        reply = json.loads(raw)
+        if not reply.get('ok'):
+            raise aeroClientError(reply.get('error'))
+        return reply.get('result')
+
+
+    def close(self):
+        if self._sock is not None:
+            try:
+                self._rfile.close()
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = None
+        self._rfile = None
+
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.path)
+        self._sock = sock
+        self._rfile = sock.makefile('rb')
+
+
+    def ping(self):
+        return self.call('ping')
+
+    def status(self):
+        return self.call('status')
+
+    def start_zone(self, name):
+        return self.call('start_zone', name=name)
+
+    def stop_zone(self, name):
+        return self.call('stop_zone', name=name)
+
+    def th(self, fresh=False):
+        return self.call('th', fresh=fresh)
+
+    def log(self, since=None, limit=500):
+        return self.call('log', since=since, limit=limit)
+
+    def ambient_start(self):
+        return self.call('ambient_start')
+
+    def ambient_stop(self):
+        return self.call('ambient_stop')
+
+    def reload_config(self):
+        return self.call('reload_config')
@@ -1,30 +1,14 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
-import yaml
 import json
 import os
 import sys
 from pathlib import Path
-from helper_aeroGreenHouse import aeroHelper
-import schedule
-import threading
-from time import sleep
-import logging
-from queue import Queue
-
-
-class GUILoggingHandler(logging.Handler):
-    """Custom logging handler that sends log records to a GUI text widget queue"""
-    def __init__(self, log_queue):
-        super().__init__()
-        self.log_queue = log_queue
-    
-    def emit(self, record):
-        try:
-            msg = self.format(record)
-            self.log_queue.put((msg, record.levelname))
-        except Exception:
-            self.handleError(record)
+from daemon_aeroGreenHouse import aeroClient, socket_path
+from logtail_aeroGreenHouse import logTailer
+from rollup_aeroGreenHouse import rollupStore
+from trend_aeroGreenHouse import trendSource, trendChart, WINDOWS
+from concurrent.futures import ThreadPoolExecutor
 
 
 class AeroGreenHouseGUI:
@@ -35,85 +19,201 @@ class AeroGreenHouseGUI:
         
         self.config_file = 'config.yaml'
         self.config = self.load_config()
-        self.active_jobs = {}  # Per tracciare i job attivi/inattivi
-        
-        # Thread tracking for active jobs
-        self.job_threads = {}  # {job_name: thread_object}
-        self.job_stop_flags = {}  # {job_name: stop_flag}
-        self.thread_lock = threading.Lock()  # For thread-safe operations
-        
-        # Thread tracking for ambient reading
-        self.ambient_thread = None
-        self.ambient_stop_flag = False
-        
-        # Logging queue for GUI updates
-        self.log_queue = Queue()
+        self.active_jobs = {}  # Per tracciare i job attivi/inattivi (stato letto dal daemon)
+        
+        # Client of the control daemon (main.py): the calls run on a single background
+        # thread, the Tk thread never waits for the daemon or for the hardware
+        self.client = aeroClient(socket_path(self.config))
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='aeroClient')
+        self.daemon_online = None
+        self.log_seq = None # sequence number of the last log line received from the daemon
+        self.log_pending = False
+        self.log_epoch = 0 # incremented by refresh_output, older log answers are dropped
+        self.log_tailer = None # log file followed while the daemon is not reachable
+        self.status_pending = False
+        self.th_record = None # shared record of the sensor process (dht22 process), read directly
+        
+        # Maximum lines kept in the output widget
+        self.gui_max_lines = self.config.get('log', {}).get('gui_max_lines', 2000)
         
         self.create_widgets()
         self.refresh_jobs_list()
-        self.ah = aeroHelper()
-        
-        # Setup GUI logging handler
-        self.setup_gui_logging_handler()
         
-        # Start the log queue processor
+        # Start the daemon pollers (log lines and status)
         self.process_log_queue()
+        self.poll_status()
         
     def load_config(self):
-        """Carica la configurazione dal file YAML"""
+        """Carica la configurazione dal file YAML (loader C di libyaml, yaml importato solo qui)"""
+        from config_aeroGreenHouse import load_yaml
         try:
             with open(self.config_file, 'r') as f:
-                return yaml.safe_load(f)
+                return load_yaml(f) or {}
         except Exception as e:
             messagebox.showerror("Errore", f"Errore nel caricamento del config: {e}")
             return {}
     
-    def setup_gui_logging_handler(self):
-        """Setup custom logging handler to display logs in GUI"""
-        gui_handler = GUILoggingHandler(self.log_queue)
-        formatter = logging.Formatter("%(asctime)s [%(levelname)s] %(message)s")
-        gui_handler.setFormatter(formatter)
+    def call_async(self, func, *args, on_done=None, on_error=None, **kwargs):
+        """Esegue una chiamata al daemon fuori dal thread Tk; on_done/on_error sono chiamati nel thread Tk"""
+        future = self.executor.submit(func, *args, **kwargs)
         
-        # Add handler to the aeroHelper logger
-        self.ah.logger.addHandler(gui_handler)
+        def check():
+            if not future.done():
+                self.root.after(20, check)
+                return
+            error = future.exception()
+            if error is None:
+                self.set_daemon_online(True)
+                if on_done is not None:
+                    on_done(future.result())
+            else:
+                if isinstance(error, OSError):
+                    self.set_daemon_online(False)
+                if on_error is not None:
+                    on_error(error)
+        
+        self.root.after(20, check)
+        return future
     
-    def process_log_queue(self):
-        """Process log messages from queue and display in GUI text widget"""
+    def set_daemon_online(self, online):
+        """Segnala nel log della GUI quando il daemon diventa raggiungibile / non raggiungibile"""
+        if online == self.daemon_online:
+            return
+        self.daemon_online = online
+        if not online:
+            self.daemon_state_label.config(text="Daemon non raggiungibile", foreground='red')
+        if online:
+            if self.log_tailer is not None:
+                self.log_tailer.close() # di nuovo il buffer del daemon come sorgente del log
+                self.log_tailer = None
+            self.append_output([(f"Connesso al daemon ({self.client.path})", 'INFO')])
+        else:
+            self.append_output([(f"Daemon non raggiungibile su {self.client.path}: avviare main.py", 'WARNING')])
+    
+    def append_output(self, items, dropped=0):
+        """Aggiunge le righe (msg, level) al widget di output con un solo aggiornamento (level None: riga del file di log)"""
+        chunks = []
+        if dropped:
+            chunks += [f"... {dropped} messaggi di log scartati\n", 'warning']
+        for msg, level in items[-self.gui_max_lines:]:
+            chunks += [msg + '\n', self.log_line_tag(msg if level is None else f'[{level}]')]
+        if not chunks:
+            return
         try:
-            while True:
-                msg, level = self.log_queue.get_nowait()
-                # Determine tag based on log level
-                if level in ['ERROR', 'CRITICAL']:
-                    tag = 'error'
-                elif level == 'WARNING':
-                    tag = 'warning'
-                elif level == 'DEBUG':
-                    tag = 'debug'
-                else:
-                    tag = 'info'
-                
-                # Add message to output text widget
-                self.output_text.config(state=tk.NORMAL)
-                self.output_text.insert(tk.END, msg + '\n', tag)
-                self.output_text.see(tk.END)
-                self.output_text.config(state=tk.DISABLED)
-        except:
-            pass
+            self.output_text.config(state=tk.NORMAL)
+            self.output_text.insert(tk.END, *chunks)
+            self.trim_output()
+            self.output_text.see(tk.END)
+            self.output_text.config(state=tk.DISABLED)
+        except tk.TclError:
+            pass # finestra chiusa
+    
+    def process_log_queue(self):
+        """Ogni 500 ms chiede al daemon le nuove righe di log (o le legge dal file se il daemon non risponde)"""
+        self.fetch_log()
+        self.root.after(500, self.process_log_queue)
+    
+    def fetch_log(self):
+        """Chiede al daemon le righe di log dopo log_seq (una sola richiesta in volo)"""
+        epoch = self.log_epoch
+        
+        def on_done(result):
+            if epoch != self.log_epoch:
+                return
+            self.log_pending = False
+            lines = result['lines']
+            # righe perse se la GUI è rimasta indietro rispetto al buffer del daemon
+            dropped = 0
+            if self.log_seq is not None and result['last'] - self.log_seq > len(lines):
+                dropped = result['last'] - self.log_seq - len(lines)
+            self.log_seq = result['last']
+            self.append_output([tuple(item) for item in lines], dropped)
+        
+        def on_error(error):
+            if epoch != self.log_epoch:
+                return
+            if isinstance(error, OSError):
+                self.tail_log_file(epoch)
+            else:
+                self.log_pending = False
         
-        # Schedule next check
-        self.root.after(100, self.process_log_queue)
+        if not self.log_pending:
+            self.log_pending = True
+            self.call_async(self.client.log, since=self.log_seq, limit=self.gui_max_lines,
+                            on_done=on_done, on_error=on_error)
+    
+    def tail_log_file(self, epoch):
+        """Daemon non raggiungibile: segue il file di log scritto dal daemon (lettura incrementale, fuori dal thread Tk)"""
+        log_path = self.get_log_file_path()
+        if log_path is None:
+            self.log_pending = False
+            return
+        if self.log_tailer is None or self.log_tailer.path != log_path:
+            if self.log_tailer is not None:
+                self.log_tailer.close()
+            self.log_tailer = logTailer(log_path)
+            # righe già ricevute dal daemon: si seguono solo quelle nuove, altrimenti la coda del file
+            skip = self.log_seq is not None
+        else:
+            skip = False
+        future = self.executor.submit(self.log_tailer.read_new)
+        
+        def check():
+            if not future.done():
+                self.root.after(20, check)
+                return
+            if epoch != self.log_epoch:
+                return
+            self.log_pending = False
+            if future.exception() is None and not skip:
+                self.append_output([(line, None) for line in future.result() if line])
+        
+        self.root.after(20, check)
+    
+    def poll_status(self):
+        """Ogni 2 s legge lo stato dei job e l'ultima lettura ambient dal daemon"""
+        def on_done(status):
+            self.status_pending = False
+            if status.get('state') == 'initializing':
+                self.daemon_state_label.config(text="Daemon: inizializzazione hardware in corso...", foreground='#b8860b')
+            else:
+                self.daemon_state_label.config(text=f"Daemon: pronto (runtime {status.get('runtime')})", foreground='#2ca02c')
+            active = {z['name']: ('Attivo' if z['active'] else 'Inattivo') for z in status['zones']}
+            if active != self.active_jobs:
+                self.active_jobs = active
+                self.refresh_jobs_list()
+            th = self.read_th_record() or status.get('th')
+            if th:
+                self.update_ambient_labels(th)
+        
+        def on_error(error):
+            self.status_pending = False
+        
+        if not self.status_pending:
+            self.status_pending = True
+            self.call_async(self.client.status, on_done=on_done, on_error=on_error)
+        self.root.after(2000, self.poll_status)
     
     def save_config(self):
         """Salva la configurazione nel file YAML"""
+        import yaml
         try:
-            with open(self.config_file, 'w') as f:
+            # scrittura atomica: il config watcher non legge mai un file scritto a metà
+            tmp_file = self.config_file + '.tmp'
+            with open(tmp_file, 'w') as f:
                 yaml.dump(self.config, f, default_flow_style=False, sort_keys=False)
+            os.replace(tmp_file, self.config_file)
+            self.call_async(self.client.reload_config) # il daemon applica subito le modifiche ai job
             messagebox.showinfo("Successo", "Configurazione salvata!")
         except Exception as e:
             messagebox.showerror("Errore", f"Errore nel salvataggio: {e}")
     
     def create_widgets(self):
         """Crea l'interfaccia grafica"""
+        # Barra di stato del daemon (in basso)
+        self.daemon_state_label = ttk.Label(self.root, text="Daemon: connessione in corso...", foreground='gray', anchor='w')
+        self.daemon_state_label.pack(side=tk.BOTTOM, fill=tk.X, padx=10)
+        
         # Notebook (tab widget)
         notebook = ttk.Notebook(self.root)
         notebook.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
@@ -274,12 +374,9 @@ class AeroGreenHouseGUI:
         self.output_text.tag_config('error', foreground='red')
         self.output_text.tag_config('debug', foreground='gray')
         
-        # Aggiorna il label con il file log
+        # Aggiorna il label con il file log (le righe arrivano dal daemon, vedi process_log_queue)
         self.update_log_file_label()
         
-        # Carica il contenuto iniziale
-        self.refresh_output()
-        
     def refresh_jobs_list(self):
         """Aggiorna la lista dei job nel Treeview"""
         # Pulisci il treeview
@@ -303,7 +400,7 @@ class AeroGreenHouseGUI:
         """Apre una finestra per aggiungere un nuovo job"""
         add_window = tk.Toplevel(self.root)
         add_window.title("Aggiungi Nuovo Job")
-        add_window.geometry("400x300")
+        add_window.geometry("400x400")
         
         ttk.Label(add_window, text="Nome:").grid(row=0, column=0, sticky=tk.W, padx=10, pady=10)
         name_var = tk.StringVar()
@@ -321,12 +418,21 @@ class AeroGreenHouseGUI:
         on_time_var = tk.StringVar()
         ttk.Entry(add_window, textvariable=on_time_var, width=30).grid(row=3, column=1, padx=10, pady=10)
         
+        ttk.Label(add_window, text="Modalità:").grid(row=4, column=0, sticky=tk.W, padx=10, pady=10)
+        mode_var = tk.StringVar(value='aeroponics')
+        ttk.Combobox(add_window, textvariable=mode_var, values=['aeroponics', 'idroponics'],
+                     state='readonly', width=27).grid(row=4, column=1, padx=10, pady=10)
+        
+        ttk.Label(add_window, text="Sensore (idroponics):").grid(row=5, column=0, sticky=tk.W, padx=10, pady=10)
+        sensor_var = tk.StringVar()
+        ttk.Entry(add_window, textvariable=sensor_var, width=30).grid(row=5, column=1, padx=10, pady=10)
+        
         def save_job():
             try:
                 name = name_var.get().strip()
                 pin = int(pin_var.get().strip())
-                interval = int(interval_var.get().strip())
-                on_time = int(on_time_var.get().strip())
+                interval = float(interval_var.get().strip())
+                on_time = float(on_time_var.get().strip())
                 
                 if not name:
                     messagebox.showwarning("Avviso", "Inserire un nome per il job")
@@ -336,9 +442,17 @@ class AeroGreenHouseGUI:
                 new_job = {
                     'name': name,
                     'pin': pin,
+                    'what_type': 'pump',
+                    'mode': mode_var.get(),
                     'interval': interval,
                     'on_time': on_time
                 }
+                if mode_var.get() == 'idroponics':
+                    sensor = sensor_var.get().strip()
+                    if not any(g.get('name') == sensor and g.get('what_type') == 'sensor' for g in self.config['gpio_pins']):
+                        messagebox.showwarning("Avviso", "Inserire il nome di un sensore di gpio_pins")
+                        return
+                    new_job['sensor'] = sensor
                 
                 self.config['gpio_pins'].append(new_job)
                 self.save_config()
@@ -349,7 +463,7 @@ class AeroGreenHouseGUI:
             except ValueError:
                 messagebox.showerror("Errore", "Inserire valori numerici validi per pin, intervallo e on_time")
         
-        ttk.Button(add_window, text="Salva Job", command=save_job).grid(row=4, column=0, columnspan=2, pady=20)
+        ttk.Button(add_window, text="Salva Job", command=save_job).grid(row=6, column=0, columnspan=2, pady=20)
     
     def delete_job(self):
         """Elimina il job selezionato"""
@@ -402,8 +516,8 @@ class AeroGreenHouseGUI:
             try:
                 job['name'] = name_var.get().strip()
                 job['pin'] = int(pin_var.get().strip())
-                job['interval'] = int(interval_var.get().strip())
-                job['on_time'] = int(on_time_var.get().strip())
+                job['interval'] = float(interval_var.get().strip())
+                job['on_time'] = float(on_time_var.get().strip())
                 
                 self.save_config()
                 self.refresh_jobs_list()
@@ -420,7 +534,7 @@ class AeroGreenHouseGUI:
 
     
     def toggle_job_on(self):
-        """Attiva il job selezionato in un thread separato"""
+        """Attiva il job selezionato (qualsiasi zona di gpio_pins) tramite il daemon"""
         selected = self.jobs_tree.selection()
         
         if not selected:
@@ -430,81 +544,39 @@ class AeroGreenHouseGUI:
         # Get the values 
         item = selected[0]
         name = str(self.jobs_tree.item(item, 'values')[0])
-        pin = int(self.jobs_tree.item(item, 'values')[1])
-        interval = int(self.jobs_tree.item(item, 'values')[2])
-        on_time = int(self.jobs_tree.item(item, 'values')[3])
 
-        # parte di codice legata ad AEROPONICS
-        if name == 'AEROPONICS':
-            
-            # check if the job is already running
-            if self.ah.aeroponics_job_active:
+        def on_done(started):
+            if not started:
                 messagebox.showwarning("Avviso", f"Il job {name} è già in esecuzione!")
-                return
-            
-            self.ah.aeroponics_job_active = True # set to True the aeroponics activation value
-
-            job_thread_aeroponics = threading.Thread(target=self.ah.activate_aeroponics, daemon=True)
-            job_thread_aeroponics.start()
-
-            #UI Update
             self.active_jobs[name] = 'Attivo'
-        
-
-        # parte di codice legata ad IDROPONICS
-        elif name == 'IDROPONICS':
+            self.refresh_jobs_list()
 
-            # check if the job is already running
-            if self.ah.idroponics_job_active:
-                messagebox.showwarning("Avviso", f"Il job {name} è già in esecuzione!")
-                return
-            
-            self.ah.idroponics_job_active = True # set to True the idroponics activation value
+        def on_error(error):
+            messagebox.showwarning("Avviso", f"Job '{name}' non attivato: {error}")
 
-            job_thread_idroponics = threading.Thread(target=self.ah.activate_idroponics, daemon=True)
-            job_thread_idroponics.start()
-            
-            #UI Update
-            self.active_jobs[name] = 'Attivo'
-
-        else:
-            messagebox.showwarning("Avviso", f"Job '{name}' non riconosciuto per l'attivazione.")
-            return
-    
-        
-        # Update UI
-        self.refresh_jobs_list()
-        # messagebox.showinfo("Successo", f"Job '{name}' attivato!")
+        self.call_async(self.client.start_zone, name, on_done=on_done, on_error=on_error)
 
     
     def toggle_job_off(self):
-        """Disattiva il job selezionato"""
+        """Disattiva il job selezionato tramite il daemon"""
         selected = self.jobs_tree.selection()
         if not selected:
             messagebox.showwarning("Avviso", "Selezionare un job da disattivare")
             return
         
         item = selected[0]
-        name = self.jobs_tree.item(item, 'values')[0]
-        
-        # parte di codice legata ad AEROPONICS
-        if name == 'AEROPONICS':
-            self.ah.aeroponics_job_active = False # Set the deactivation for aeroponics job
-            sleep(2)
-            self.active_jobs[name] = 'Inattivo'
-        
-        elif name == 'IDROPONICS':
-            self.ah.idroponics_job_active = False # Set the deactivation for idroponics job
-            sleep(2)
+        name = str(self.jobs_tree.item(item, 'values')[0])
+
+        def on_done(stopped):
+            if not stopped:
+                messagebox.showwarning("Avviso", f"Il job {name} non è attivo.")
             self.active_jobs[name] = 'Inattivo'
-        else:
-            messagebox.showwarning("Avviso", f"Job '{name}' non riconosciuto per la disattivazione.")
-            return
-        
-        # Update UI
+            self.refresh_jobs_list()
 
-        self.refresh_jobs_list()
-        # messagebox.showinfo("Successo", f"Job '{name}' disattivato!")
+        def on_error(error):
+            messagebox.showwarning("Avviso", f"Job '{name}' non disattivato: {error}")
+
+        self.call_async(self.client.stop_zone, name, on_done=on_done, on_error=on_error)
     
 
 
@@ -551,49 +623,37 @@ class AeroGreenHouseGUI:
         return os.path.join(log_dir, log_file) if log_dir and log_file else None
     
     def refresh_output(self):
-        """Carica e visualizza il contenuto del file di log"""
-        try:
-            log_path = self.get_log_file_path()
-            
-            if not log_path or not os.path.exists(log_path):
-                self.output_text.config(state=tk.NORMAL)
-                self.output_text.delete(1.0, tk.END)
-                self.output_text.insert(tk.END, "❌ File di log non trovato o non configurato.\n", 'error')
-                self.output_text.insert(tk.END, f"Percorso atteso: {log_path}", 'warning')
-                self.output_text.config(state=tk.DISABLED)
-                return
-            
-            # Leggi il file log
-            with open(log_path, 'r', encoding='utf-8', errors='ignore') as f:
-                content = f.read()
-            
-            # Visualizza il contenuto
-            self.output_text.config(state=tk.NORMAL)
-            self.output_text.delete(1.0, tk.END)
-            
-            # Colora le linee in base al livello di log
-            lines = content.split('\n')
-            for line in lines:
-                if '[ERROR]' in line or '[CRITICAL]' in line:
-                    self.output_text.insert(tk.END, line + '\n', 'error')
-                elif '[WARNING]' in line:
-                    self.output_text.insert(tk.END, line + '\n', 'warning')
-                elif '[DEBUG]' in line:
-                    self.output_text.insert(tk.END, line + '\n', 'debug')
-                elif '[INFO]' in line:
-                    self.output_text.insert(tk.END, line + '\n', 'info')
-                else:
-                    self.output_text.insert(tk.END, line + '\n')
-            
-            # Scroll verso il fondo
-            self.output_text.see(tk.END)
-            self.output_text.config(state=tk.DISABLED)
-            
-        except Exception as e:
-            self.output_text.config(state=tk.NORMAL)
-            self.output_text.delete(1.0, tk.END)
-            self.output_text.insert(tk.END, f"❌ Errore nel caricamento del log:\n{str(e)}", 'error')
-            self.output_text.config(state=tk.DISABLED)
+        """Ricarica le ultime righe di log (buffer del daemon, il file di log se il daemon non è raggiungibile)"""
+        self.log_epoch += 1 # le risposte ancora in volo vengono ignorate
+        self.log_seq = None
+        if self.log_tailer is not None:
+            self.log_tailer.close() # daemon non raggiungibile: si rilegge la coda del file
+            self.log_tailer = None
+        self.log_pending = False
+        self.output_text.config(state=tk.NORMAL)
+        self.output_text.delete(1.0, tk.END)
+        self.output_text.config(state=tk.DISABLED)
+        self.fetch_log()
+    
+    @staticmethod
+    def log_line_tag(line):
+        """Tag del widget di output in base al livello della riga di log"""
+        if '[ERROR]' in line or '[CRITICAL]' in line:
+            return 'error'
+        elif '[WARNING]' in line:
+            return 'warning'
+        elif '[DEBUG]' in line:
+            return 'debug'
+        elif '[INFO]' in line:
+            return 'info'
+        return ()
+    
+    def trim_output(self):
+        """Mantiene nel widget di output al massimo gui_max_lines righe (widget in stato NORMAL)"""
+        lines = int(self.output_text.index('end-1c').split('.')[0])
+        excess = lines - self.gui_max_lines
+        if excess > 0:
+            self.output_text.delete('1.0', f'{excess + 1}.0')
     
     def clear_output(self):
         """Pulisce il contenuto visualizzato (non il file vero)"""
@@ -621,139 +681,124 @@ class AeroGreenHouseGUI:
         
         # Crea un frame interno per centrare il contenuto
         inner_frame = ttk.Frame(main_frame)
-        inner_frame.pack(expand=True)
+        inner_frame.pack()
         
         # Temperatura
         temp_frame = ttk.Frame(inner_frame)
-        temp_frame.pack(pady=10)
+        temp_frame.pack(side=tk.LEFT, padx=30)
         ttk.Label(temp_frame, text="Temperatura", font=('Arial', 16, 'bold')).pack()
         self.ambient_temp_label = ttk.Label(temp_frame, text="-- °C", font=('Arial', 24, 'bold'), foreground="#207abb")
         self.ambient_temp_label.pack()
         
         # Umidità
         humid_frame = ttk.Frame(inner_frame)
-        humid_frame.pack(pady=10)
+        humid_frame.pack(side=tk.LEFT, padx=30)
         ttk.Label(humid_frame, text="Umidità", font=('Arial', 16, 'bold')).pack()
         self.ambient_humid_label = ttk.Label(humid_frame, text="-- %", font=('Arial', 24, 'bold'), foreground='#ff7f0e')
         self.ambient_humid_label.pack()
         
         # VPD
         vpd_frame = ttk.Frame(inner_frame)
-        vpd_frame.pack(pady=10)
+        vpd_frame.pack(side=tk.LEFT, padx=30)
         ttk.Label(vpd_frame, text="VPD", font=('Arial', 16, 'bold')).pack()
         self.ambient_vpd_label = ttk.Label(vpd_frame, text="-- kPa", font=('Arial', 24, 'bold'), foreground='#2ca02c')
         self.ambient_vpd_label.pack()
         
         # Timestamp della lettura
-        self.ambient_timestamp_label = ttk.Label(inner_frame, text="Ultimo aggiornamento: --", 
+        self.ambient_timestamp_label = ttk.Label(main_frame, text="Ultimo aggiornamento: --", 
                                                   font=('Arial', 12, 'italic'), foreground='gray')
-        self.ambient_timestamp_label.pack(pady=20)
+        self.ambient_timestamp_label.pack(pady=5)
+        
+        # Grafici di andamento: ultime ore in memoria, storico dai rollup al minuto (se attivi)
+        dht_cfg = self.config.get('dht22', {})
+        rollups = rollupStore(dht_cfg.get('saving_dir', '.')) if dht_cfg.get('rollup', False) else None
+        capacity = int(2 * 3600 / max(dht_cfg.get('read_interval', 5), 0.5)) # ~2 ore di letture
+        self.trend_source = trendSource(capacity, rollups)
+        
+        window_frame = ttk.Frame(main_frame)
+        window_frame.pack(fill=tk.X)
+        ttk.Label(window_frame, text="Andamento:").pack(side=tk.LEFT)
+        self.trend_window = tk.StringVar(value='1h')
+        for name in WINDOWS:
+            ttk.Radiobutton(window_frame, text=name, value=name, variable=self.trend_window,
+                            command=self.change_trend_window).pack(side=tk.LEFT, padx=5)
+        
+        self.trend_charts = []
+        for field, (title, unit, color) in enumerate((("Temperatura", "°C", "#207abb"),
+                                                      ("Umidità", "%", "#ff7f0e"),
+                                                      ("VPD", "kPa", "#2ca02c"))):
+            chart = trendChart(main_frame, self.trend_source, field, title, unit, color, window=WINDOWS['1h'])
+            chart.canvas.pack(fill=tk.BOTH, expand=True, pady=2)
+            self.trend_charts.append(chart)
+    
+    def change_trend_window(self):
+        """Cambia la finestra temporale dei grafici (ridisegno completo)"""
+        for chart in self.trend_charts:
+            chart.set_window(WINDOWS[self.trend_window.get()])
+    
+    def add_trend_reading(self, th):
+        """Aggiunge una lettura {time, T, H, VPD} ai grafici (aggiornamento incrementale)"""
+        from datetime import datetime
+        t = datetime.fromisoformat(th['time']).timestamp()
+        if not self.trend_source.add(t, th['T'], th['H'], th['VPD']):
+            return # stessa lettura del poll precedente
+        for chart, value in zip(self.trend_charts, (th['T'], th['H'], th['VPD'])):
+            chart.add(t, value)
+    
+    def read_th_record(self):
+        """Ultima lettura {time, T, H, VPD} dal record condiviso del processo sensore (None se non disponibile)"""
+        dht_cfg = self.config.get('dht22', {})
+        if not dht_cfg.get('process', False):
+            return None
+        if self.th_record is None:
+            from sensorproc_aeroGreenHouse import thRecord, DEFAULT_RECORD
+            try:
+                self.th_record = thRecord.open(dht_cfg.get('shm_path', DEFAULT_RECORD))
+            except (OSError, ValueError):
+                return None # daemon not started yet (or on another machine)
+        sample = self.th_record.read()
+        if sample is None or not sample.stamp:
+            return None
+        from datetime import datetime
+        return {'time': datetime.fromtimestamp(sample.wall).isoformat(sep=' ', timespec='seconds'),
+                'T': sample.T, 'H': sample.H, 'VPD': sample.VPD}
+    
+    def update_ambient_labels(self, th, digits=1):
+        """Aggiorna le label con una lettura {time, T, H, VPD} del daemon"""
+        self.ambient_temp_label.config(text=f"{th['T']:.{digits}f} °C")
+        self.ambient_humid_label.config(text=f"{th['H']:.{digits}f} %")
+        self.ambient_vpd_label.config(text=f"{th['VPD']:.{digits + 1}f} kPa")
+        self.ambient_timestamp_label.config(text=f"Ultimo aggiornamento: {th['time']}")
+        self.add_trend_reading(th)
     
     def start_ambient_reading(self):
-        """Avvia la lettura temporizzata dei dati ambient"""
-        if self.ambient_thread is not None and self.ambient_thread.is_alive():
-            messagebox.showwarning("Avviso", "Lettura ambient già in corso!")
-            return
-        
+        """Avvia la lettura temporizzata dei dati ambient nel daemon"""
+        def on_done(started):
+            if not started:
+                messagebox.showwarning("Avviso", "Lettura ambient già in corso!")
         
-        
-        def ambient_read_loop():
-            """Loop per letture periodiche"""
-            import time
-            from datetime import datetime
-            
-            interval = self.config.get('dht22', {}).get('read_interval', 5)
-            pin = self.config.get('dht22', {}).get('pin', 27)
-            
-            self.ah.logger.info(f"Inizio lettura AMBIENT. Intervallo: {interval}s, Pin: {pin}")
-            
-            while not self.ambient_stop_flag:
-                try:
-                    # Leggi i dati
-                    temp, humidity = self.ah.measure_dht22(pin)
-                    vpd = self.ah.VPD(temp, humidity)
-
-                    
-                    # Ottieni timestamp
-                    timestamp = datetime.now().strftime("%Y/%m/%d %H:%M:%S")
-                    file_name = datetime.now().strftime("%Y_%m_%d")
-                    
-
-                    # Aggiorna GUI
-                    self.ambient_temp_label.config(text=f"{temp:.1f} °C")
-                    self.ambient_humid_label.config(text=f"{humidity:.1f} %")
-                    self.ambient_vpd_label.config(text=f"{vpd:.2f} kPa")
-                    self.ambient_timestamp_label.config(text=f"Ultimo aggiornamento: {timestamp}")
-                    
-                    self.ah.logger.info(f"AMBIENT: T={temp:.2f}°C, H={humidity:.2f}%, VPD={vpd:.4f}kPa")
-                    
-                    # salva file
-                    format_data_out= "%s\t %5.2f°C\t %5.2f%%\t %5.4fkPa \n"
-                    fid = open(self.config.get('dht22', {}).get('saving_dir', '/home/fishnplants/Desktop/data/TH/')+'TH_'+file_name+'.txt','a')
-                    fid.write(format_data_out%(timestamp, temp, humidity, vpd))
-                    fid.close()
-
-
-                    # Attendi l'intervallo
-                    time.sleep(interval)
-                    
-                except Exception as e:
-                    self.ah.logger.error(f"Errore lettura AMBIENT: {str(e)}")
-                    time.sleep(interval)
-            
-            self.ah.logger.info("Lettura AMBIENT interrotta")
-        
-        self.ambient_thread = threading.Thread(target=ambient_read_loop, daemon=True)
-        self.ambient_thread.start()
-        # messagebox.showinfo("Successo", "Lettura ambient avviata!")
+        self.call_async(self.client.ambient_start, on_done=on_done,
+                        on_error=lambda e: messagebox.showerror("Errore", f"Lettura ambient non avviata: {e}"))
     
     def stop_ambient_reading(self):
         """Arresta la lettura temporizzata dei dati ambient"""
-        if self.ambient_thread is None or not self.ambient_thread.is_alive():
-            messagebox.showwarning("Avviso", "Nessuna lettura in corso")
-            return
-        
-        self.ambient_stop_flag = True
-        
-        # Attendi che il thread finisca
-        timeout = 5
-        start_time = threading.Event()
-        start_time.set()
-        wait_time = 0
-        while wait_time < timeout:
-            if not self.ambient_thread.is_alive():
-                break
-            sleep(0.5)
-            wait_time += 0.5
+        def on_done(stopped):
+            if stopped:
+                messagebox.showinfo("Successo", "Lettura ambient arrestata!")
+            else:
+                messagebox.showwarning("Avviso", "Nessuna lettura in corso")
         
-        messagebox.showinfo("Successo", "Lettura ambient arrestata!")
+        self.call_async(self.client.ambient_stop, on_done=on_done,
+                        on_error=lambda e: messagebox.showerror("Errore", f"Lettura ambient non arrestata: {e}"))
     
     def read_ambient_now(self):
-        """Legge immediatamente i dati ambient"""
-        try:
-            from datetime import datetime
-            
-            pin = self.config.get('dht22', {}).get('pin', 27)
-            
-            # Leggi i dati
-            temp, humidity = self.ah.measure_dht22(pin)
-            vpd = self.ah.VPD(temp, humidity)
-            
-            # Ottieni timestamp
-            timestamp = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
-            
-            # Aggiorna GUI
-            self.ambient_temp_label.config(text=f"{temp:.2f} °C")
-            self.ambient_humid_label.config(text=f"{humidity:.2f} %")
-            self.ambient_vpd_label.config(text=f"{vpd:.4f} kPa")
-            self.ambient_timestamp_label.config(text=f"Ultimo aggiornamento: {timestamp}")
-            
-            self.ah.logger.info(f"AMBIENT (lettura immediata): T={temp:.2f}°C, H={humidity:.2f}%, VPD={vpd:.4f}kPa")
-            messagebox.showinfo("Successo", f"Lettura completata:\nT={temp:.2f}°C\nH={humidity:.2f}%\nVPD={vpd:.4f}kPa")
-            
-        except Exception as e:
-            messagebox.showerror("Errore", f"Errore nella lettura: {str(e)}")
-            self.ah.logger.error(f"Errore lettura AMBIENT immediata: {str(e)}")
+        """Legge immediatamente i dati ambient (la lettura del sensore avviene nel daemon)"""
+        def on_done(th):
+            self.update_ambient_labels(th, digits=2)
+            messagebox.showinfo("Successo", f"Lettura completata:\nT={th['T']:.2f}°C\nH={th['H']:.2f}%\nVPD={th['VPD']:.4f}kPa")
+        
+        self.call_async(self.client.th, fresh=True, on_done=on_done,
+                        on_error=lambda e: messagebox.showerror("Errore", f"Errore nella lettura: {e}"))
     
     def open_log_file(self):
         """Apre il file di log nell'editor predefinito"""
@@ -779,11 +824,13 @@ class AeroGreenHouseGUI:
             messagebox.showerror("Errore", f"Impossibile aprire il file: {str(e)}")
     
 if __name__ == "__main__":
+    root = tk.Tk()
+    gui = AeroGreenHouseGUI(root)
     try:
-        root = tk.Tk()
-        gui = AeroGreenHouseGUI(root)
         root.mainloop()
     except KeyboardInterrupt:
-        gui.ah.cleanup_gpios()
-        print('Job forced to stop')
+        print('GUI closed, the daemon keeps running the jobs')
+    finally:
+        gui.executor.shutdown(wait=False, cancel_futures=True)
+        gui.client.close()
 
@@ -0,0 +1,437 @@
+import threading
+import random
+import time
+from math import sin, pi
+
+
+
+###########################################
+# Clocks
+###########################################
+
+class realClock():
+
+    '''
+    Wall/monotonic clock of the machine
+    '''
+
+    speed = 1.0
+
+    def monotonic(self):
+        return time.monotonic()
+
+    def time(self):
+        return time.time()
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def wait(self, waiter, timeout=None):
+        '''
+        Wait on a threading.Condition/Event for <timeout> clock seconds
+        '''
+        return waiter.wait(timeout)
+
+
+
+class virtualClock(realClock):
+
+    '''
+    Clock running <speed> times faster than the real one, used by the simulated backend
+    to run hours of scheduling in seconds. Every sleep/wait is scaled accordingly.
+    '''
+
+    def __init__(self, speed=1.0, start=None):
+        '''
+        :param speed: virtual seconds per real second
+        :param start: wall time (epoch) at which the virtual clock starts (default: now)
+        '''
+        if speed <= 0:
+            raise ValueError(f'Virtual clock speed must be > 0, got {speed}')
+        self.speed = float(speed)
+        self._real0 = time.monotonic()
+        self._wall0 = time.time() if start is None else start
+
+    def monotonic(self):
+        return (time.monotonic() - self._real0) * self.speed
+
+    def time(self):
+        return self._wall0 + self.monotonic()
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            time.sleep(seconds / self.speed)
+
+    def wait(self, waiter, timeout=None):
+        return waiter.wait(None if timeout is None else timeout / self.speed)
+
+
+
+###########################################
+# Raspberry Pi backend
+###########################################
+
+class piBackend():
+
+    '''
+    Real hardware: RPi.GPIO for the pins and adafruit_dht for the DHT22.
+    The hardware modules are imported only when the backend is created.
+    '''
+
+    def __init__(self):
+        import RPi.GPIO as GPIO
+        self._gpio = GPIO
+        self.clock = realClock()
+
+    def __getattr__(self, name):
+        # BCM, IN, OUT, setmode, setup, output, input, cleanup, ...
+        return getattr(self._gpio, name)
+
+    def dht22(self, gpio):
+        '''
+        DHT22 device on the GPIO number <gpio>
+        '''
+        return adafruit_dht22(gpio)
+
+
+
+class piSensorBackend():
+
+    '''
+    DHT22 only, without RPi.GPIO: backend of the sensor acquisition process
+    (see sensorproc_aeroGreenHouse), which must not touch the pump pins.
+    '''
+
+    def __init__(self):
+        self.clock = realClock()
+
+    def dht22(self, gpio):
+        return adafruit_dht22(gpio)
+
+
+
+def adafruit_dht22(gpio):
+    import adafruit_dht
+    import board
+    return adafruit_dht.DHT22(getattr(board, f'D{gpio}'))
+
+
+
+###########################################
+# Simulated backend
+###########################################
+
+class simWaterLevel():
+
+    '''
+    Water reservoir model for the IDROPONICS sensor.
+    The level (0-1) rises while the pump pin is ON (active low) and slowly drains
+    otherwise. The sensor reads 0 when the level is above <threshold> (water high).
+    While the pump is ON a timer raises the falling edge when the level crosses the threshold.
+    '''
+
+    def __init__(self, backend, sensor_pin, pump_pin, level=0.5, threshold=0.8, fill_rate=0.05, drain_rate=0.0005):
+        '''
+        :param backend: simBackend owning the pins
+        :param sensor_pin: GPIO of the level sensor
+        :param pump_pin: GPIO of the pump filling the reservoir
+        :param level: initial level (0-1)
+        :param threshold: level above which the sensor reads "water high"
+        :param fill_rate: (1/s), level increase while the pump is ON
+        :param drain_rate: (1/s), level decrease while the pump is OFF
+        '''
+        self.backend = backend
+        self.sensor_pin = sensor_pin
+        self.pump_pin = pump_pin
+        self.level = level
+        self.threshold = threshold
+        self.fill_rate = fill_rate
+        self.drain_rate = drain_rate
+        self._t = backend.clock.monotonic()
+        self._timer = None
+
+    def update(self):
+        now = self.backend.clock.monotonic()
+        dt = now - self._t
+        self._t = now
+        pump_on = self.backend.pins.get(self.pump_pin) is False
+        rate = self.fill_rate if pump_on else -self.drain_rate
+        self.level = min(1.0, max(0.0, self.level + rate * dt))
+
+    def read(self):
+        self.update()
+        return 0 if self.level >= self.threshold else 1
+
+    def arm(self):
+        '''
+        (Re)start the timer of the threshold crossing after a pump change
+        '''
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self.backend.pins.get(self.pump_pin) is False and self.level < self.threshold and self.fill_rate > 0:
+            dt = (self.threshold - self.level) / self.fill_rate
+            self._timer = threading.Timer(dt / self.backend.clock.speed, self.backend.input, args=(self.sensor_pin,))
+            self._timer.daemon = True
+            self._timer.start()
+
+
+
+class simDHT22():
+
+    '''
+    DHT22 model: daily sinusoid of temperature and humidity plus noise.
+    A read fails with RuntimeError (like adafruit_dht) with probability <failure_rate>.
+    '''
+
+    def __init__(self, clock, failure_rate=0.0, T_mean=20.0, T_amp=5.0, H_mean=60.0, H_amp=15.0, noise=0.1, seed=None):
+        self.clock = clock
+        self.failure_rate = failure_rate
+        self.T_mean = T_mean
+        self.T_amp = T_amp
+        self.H_mean = H_mean
+        self.H_amp = H_amp
+        self.noise = noise
+        self.reads = 0
+        self.failures = 0
+        self._rnd = random.Random(seed)
+
+    def _read(self):
+        self.reads += 1
+        if self._rnd.random() < self.failure_rate:
+            self.failures += 1
+            raise RuntimeError('Checksum did not validate. Try again.')
+        lt = time.localtime(self.clock.time())
+        phase = 2 * pi * (lt.tm_hour * 3600 + lt.tm_min * 60 + lt.tm_sec) / 86400
+        T = self.T_mean - self.T_amp * sin(phase + pi / 2) + self._rnd.gauss(0, self.noise)
+        H = self.H_mean + self.H_amp * sin(phase + pi / 2) + self._rnd.gauss(0, self.noise)
+        return T, min(100.0, max(0.0, H))
+
+    @property
+    def temperature(self):
+        self._last = self._read()
+        return self._last[0]
+
+    @property
+    def humidity(self):
+        # adafruit_dht reads both values at once, humidity comes from the last read
+        return self._last[1] if hasattr(self, '_last') else self._read()[1]
+
+    def exit(self):
+        pass
+
+
+
+class simBackend():
+
+    '''
+    Simulated RPi.GPIO + DHT22 backend running on a (virtual) clock.
+    Every output change is recorded as (time, pin, value) in <events> and every input
+    edge in <edges> when <record> is True. Input edges can be injected with inject_edge.
+    '''
+
+    BCM = 11
+    BOARD = 10
+    IN = 1
+    OUT = 0
+    HIGH = 1
+    LOW = 0
+    RISING = 31
+    FALLING = 32
+    BOTH = 33
+
+    def __init__(self, clock=None, dht22_failure_rate=0.0, record=False, seed=None):
+        '''
+        :param clock: realClock / virtualClock (default: real clock)
+        :param dht22_failure_rate: probability that a DHT22 read fails
+        :param record: record the output transitions in <events>
+        :param seed: seed of the sensor models
+        '''
+        self.clock = clock or realClock()
+        self.dht22_failure_rate = dht22_failure_rate
+        self.record = record
+        self.seed = seed
+        self.mode = None
+        self.pins = {} # {pin: current output value}
+        self.directions = {} # {pin: IN/OUT}
+        self.sensors = {} # {pin: model with read()}
+        self.dht_devices = {}
+        self.events = []
+        self.edges = []
+        self._forced = {} # {pin: input value set by inject_edge}
+        self._levels = {} # {pin: last input value seen}
+        self._detect = {} # {pin: [edge, callback, bouncetime, last edge time]}
+        self._lock = threading.Lock()
+
+    def setmode(self, mode):
+        self.mode = mode
+
+    def setwarnings(self, flag):
+        pass
+
+    def setup(self, pin, direction, initial=None):
+        with self._lock:
+            self.directions[pin] = direction
+            if direction == self.OUT:
+                self.pins[pin] = initial
+
+    def output(self, pin, value):
+        with self._lock:
+            for model in self.sensors.values():
+                model.update() # integrate the models up to the pin change
+            self.pins[pin] = bool(value)
+            if self.record:
+                self.events.append((self.clock.monotonic(), pin, bool(value)))
+            models = [m for m in self.sensors.values() if m.pump_pin == pin]
+        for model in models:
+            model.arm()
+
+    def input(self, pin):
+        with self._lock:
+            if pin in self._forced:
+                value = self._forced[pin]
+            elif pin in self.sensors:
+                value = self.sensors[pin].read()
+            else:
+                value = int(bool(self.pins.get(pin, 0)))
+        self._notify(pin, value)
+        return value
+
+    def cleanup(self):
+        with self._lock:
+            self.pins.clear()
+            self.directions.clear()
+            self._detect.clear()
+            for model in self.sensors.values():
+                if model._timer is not None:
+                    model._timer.cancel()
+
+    def add_event_detect(self, pin, edge, callback=None, bouncetime=None):
+        '''
+        RPi.GPIO-like edge detection: <callback>(pin) is called on the <edge> of <pin>
+
+        :param bouncetime: (ms), edges closer than this to the previous one are ignored
+        '''
+        if bouncetime is not None and bouncetime <= 0:
+            raise ValueError('Bouncetime must be greater than 0') # as RPi.GPIO
+        with self._lock:
+            if pin in self._detect:
+                raise RuntimeError('Conflicting edge detection already enabled for this GPIO channel')
+            self._detect[pin] = [edge, callback, bouncetime, None]
+        self.input(pin) # current level as reference
+
+    def remove_event_detect(self, pin):
+        with self._lock:
+            self._detect.pop(pin, None)
+
+    def inject_edge(self, pin, value):
+        '''
+        Force the input <pin> to <value> (0/1), firing the edge callbacks
+        '''
+        with self._lock:
+            self._forced[pin] = value
+        self._notify(pin, value)
+
+    def release_input(self, pin):
+        '''
+        Give the input <pin> back to its sensor model
+        '''
+        with self._lock:
+            self._forced.pop(pin, None)
+
+    def _notify(self, pin, value):
+        # detect an edge of <pin> and call its callback (outside the lock)
+        with self._lock:
+            last = self._levels.get(pin)
+            self._levels[pin] = value
+            if last is None or last == value:
+                return
+            t = self.clock.monotonic()
+            if self.record:
+                self.edges.append((t, pin, value))
+            det = self._detect.get(pin)
+            if det is None:
+                return
+            edge, callback, bouncetime, last_edge = det
+            if (edge == self.FALLING and value != 0) or (edge == self.RISING and value != 1):
+                return
+            if bouncetime and last_edge is not None and (t - last_edge) * 1000 < bouncetime:
+                return
+            det[3] = t
+        if callback is not None:
+            callback(pin)
+
+    def add_water_sensor(self, sensor_pin, pump_pin, **kwargs):
+        '''
+        Attach a simWaterLevel model to <sensor_pin>, filled by <pump_pin>
+        '''
+        self.sensors[sensor_pin] = simWaterLevel(self, sensor_pin, pump_pin, **kwargs)
+        return self.sensors[sensor_pin]
+
+    def dht22(self, gpio):
+        if gpio not in self.dht_devices:
+            self.dht_devices[gpio] = simDHT22(self.clock, self.dht22_failure_rate, seed=self.seed)
+        return self.dht_devices[gpio]
+
+
+
+def get_clock(configs):
+    '''
+    Clock of the backend selected in the config: virtual for the sim backend with a speed
+    other than 1, real otherwise. Available before the backend is created.
+    '''
+    hw = configs.get('hardware', {})
+    speed = hw.get('sim', {}).get('speed', 1.0) if hw.get('backend', 'pi') == 'sim' else 1.0
+    return virtualClock(speed) if speed != 1.0 else realClock()
+
+
+def get_backend(configs, clock=None):
+    '''
+    Build the hardware backend selected in the config (hardware: backend: pi|sim)
+
+    :param configs: configuration dictionary (config.yaml)
+    :param clock: clock of the sim backend (default: get_clock)
+    '''
+    hw = configs.get('hardware', {})
+    name = hw.get('backend', 'pi')
+
+    if name == 'pi':
+        return piBackend()
+
+    if name != 'sim':
+        raise ValueError(f'Unknown hardware backend {name}, expected pi or sim')
+
+    sim = hw.get('sim', {})
+    clock = clock or get_clock(configs)
+    backend = simBackend(clock, dht22_failure_rate=sim.get('dht22_failure_rate', 0.0),
+                         record=sim.get('record', False), seed=sim.get('seed'))
+
+    # water level model: each level sensor is filled by the pump of its idroponics zone
+    from zones_aeroGreenHouse import zoneRegistry
+    zones = zoneRegistry(configs.get('gpio_pins', []))
+    for name in zones.names('idroponics'):
+        backend.add_water_sensor(zones.sensor(name)['pin'], zones.get(name)['pin'],
+                                 fill_rate=sim.get('water_fill_rate', 0.05),
+                                 drain_rate=sim.get('water_drain_rate', 0.0005))
+    return backend
+
+
+
+def get_sensor_backend(configs):
+    '''
+    Backend of the DHT22 for the sensor acquisition process: DHT22 only, on the real clock
+    (the process runs in real time also with a simulated virtual clock)
+
+    :param configs: configuration dictionary (config.yaml)
+    '''
+    hw = configs.get('hardware', {})
+    name = hw.get('backend', 'pi')
+
+    if name == 'pi':
+        return piSensorBackend()
+    if name != 'sim':
+        raise ValueError(f'Unknown hardware backend {name}, expected pi or sim')
+
+    sim = hw.get('sim', {})
+    return simBackend(realClock(), dht22_failure_rate=sim.get('dht22_failure_rate', 0.0), seed=sim.get('seed'))
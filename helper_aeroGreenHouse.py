@@ -1,11 +1,19 @@
 import threading
-import schedule
-from time import sleep
 import os
+import time
 import logging
 from logging.handlers import TimedRotatingFileHandler
 
-import RPi.GPIO as GPIO
+from hardware_aeroGreenHouse import get_backend, get_clock
+from scheduler_aeroGreenHouse import aeroScheduler
+from pool_aeroGreenHouse import aeroWorkerPool
+from sensors_aeroGreenHouse import dht22Session
+from thwriter_aeroGreenHouse import thWriter, thMultiWriter
+from psychro_aeroGreenHouse import vpd, t_modifier
+from logqueue_aeroGreenHouse import setup_queue_logging, release_queue_logging, ACTUATION
+from config_aeroGreenHouse import configWatcher, diff_zones, load_yaml, validate_config
+from zones_aeroGreenHouse import zoneRegistry
+from metrics_aeroGreenHouse import REGISTRY, RUNNER_DISPATCH, PUMP_CYCLES, PUMP_ON_SECONDS, PUMP_ON_ERROR
 
 
 
@@ -15,117 +23,433 @@ class aeroHelper():
     Class for aeroGreenHouse JOBs controll
     '''
     
-    def __init__(self):
+    def __init__(self, config_file_name='config.yaml', backend=None, defer_hardware=False):
         '''
         Docstring per __init__
         
-        :param self: Descrizione
+        :param config_file_name: configuration file (config.yaml)
+        :param backend: hardware backend (default: the one selected in the config, see hardware_aeroGreenHouse)
+        :param defer_hardware: leave backend, GPIO, controller and sensor process to init_hardware()
+                               (e.g. the daemon serves its API while the hardware starts)
         '''
+        self.init_timings = {} # {phase: seconds} of the initialization, see bench_startup.py
+        self.hardware_ready = threading.Event()
+        started = time.perf_counter()
 
-        self.config_file_name = 'config.yaml'
+        self.config_file_name = config_file_name
         self.configs = self.load_config(self.config_file_name)
-        print(self.configs)
+        started = self._init_phase('config', started)
+
+        # hardware backend (real Pi or simulated, created by init_hardware) and its clock
+        self.backend = backend
+        self.clock = backend.clock if backend is not None else get_clock(self.configs)
+        self.gpios = None
+        self.controller = None
+        self.sensor_process = None
+        self.journal = None # actuation journal (journal: enabled), see open_journal
+        self.resume_due = {} # {zone: wall time of its next cycle} recovered from the journal
 
         #Log file
         log_dir = self.configs["log"]["directory"]
         # os.makedirs(log_dir, exist_ok=True)
 
-        logging.basicConfig(
-            level=getattr(logging, self.configs["log"]["level"].upper(), logging.INFO),
-            format="%(asctime)s [%(levelname)s] %(message)s",
-            handlers=[
-                TimedRotatingFileHandler(
-                    os.path.join(log_dir, self.configs["log"]["filename"]),
-                    when='midnight',
-                    interval=1,
-                    backupCount=7,
-                    suffix='.%Y-%m-%d'
-                ),
-                logging.StreamHandler()
-            ]
+        # the caller threads only enqueue the records, a listener thread does formatting and I/O
+        log_cfg = self.configs["log"]
+        formatter = logging.Formatter("%(asctime)s [%(levelname)s] %(message)s")
+        log_handlers = [
+            TimedRotatingFileHandler(
+                os.path.join(log_dir, log_cfg["filename"]),
+                when='midnight',
+                interval=1,
+                backupCount=7
+            ), # rotated files get the default midnight suffix .%Y-%m-%d
+            logging.StreamHandler()
+        ]
+        for h in log_handlers:
+            h.setFormatter(formatter)
+
+        self.log_handlers = log_handlers # released by stop_logging
+        self.log_queue_handler, self.log_listener = setup_queue_logging(
+            log_handlers,
+            level=getattr(logging, log_cfg["level"].upper(), logging.INFO),
+            dedup_window=log_cfg.get("dedup_window", 10)
         )
 
         self.logger = logging.getLogger(__name__)
         self.logger.info('#### Started FnP AeroSystems ###')
+        self.logger.debug(f'Config: {self.configs}')
+        started = self._init_phase('logging', started)
 
-        self.initialize_gpio(self.configs)
-
+        # single deadline scheduler shared by all the zone jobs
+        self.scheduler = aeroScheduler(self.logger, clock=self.clock)
 
         #GPIO jobs controll
-        self.aeroponics_job_active = False # controlla se viene eseguito il job aeroponics
-        self.idroponics_job_active = False # controlla se viene eseguito il job idroponics
-        
+        self.zones = zoneRegistry(self.configs['gpio_pins']) # zones by name, see zones_aeroGreenHouse
+        self.active_zones = set() # names of the zones with a scheduled job
+
+        # bounded pool of threads running the pump firings, at least one per zone
+        # (the firings of different zones never wait for each other)
+        pool_cfg = self.configs.get('worker_pool', {})
+        self.pool = aeroWorkerPool(size=self.pool_size(self.configs, self.zones),
+                                   max_pending=pool_cfg.get('max_pending', 4),
+                                   late_tolerance=pool_cfg.get('late_tolerance', 1.0),
+                                   logger=self.logger, clock=self.clock)
+
+        # controller runtime: threads (scheduler + worker pool) or asyncio (single event loop thread)
+        self.runtime = self.configs.get('controller', {}).get('runtime', 'threads')
+        if self.runtime not in ('threads', 'asyncio'):
+            raise ValueError(f'Unknown controller runtime {self.runtime}, expected threads or asyncio')
+
+        # DHT22 sessions {gpio: dht22Session}
+        self.dht_sessions = {}
+        self._dht_lock = threading.Lock()
+
         # TH jobs controll
         self.th_job_active = False #controlla se viene eseguita la lettura dei dati TH
         self.th_job_saving = False #controlla se viene eseguito il job TH (salvataggio dati TH e VPD)
+        self.th_writer = None # buffered writer of the TH files, see open_th_writer
+        self.last_ambient = None # (datetime, T, H, VPD) of the last ambient reading
+        self._ambient_stamp = None # stamp of the last sensor process sample consumed by the ambient loop
+        self._ambient_lock = threading.Lock()
+
+        # counters kept by the pool / sessions / controller, read only when the metrics are scraped
+        REGISTRY.set_collector('aeroHelper', self.collect_metrics)
+
+        # live reload of the config file (config_reload_interval, 0: disabled), started with the hardware
+        self._config_lock = threading.RLock()
+        self.config_watcher = None
+        reload_interval = self.configs.get('config_reload_interval', 0)
+        if reload_interval:
+            self.config_watcher = configWatcher(self.config_file_name, self.apply_config,
+                                                interval=reload_interval, logger=self.logger)
+        self._init_phase('core', started)
+
+        if not defer_hardware:
+            self.init_hardware()
+
+
+    def init_hardware(self):
+        '''
+        Hardware part of the initialization: backend, GPIO setup, controller runtime and
+        sensor process, then the config watcher. Sets hardware_ready.
+        The modules of the optional parts (asyncio, sensor process) are imported here.
+        '''
+        if self.hardware_ready.is_set():
+            return
+        started = time.perf_counter()
+        if self.backend is None:
+            self.backend = get_backend(self.configs, clock=self.clock)
+        started = self._init_phase('backend', started)
+
+        left_on = self.open_journal()
+        started = self._init_phase('journal', started)
+
+        self.initialize_gpio(self.configs)
+        self.recover_actuations(left_on)
+        started = self._init_phase('gpio', started)
+
+        if self.runtime == 'asyncio':
+            from controller_aeroGreenHouse import asyncController
+            self.controller = asyncController(self.gpios, self.clock, self.logger, adapt_on_time=self.adaptive_on_time)
+        started = self._init_phase('runtime', started)
+
+        # dht22 process: the DHT22 is read by a separate process, see sensorproc_aeroGreenHouse
+        dht_cfg = self.configs.get('dht22', {})
+        if dht_cfg.get('process', False):
+            from sensorproc_aeroGreenHouse import sensorProcess, DEFAULT_RECORD
+            self.sensor_process = sensorProcess(self.configs, dht_cfg.get('shm_path', DEFAULT_RECORD),
+                                                hang_timeout=dht_cfg.get('hang_timeout', 120.0), logger=self.logger)
+            self.sensor_process.start()
+            REGISTRY.set_collector('sensorProcess', self.sensor_process.collect_metrics)
+        started = self._init_phase('sensors', started)
+
+        if self.config_watcher is not None:
+            self.config_watcher.start()
+        self.hardware_ready.set()
+        self.logger.info('Init: ' + ', '.join(f'{k} {v*1000:.0f}ms' for k, v in self.init_timings.items()))
+
+
+    def _init_phase(self, name, started):
+        now = time.perf_counter()
+        self.init_timings[name] = now - started
+        return now
+
+
+    def _require_hardware(self):
+        if not self.hardware_ready.is_set():
+            raise RuntimeError('hardware initialization in progress')
 
     
 
+    def add_log_handler(self, handler):
+        '''
+        Add a handler (e.g. the GUI one) to the log listener thread, so that it never
+        runs on the controller threads
+        '''
+        if self.log_listener is None:
+            self.logger.addHandler(handler)
+        else:
+            self.log_handlers.append(handler)
+            self.log_listener.handlers = self.log_listener.handlers + (handler,)
+
+
+    def stop_logging(self):
+        '''
+        Write the queued log records and close the handlers of this helper; the listener
+        thread stops with the last helper of the process (see release_queue_logging)
+        '''
+        if self.log_listener is not None:
+            release_queue_logging(self.log_handlers)
+            self.log_listener = None
+
+
     def load_config(self, file_name):
-        import yaml
+        '''
+        Parse and validate the configuration file: a broken config.yaml stops the start
+        with the list of its problems (ValueError), as the watcher does on a reload
+        '''
         with open(file_name, "r") as f:
-            return yaml.safe_load(f)
+            return validate_config(load_yaml(f))
     
 
-    def runner(self, job, *args, **kwargs):
+    @staticmethod
+    def pool_size(configs, zones):
+        '''
+        Worker threads of the pool: worker_pool.size, raised to the number of pump zones
         '''
-        Function that runs in multi-thread the AeroSystems jobs
+        return max(configs.get('worker_pool', {}).get('size', 2), len(zones.names()), 1)
+
+
+    def runner(self, job, *args, job_name=None, pins=(), policy='skip', **kwargs):
+        '''
+        Function that runs the AeroSystems jobs on the bounded worker pool
         
         :param job: Name of the function to run
+        :param job_name: name of the job (gpio_pins entry), default the function name
+        :param pins: GPIO pins driven by the job, never driven by two firings at once
+        :param policy: what to do if the previous run is still active (skip, coalesce, queue)
         :param args: Arguments of the function <job>
         :param kwargs: Keyworkds arguments of the function <job>
         '''
-        job_thread = threading.Thread(target=job, args=args, kwargs=kwargs, daemon=True)
-        job_thread.start()
+        accepted = self.pool.submit(job_name or job.__name__, pins, job, *args, policy=policy, **kwargs)
+        RUNNER_DISPATCH.labels(job_name or job.__name__, 'accepted' if accepted else 'skipped').inc()
+        return accepted
 
 
-    def activate_aeroponics(self):
+    def collect_metrics(self):
         '''
-        Function that activate the AEROPONICS controller system
-        
-        :param 
+        Metric families of the state of the helper (see metrics_aeroGreenHouse.metricsRegistry.set_collector)
         '''
-        
-        self.logger.info('AEROPONICS system control ## ACTIVATED ##')
-        
-        self.aero_schedule = schedule.Scheduler() #scheduler aeroponics
-        self.aero_schedule.every(self.configs['gpio_pins'][0]['interval']).minutes.do(self.runner, job= self.pump_aerophonics, gpio=self.configs['gpio_pins'][0]['pin'] , irrigation_time=self.configs['gpio_pins'][0]['on_time'])
+        families = [
+            ('aero_active_zones', 'gauge', 'Zones with a scheduled job', [({}, len(self.active_zones))]),
+            ('aero_pool_events_total', 'counter', 'Worker pool task events',
+             [({'event': k}, v) for k, v in self.pool.counters.items()]),
+            ('aero_dht22_session_events_total', 'counter', 'DHT22 session reads, attempts, failures and cache hits',
+             [({'pin': str(gpio), 'event': k}, v) for gpio, session in list(self.dht_sessions.items())
+              for k, v in session.counters.items()]),
+        ]
+        if self.controller is not None:
+            stats = self.controller.stats()
+            families.append(('aero_controller_cycles_total', 'counter', 'Cycles of the asyncio controller zones',
+                             [({'zone': name, 'result': k}, z[k]) for name, z in stats.items()
+                              for k in ('cycles', 'missed', 'failed')]))
+        return families
+
+
+    def zone_job(self, name, zones=None):
+        '''
+        (name, interval, func, args, kwargs) of the scheduler job of the zone <name>
 
-        while self.aeroponics_job_active:
-            self.aero_schedule.run_pending()
-            sleep(1)
+        :param name: name of the gpio_pins entry
+        :param zones: zoneRegistry to read the zone from (default: the running one)
+        '''
+        zones = zones or self.zones
+        zone = zones.get(name)
+        options = dict(job_name=name, pins=(zone['pin'],), policy=zone.get('overlap_policy', 'skip'))
+
+        if zones.mode(name) == 'idroponics':
+            options.update(job=self.pump_idrophonics,
+                           gpio_pump=zone['pin'], gpio_sensor=zones.sensor(name)['pin'],
+                           max_irrigation_time=zone['on_time'],
+                           poll_interval=zone.get('poll_interval', 1.0),
+                           edge_detect=zone.get('cutoff', 'poll') == 'edge',
+                           debounce_ms=int(zone.get('debounce_ms', 20)), zone=name)
         else:
-            self.logger.info('AEROPONICS system control ## DEACTIVATED ##')
+            options.update(job=self.pump_aerophonics, gpio=zone['pin'], irrigation_time=zone['on_time'], zone=name)
 
+        return (name, zone['interval']*60, self.runner, (), options)
 
-    def activate_idroponics(self):
+
+    def activate_zone(self, name):
         '''
-        Function that activate the IDROPONICS controller system
-        
-        :param 
+        Function that activate the controller of the zone <name> (any gpio_pins pump entry).
+        The job is added to the shared scheduler, the function returns immediately.
         '''
-        
-       
+        self.activate_zones([name])
 
-        self.logger.info('IDROPONICS system control ## ACTIVATED ##')
-        
-        self.idro_schedule = schedule.Scheduler() #scheduler idroponics
-        
-        self.idro_schedule.every(self.configs['gpio_pins'][1]['interval']).minutes.do(self.runner, job = self.pump_idrophonics, gpio_pump = self.configs['gpio_pins'][1]['pin'], gpio_sensor = self.configs['gpio_pins'][2]['pin'], max_irrigation_time = self.configs['gpio_pins'][1]['on_time'] )
-        # self.idro_schedule.every(self.configs['gpio_pins'][1]['interval']).minutes.do(self.runner, self.pump_idrophonics)
 
-        while self.idroponics_job_active:
-            self.idro_schedule.run_pending()
-            sleep(1)
+    def activate_zones(self, names=None):
+        '''
+        Activate several zones (default: all of them) with a single scheduler update.
+        Each activation is a heap insertion: the cost does not depend on the number of zones.
+        A zone recovered from the journal keeps its phase: its first cycle is at the due
+        time of the previous run (right away if it was missed while stopped).
+
+        :param names: names of the zones
+        '''
+        with self._config_lock:
+            names = self.zones.names() if names is None else list(names)
+            jobs = [self.zone_job(name) for name in names] # KeyError on unknown zones, nothing activated
+            now = self.clock.time()
+            first_delay = {}
+            for name, interval, *_ in jobs:
+                due = self.resume_due.pop(name, None)
+                if due is not None and name not in self.active_zones:
+                    first_delay[name] = min(max(due - now, 0.0), interval)
+            self.update_jobs(add=jobs, first_delay=first_delay)
+            self.active_zones.update(names)
+            self.journal_zones(activated=names)
+
+        for name in names:
+            self.logger.info(f'{name} system control ## ACTIVATED ##')
+
+
+    def update_jobs(self, remove=(), add=(), first_delay=None):
+        '''
+        Apply the zone jobs (zone_job tuples) to the runtime of the config: the shared
+        scheduler, or the asyncio controller with the cycle coroutine of the pump function.
+
+        :param first_delay: {name: (s)}, delay of the first cycle of the new zones (default: interval)
+        '''
+        if add:
+            self._require_hardware()
+        if self.controller is None:
+            self.scheduler.update_jobs(remove=remove, add=add, first_delay=first_delay)
+            return
+
+        cycles = {self.pump_aerophonics: self.controller.aeroponics_cycle,
+                  self.pump_idrophonics: self.controller.idroponics_cycle}
+        jobs = []
+        for name, interval, _, _, options in add:
+            kwargs = dict(options)
+            job, pins, policy = kwargs.pop('job'), kwargs.pop('pins'), kwargs.pop('policy')
+            kwargs.pop('job_name')
+            jobs.append((name, interval, cycles[job], kwargs, policy, pins))
+        self.controller.update_jobs(remove=remove, add=jobs, first_delay=first_delay)
+
+
+    def join(self):
+        '''
+        Block the caller until the controller runtime is stopped
+        '''
+        if self.controller is not None:
+            self.controller.join()
         else:
-            self.logger.info('IDROPONICS system control ## DEACTIVATED ##')
+            self.scheduler.start() # also with no active zones
+            self.scheduler.join()
 
 
+    def deactivate_zone(self, name):
+        self.deactivate_zones([name])
+
+
+    def deactivate_zones(self, names=None):
+        '''
+        Remove the jobs of several zones (default: all the active ones) from the scheduler
+        '''
+        with self._config_lock:
+            names = list(self.active_zones) if names is None else list(names)
+            self.update_jobs(remove=names)
+            self.active_zones.difference_update(names)
+            self.journal_zones(deactivated=names)
+
+        for name in names:
+            self.logger.info(f'{name} system control ## DEACTIVATED ##')
+
+
+    def is_zone_active(self, name):
+        return name in self.active_zones
+
+
+    # AEROPONICS / IDROPONICS: all the zones of the mode
+
+    def activate_aeroponics(self):
+        self.activate_zones(self.zones.names('aeroponics'))
+
+    def activate_idroponics(self):
+        self.activate_zones(self.zones.names('idroponics'))
+
     def deactivate_aeroponics(self):
-        self.aeroponics_job_active = False
-    
+        self.deactivate_zones([n for n in self.zones.names('aeroponics') if n in self.active_zones])
+
     def deactivate_idroponics(self):
-        self.idroponics_job_active = False
+        self.deactivate_zones([n for n in self.zones.names('idroponics') if n in self.active_zones])
+
+
+    def apply_config(self, configs):
+        '''
+        Apply a new configuration to the running system (called by the config watcher).
+        The gpio_pins entries are compared by name: only the active jobs whose zone changed
+        are rescheduled, keeping their phase; the other jobs keep their timing.
+        The scheduler update is done in a single step (see aeroScheduler.update_jobs).
+
+        :param configs: new configuration (already parsed)
+        '''
+        validate_config(configs)
+        zones = zoneRegistry(configs['gpio_pins'])
+
+        with self._config_lock:
+            old = self.configs
+            diff = diff_zones(old['gpio_pins'], configs['gpio_pins'])
+
+            # active jobs whose zone was removed or changed (also through its sensor)
+            remove, add = [], []
+            for name in sorted(self.active_zones):
+                if name not in zones:
+                    self.logger.warning(f'CONFIG: zone {name} removed from the configuration, job removed')
+                    remove.append(name)
+                    continue
+                old_job, new_job = self.zone_job(name), self.zone_job(name, zones)
+                if new_job[1] != old_job[1] or new_job[4] != old_job[4]:
+                    add.append(new_job)
+
+            # GPIO of the new or changed pins, pumps removed from the config are turned off
+            old_zones = {z['name']: z for z in old['gpio_pins']}
+            new_zones = {z['name']: z for z in configs['gpio_pins']}
+            for name in diff['removed'] + diff['changed']:
+                zone = old_zones[name]
+                if zone.get('what_type', 'pump') == 'pump' and (name in diff['removed'] or new_zones[name]['pin'] != zone['pin']):
+                    self.gpios.output(zone['pin'], True)
+            for name in diff['added'] + diff['changed']:
+                zone = new_zones[name]
+                if name in old_zones and old_zones[name]['pin'] == zone['pin'] and \
+                   old_zones[name].get('what_type', 'pump') == zone.get('what_type', 'pump'):
+                    continue
+                if zone.get('what_type', 'pump') == 'sensor':
+                    self.gpios.setup(zone['pin'], self.gpios.IN)
+                else:
+                    self.gpios.setup(zone['pin'], self.gpios.OUT)
+                    self.gpios.output(zone['pin'], True)
+
+            self.update_jobs(remove=remove, add=add)
+            self.active_zones.difference_update(remove)
+            self.configs = configs
+            self.zones = zones
+            self.pool.grow(self.pool_size(configs, zones))
+            self.journal_zones(deactivated=remove)
+            if self.journal is not None:
+                self.gpios.names = self.pump_names()
+
+        level = getattr(logging, configs.get('log', {}).get('level', 'INFO').upper(), None)
+        if level is not None:
+            logging.getLogger().setLevel(level)
+
+        if self.config_watcher is not None and configs.get('config_reload_interval'):
+            self.config_watcher.interval = configs['config_reload_interval']
+
+        self.logger.info(f"CONFIG: reloaded, zones added {diff['added']}, removed {diff['removed']}, "
+                         f"changed {diff['changed']}; jobs rescheduled {[job[0] for job in add]}")
+        return diff
 
 
     ###########################################
@@ -138,8 +462,12 @@ class aeroHelper():
         
         :param config: configure file (config.yaml) with the pin listed
         '''
-        self.gpios = GPIO
-        self.gpios.setmode(GPIO.BCM)
+        if self.journal is not None:
+            from journal_aeroGreenHouse import journaledGpio
+            self.gpios = journaledGpio(self.backend, self.journal, self.pump_names())
+        else:
+            self.gpios = self.backend
+        self.gpios.setmode(self.gpios.BCM)
         self.gpios.setwarnings(False)
         g_list = []
         for g in config["gpio_pins"]:
@@ -158,41 +486,159 @@ class aeroHelper():
 
 
     def cleanup_gpios(self):
-        self.gpios.cleanup()
+        if self.config_watcher is not None:
+            self.config_watcher.stop()
+        if self.controller is not None:
+            self.controller.shutdown() # cancels the cycles in progress, pins OFF
+        self.scheduler.stop()
+        # the pump firings in progress complete (pins OFF), then every pump is driven OFF anyway
+        self.pool.shutdown(wait=True, timeout=self.max_on_time() / self.clock.speed + 1.0)
+        if self.gpios is not None:
+            for pin in self.pump_names():
+                try:
+                    self.gpios.output(pin, True)
+                except Exception:
+                    self.logger.exception(f'Cleanup: could not turn OFF pin {pin}')
+        if self.sensor_process is not None:
+            self.sensor_process.stop()
+        for session in self.dht_sessions.values():
+            session.close()
+        if self.th_writer is not None:
+            self.th_writer.close()
+        if self.journal is not None:
+            self.journal.close() # snapshot: the next start replays nothing
+        if self.gpios is not None:
+            self.gpios.cleanup()
+        self.stop_logging()
+
+
+    ###########################################
+    # Actuation journal
+    ###########################################
+
+    def open_journal(self):
+        '''
+        Open the actuation journal of the config (journal: enabled) and recover the state
+        of the previous run: the zones to resume (resume_due) and the pins left ON.
+        Returns {pin: state} of the pins left ON (see recover_actuations).
+        '''
+        cfg = self.configs.get('journal', {})
+        if not cfg.get('enabled', False):
+            return {}
+        from journal_aeroGreenHouse import actuationJournal
+        self.journal = actuationJournal(cfg.get('directory', '/home/fishnplants/Desktop/data/journal/'),
+                                        clock=self.clock, compact_every=cfg.get('compact_every', 1000),
+                                        fsync=cfg.get('fsync', False), logger=self.logger)
+        left_on = self.journal.recover()
+        intervals = {name: self.zones.get(name)['interval']*60 for name in self.zones.names()}
+        self.resume_due = self.journal.resume_due(intervals)
+        REGISTRY.set_collector('actuationJournal', self.journal.collect_metrics)
+        self.logger.info(f'JOURNAL: recovered generation {self.journal.generation} '
+                         f'({self.journal.counters["replayed"]} records) in {self.journal.recovery_time*1000:.1f}ms, '
+                         f'zones to resume {sorted(self.resume_due)}')
+        return left_on
+
+
+    def recover_actuations(self, left_on):
+        '''
+        Drive OFF the pumps that the previous run left ON (process killed mid-cycle).
+        The configured pumps are already OFF after initialize_gpio; pins that are no longer
+        pumps in the config are driven OFF here (or only marked OFF if now a sensor).
+
+        :param left_on: {pin: {on, mono, wall, name}} returned by open_journal
+        '''
+        configured = {g['pin']: g for g in self.configs['gpio_pins']}
+        now = self.clock.time()
+        for pin, state in sorted(left_on.items()):
+            entry = configured.get(pin)
+            if entry is None:
+                self.gpios.setup(pin, self.gpios.OUT)
+                self.gpios.output(pin, True)
+            elif entry.get('what_type', 'pump') == 'sensor':
+                self.journal.set_pin(pin, False, state['name'])
+            self.logger.warning(f"JOURNAL: pin {pin} ({state['name'] or 'no zone'}) was left ON "
+                                f"{now - state['wall']:.0f}s ago by the previous run, driven OFF")
+
+
+    def max_on_time(self):
+        '''
+        (s), longest on_time a pump firing can take (adaptive factor included)
+        '''
+        on_times = [g.get('on_time', 0) for g in self.configs['gpio_pins'] if g.get('what_type', 'pump') == 'pump']
+        return max(on_times, default=0) * max(self.configs.get('T_var', {}).get('max_factor', 1.5), 1.0)
+
+
+    def pump_names(self):
+        '''
+        {pin: zone name} of the pump pins
+        '''
+        return {g['pin']: g['name'] for g in self.configs['gpio_pins'] if g.get('what_type', 'pump') == 'pump'}
 
 
-    def pump_aerophonics(self,gpio,irrigation_time):
+    def journal_zones(self, activated=(), deactivated=()):
         '''
-        Function for activating and deactivating the gpio for aerophonics watering system
+        Record the (de)activation of zones, with the wall time of the next cycle of the activated ones
+        '''
+        if self.journal is None:
+            return
+        from journal_aeroGreenHouse import EVENT_ACTIVATE, EVENT_DEACTIVATE
+        runtime = self.controller if self.controller is not None else self.scheduler
+        for name in activated:
+            deadline = runtime.next_deadline(name)
+            due = self.clock.time() + (deadline - self.clock.monotonic() if deadline is not None else 0.0)
+            self.journal.record(EVENT_ACTIVATE, self.zones.get(name)['pin'], name, due)
+        for name in deactivated:
+            self.journal.record(EVENT_DEACTIVATE, 0, name)
+
+
+    def pump_aerophonics(self,gpio,irrigation_time, zone=None):
+        '''
+        Function for activating and deactivating the gpio for aerophonics watering system.
+        The switch-off is computed from a monotonic deadline, so sub-second times (e.g. 1.5 s) are exact.
         
         :param gpio: GPIO number
-        :param irrigation_time: (s), time that the pump is activated
+        :param irrigation_time: (s), time that the pump is activated (float)
+        :param zone: name of the zone, its on_time is adapted to the temperature if enabled (see adaptive_on_time)
         '''
         
         # gpio = self.configs['gpio_pins'][0]['pin']
         # irrigation_time=self.configs['gpio_pins'][0]['on_time']
 
-        self.gpios.output(gpio, False) #turning on pump
-        
-        self.logger.info('AEROPONICS: Turning on the pump')
-        
-        for i in range(irrigation_time):
-            if i==irrigation_time-1:
-        
-                self.gpios.output(gpio,True) #turning off the pump
-        
-                self.logger.info('AEROPONICS: Turning off the pump')
-                break
-            sleep(1)
+        if zone is not None:
+            irrigation_time = self.adaptive_on_time(zone, irrigation_time)
+
+        t_on = self.clock.monotonic()
+        deadline = t_on + irrigation_time
+        end = 'error'
+        try:
+            self.gpios.output(gpio, False) #turning on pump
+            self.logger.info(f'AEROPONICS: Turning on the pump (zone {zone}, pin {gpio})', extra=ACTUATION)
+            self.clock.sleep(deadline - self.clock.monotonic())
+            end = 'time'
+        finally:
+            self.gpios.output(gpio,True) #turning off the pump, also on errors / interrupts
+            on_time = self.clock.monotonic() - t_on
+            self.logger.info(f'AEROPONICS: Turning off the pump (zone {zone}, pin {gpio})', extra=ACTUATION)
+            PUMP_CYCLES.labels('aeroponics', gpio, end).inc()
+            PUMP_ON_SECONDS.labels('aeroponics', gpio).observe(on_time)
+            if end == 'time':
+                PUMP_ON_ERROR.labels(gpio).observe(on_time - irrigation_time)
         
 
 
-    def pump_idrophonics(self, gpio_pump , gpio_sensor, max_irrigation_time):
+    def pump_idrophonics(self, gpio_pump , gpio_sensor, max_irrigation_time, poll_interval=1.0, edge_detect=False, debounce_ms=20,
+                         zone=None):
         '''
-        Function for activating and deactivating the gpio for idroponics watering system
+        Function for activating and deactivating the gpio for idroponics watering system.
+        With <edge_detect> the pump is cut from the falling-edge callback of the level sensor,
+        within milliseconds of the level change; the polling loop stays as a fallback.
         
         :param gpio: GPIO number
-        :param max_irrigation_time: (s), maximum time that the pump is activated
+        :param max_irrigation_time: (s), maximum time that the pump is activated (float)
+        :param poll_interval: (s), period of the water level check
+        :param edge_detect: cut the pump on the sensor edge (falls back to polling if not available)
+        :param debounce_ms: (ms), debounce time of the sensor edge
+        :param zone: name of the zone (log messages)
         '''
         
         #uncomment this and remove the input variable in the function if does not work 
@@ -200,25 +646,65 @@ class aeroHelper():
         # gpio_sensor = self.configs['gpio_pins'][2]['pin']
         # max_irrigation_time = self.configs['gpio_pins'][1]['on_time']
 
-        for i in range(max_irrigation_time):
-            
-            #tempo massimo raggiunto
-            if i == max_irrigation_time -1:
-                self.logger.info("IDROPONICS: Maximum time reached. Turning OFF the pump")
-                self.gpios.output(gpio_pump, True)
-                break
+        cutoff = threading.Event() # set by the edge callback when the water level is high
+        pump_lock = threading.Lock() # the loop never turns the pump back on after the cutoff
 
-            # not activation of the pump
-            if self.gpios.input(gpio_sensor) == 0: 
-                self.logger.info('IDROPONICS: Water level high. pump OFF.')
+        def on_water_high(channel):
+            with pump_lock:
                 self.gpios.output(gpio_pump, True)
-                break
+                cutoff.set()
 
-            #activation of the pump
-            else: 
-                self.gpios.output(gpio_pump, False) #turning on pump
-                self.logger.info('IDROPONICS: Water level low, pump ON')
-                sleep(1)
+        if edge_detect:
+            try:
+                self.gpios.add_event_detect(gpio_sensor, self.gpios.FALLING, callback=on_water_high, bouncetime=debounce_ms)
+            except (RuntimeError, AttributeError, ValueError) as error:
+                self.logger.warning(f'IDROPONICS: edge detection not available ({error}), polling the water level')
+                edge_detect = False
+
+        deadline = self.clock.monotonic() + max_irrigation_time
+        t_on = None # first pump ON of the cycle
+        end = 'error'
+
+        try:
+            while True:
+                remaining = deadline - self.clock.monotonic()
+                
+                #tempo massimo raggiunto
+                if remaining <= 0:
+                    self.logger.info(f"IDROPONICS: Maximum time reached. Turning OFF the pump (zone {zone}, pin {gpio_pump})",
+                                     extra=ACTUATION)
+                    self.gpios.output(gpio_pump, True)
+                    end = 'time'
+                    break
+
+                # not activation of the pump
+                if cutoff.is_set() or self.gpios.input(gpio_sensor) == 0: 
+                    with pump_lock:
+                        self.gpios.output(gpio_pump, True)
+                    self.logger.info(f'IDROPONICS: Water level high. pump OFF (zone {zone}, pin {gpio_pump})', extra=ACTUATION)
+                    end = 'water_high'
+                    break
+
+                #activation of the pump
+                else: 
+                    with pump_lock:
+                        if cutoff.is_set():
+                            continue
+                        self.gpios.output(gpio_pump, False) #turning on pump
+                    first = t_on is None
+                    if first:
+                        t_on = self.clock.monotonic()
+                    # only the first ON of the cycle is an actuation, the repetitions of every poll are rate limited
+                    self.logger.info(f'IDROPONICS: Water level low, pump ON (zone {zone}, pin {gpio_pump})',
+                                     extra=ACTUATION if first else None)
+                    self.clock.wait(cutoff, min(poll_interval, remaining))
+        finally:
+            with pump_lock:
+                self.gpios.output(gpio_pump, True) # OFF also on errors / interrupts
+            if edge_detect:
+                self.gpios.remove_event_detect(gpio_sensor)
+            PUMP_CYCLES.labels('idroponics', gpio_pump, end).inc()
+            PUMP_ON_SECONDS.labels('idroponics', gpio_pump).observe(0.0 if t_on is None else self.clock.monotonic() - t_on)
 
     
 
@@ -229,46 +715,172 @@ class aeroHelper():
     ###########################################
     # DHT22 sensor measurements
     ###########################################        
-    def measure_dht22(self,gpio):
+    def measure_dht22(self,gpio, max_age=None):
         '''
-        Module that use the DHT22 sensor for reading the temperature and humidity  
+        Module that use the DHT22 sensor for reading the temperature and humidity.
+        The reading goes through the persistent session of the pin (see dht22_session):
+        concurrent callers share a fresh cached reading instead of reading the sensor twice.
         
-        :param self: Description
+        With dht22 process the reading is the latest one published by the acquisition process,
+        which reads the sensor every read_interval seconds: RuntimeError if it is older than
+        3*read_interval (or <max_age>, if larger).
+
         :param gpio: GPIO number (27,17, ecc)
+        :param max_age: (s), maximum age of a cached reading (default: dht22 max_age in the config)
         '''
-        import adafruit_dht
-        import board
-        from time import sleep
-        from datetime import datetime
+        if self.sensor_process is not None and gpio == self.sensor_process.gpio:
+            sample = self._process_sample(gpio, max_age)
+            return sample.T, sample.H
+        return self.dht22_session(gpio).read(max_age)
 
-        dht = eval(f"adafruit_dht.DHT22(board.D{gpio})")
 
-        while True:
-            try:
-                T = dht.temperature
-                H = dht.humidity
-                #print('T = %4.2f °C ;  H = %4.2f'%(T, H),'%', 'VPD = %5.4f kPa'%(self.VPD(T,H))) #For debug
-                return T,H
-                break
-            except RuntimeError as error:
-                print(error.args[0])
-                sleep(2.0)
-                continue
-            except Exception as error:
-                dht.exit()
-                raise error
+    def _process_sample(self, gpio, max_age=None):
+        # latest thSample of the sensor process, RuntimeError if missing or stale (see measure_dht22)
+        sample = self.sensor_process.latest()
+        max_age = max(max_age or 0, 3 * self.configs['dht22'].get('read_interval', 5))
+        if sample is None or not sample.stamp or (time.monotonic() - sample.stamp) * self.clock.speed > max_age:
+            raise RuntimeError(f'DHT22 GPIO {gpio}: no reading younger than {max_age}s from the sensor process')
+        return sample
+
+
+    def ambient_latest(self):
+        '''
+        (age (s), T, H) of the last DHT22 reading of the dht22 pin, or None. Never reads the sensor.
+        '''
+        if self.sensor_process is not None:
+            sample = self.sensor_process.latest()
+            if sample is None or not sample.stamp:
+                return None
+            # the process stamps on the machine monotonic clock, ages are in backend clock seconds
+            return (time.monotonic() - sample.stamp) * self.clock.speed, sample.T, sample.H
+
+        session = self.dht_sessions.get(self.configs.get('dht22', {}).get('pin', 27))
+        latest = session.latest() if session is not None else None
+        if latest is None:
+            return None
+        return self.clock.monotonic() - latest[0], latest[1], latest[2]
+
+
+    def dht22_session(self, gpio):
+        '''
+        Long-lived dht22Session of the GPIO <gpio>, created at the first use
+        '''
+        self._require_hardware()
+        with self._dht_lock:
+            session = self.dht_sessions.get(gpio)
+            if session is None:
+                cfg = self.configs.get('dht22', {})
+                session = dht22Session(self.backend, gpio,
+                                       min_interval=cfg.get('min_interval', 2.0),
+                                       max_age=cfg.get('max_age', 2.0),
+                                       max_attempts=cfg.get('max_attempts', 5),
+                                       max_backoff=cfg.get('max_backoff', 30.0),
+                                       logger=self.logger)
+                self.dht_sessions[gpio] = session
+            return session
         
     
-    def VPD(self,T,H):
+    def open_th_writer(self):
+        '''
+        Shared buffered writer of the TH daily files (dht22 saving_dir / flush policy in the config).
+        dht22 format selects text (TH_*.txt), binary (TH_*.thb, see thstore_aeroGreenHouse) or both;
+        with dht22 rollup the minute/hour/day rollups are also kept (see rollup_aeroGreenHouse).
         '''
-        Function that calculate the VPD
+        with self._dht_lock:
+            if self.th_writer is None:
+                cfg = self.configs.get('dht22', {})
+                fmt = cfg.get('format', 'text')
+                options = dict(flush_records=cfg.get('flush_records', 12),
+                               flush_interval=cfg.get('flush_interval', 60.0),
+                               fsync=cfg.get('fsync', False),
+                               clock=self.clock)
+                saving_dir = cfg.get('saving_dir', '/home/fishnplants/Desktop/data/TH/')
+
+                writers = []
+                if fmt in ('text', 'both'):
+                    writers.append(thWriter(saving_dir, **options))
+                if fmt in ('binary', 'both'):
+                    from thstore_aeroGreenHouse import thBinaryWriter
+                    writers.append(thBinaryWriter(saving_dir, **options))
+                if not writers:
+                    raise ValueError(f'Unknown dht22 format {fmt}, expected text, binary or both')
+                if cfg.get('rollup', False):
+                    from rollup_aeroGreenHouse import rollupWriter
+                    writers.append(rollupWriter(saving_dir))
+                self.th_writer = writers[0] if len(writers) == 1 else thMultiWriter(writers)
+            return self.th_writer
+
+
+    def read_ambient(self, save=None, consume=False):
         '''
-        from math import exp
-        es = lambda T : 0.6108 * exp(17.27*T/ (T + 273.3 ) )
-        ea = lambda H : H * es(T) / 100
+        Single ambient reading, saved in the TH daily file if dht22 save is True.
+        Returns (datetime, T, H, VPD).
 
-        VPD = es(T) - ea(H)
-        return VPD
+        With dht22 process the reading is the latest sample of the process, stamped with
+        its own time. With <consume> the sample is marked as used and None is returned if
+        the process has not published a new one since (the ambient loop never saves or logs
+        the same sample twice); a reading without <consume> (e.g. the th command) does not
+        take the sample away from the loop.
+
+        :param save: override the dht22 save option of the config
+        :param consume: mark the sensor process sample as used (ambient loop only)
+        '''
+        from datetime import datetime
+
+        cfg = self.configs.get('dht22', {})
+        gpio = cfg.get('pin', 27)
+        if self.sensor_process is not None and gpio == self.sensor_process.gpio:
+            sample = self._process_sample(gpio)
+            if consume:
+                with self._ambient_lock:
+                    if sample.stamp == self._ambient_stamp:
+                        return None
+                    self._ambient_stamp = sample.stamp
+            T, H, now = sample.T, sample.H, datetime.fromtimestamp(sample.wall)
+        else:
+            T, H = self.measure_dht22(gpio)
+            now = datetime.fromtimestamp(self.clock.time())
+        vpd = self.VPD(T, H)
+
+        self.last_ambient = (now, T, H, vpd)
+        if cfg.get('save', False) if save is None else save:
+            self.open_th_writer().write(now, T, H, vpd)
+        return now, T, H, vpd
+
+
+    def ambient_loop(self, stop_event, on_reading=None):
+        '''
+        Periodic ambient reading every dht22 read_interval seconds, until <stop_event> is set
+
+        :param stop_event: threading.Event stopping the loop
+        :param on_reading: function called with (datetime, T, H, VPD) after every reading
+        '''
+        interval = self.configs.get('dht22', {}).get('read_interval', 5)
+
+        while not stop_event.is_set():
+            try:
+                reading = self.read_ambient(consume=True)
+                if reading is None:
+                    self.clock.wait(stop_event, interval)
+                    continue # no new sample from the sensor process
+                now, T, H, vpd = reading
+                self.logger.info(f"AMBIENT: T={T:.2f}°C, H={H:.2f}%, VPD={vpd:.4f}kPa")
+                if on_reading is not None:
+                    on_reading(now, T, H, vpd)
+            except Exception as e:
+                self.logger.error(f"Errore lettura AMBIENT: {str(e)}")
+            self.clock.wait(stop_event, interval)
+
+        if self.th_writer is not None:
+            self.th_writer.flush()
+
+
+    def VPD(self,T,H):
+        '''
+        Function that calculate the VPD (kPa).
+        For arrays of readings use psychro_aeroGreenHouse.vpd_batch / psychro_batch.
+        '''
+        return vpd(T, H)
 
 
 
@@ -285,12 +897,69 @@ class aeroHelper():
         :param T: Temperatura rilevata
         '''
 
-        from math import exp
-        Topt = self.configs['T_var']['Topt']
-        a = -0.2
-        amp = 1
-        f = amp/(exp(a* (T - Topt)) + 1 ) - amp/2
-        return f
+        return t_modifier(T, self.configs['T_var']['Topt'])
+
+
+    def adaptive_on_time(self, zone, on_time):
+        '''
+        Effective on_time of the aeroponics zone <zone>: on_time * (1 + gain*T_modifier(T)),
+        with the factor clamped to [min_factor, max_factor] (T_var in the config).
+        Enabled by T_var adaptive, or by the adaptive key of the zone.
+
+        T is the last cached DHT22 reading (ambient_latest): the sensor is never read
+        here, so the pump start is never delayed by the DHT22 retries. A reading older than
+        T_var max_age is stale and the configured on_time is used.
+        With T_var scale_interval the interval of the zone is divided by the same factor.
+
+        :param zone: name of the zone
+        :param on_time: (s), configured on_time
+        '''
+        cfg = self.configs.get('T_var', {})
+        zone_cfg = self.zones.get(zone) if zone in self.zones else {}
+        if not zone_cfg.get('adaptive', cfg.get('adaptive', False)):
+            return on_time
+
+        latest = self.ambient_latest()
+        max_age = cfg.get('max_age', 300)
+        if latest is None or latest[0] > max_age:
+            self.logger.warning(f'{zone}: no temperature reading younger than {max_age}s, on_time {on_time:.2f}s not adapted')
+            return on_time
+
+        T = latest[1]
+        factor = 1 + cfg.get('gain', 1.0) * self.T_modifier(T)
+        factor = min(max(factor, cfg.get('min_factor', 0.5)), cfg.get('max_factor', 1.5))
+        effective = on_time * factor
+        self.logger.info(f'{zone}: T={T:.1f}°C, on_time {on_time:.2f}s x{factor:.2f} -> {effective:.2f}s')
+
+        if cfg.get('scale_interval', False):
+            self.scale_zone_interval(zone, factor)
+        return effective
+
+
+    def scale_zone_interval(self, zone, factor, tolerance=0.05):
+        '''
+        Set the interval of the active zone <zone> to the configured one divided by <factor>,
+        only if it changes by more than <tolerance> (relative). The zone keeps its phase.
+        '''
+        if self.controller is not None:
+            # called from the loop thread: no _config_lock here, apply_config holds it while
+            # waiting for the loop. set_interval ignores a zone stopped in the meantime.
+            current = self.controller.interval(zone)
+            new_interval = self.zones.get(zone)['interval']*60 / factor
+            if current is None or abs(new_interval - current) <= tolerance * current:
+                return
+            self.controller.set_interval(zone, new_interval)
+        else:
+            with self._config_lock:
+                current = self.scheduler.interval(zone)
+                if zone not in self.active_zones or current is None:
+                    return
+                name, interval, func, args, kwargs = self.zone_job(zone)
+                new_interval = interval / factor
+                if abs(new_interval - current) <= tolerance * current:
+                    return
+                self.scheduler.update_jobs(add=[(name, new_interval, func, args, kwargs)])
+        self.logger.info(f'{zone}: interval {current/60:.2f}min -> {new_interval/60:.2f}min')
 
 
 
@@ -0,0 +1,356 @@
+'''
+Crash-safe journal of the pump actuations and of the zone schedule.
+
+Every ON/OFF transition of a pump pin and every zone activation is appended to the
+journal file as a fixed-width little-endian record
+    monotonic (float64) | wall (float64) | due (float64, wall) | pin (uint16) | event (uint8) | name (37 bytes)
+The ON record is written before the pin is driven and the OFF record after (write-ahead:
+a pin recorded OFF is really OFF). The file is unbuffered, so a killed process loses
+nothing; with fsync also a power cut loses nothing.
+
+Every <compact_every> records a new journal file is started and the state up to it
+(last transition of each pin, phase of each active zone) is written to a JSON snapshot
+by a background thread, never on the actuation path:
+    actuation_snapshot.json    actuation_<generation>.jnl
+The snapshot names its generation and is replaced atomically, and the old journal is
+removed only after it, so recovery = snapshot + replay of about compact_every records,
+whatever the months of operation behind it.
+
+    python journal_aeroGreenHouse.py DIR
+'''
+
+import os
+import json
+import glob
+import time
+import struct
+import threading
+import logging
+
+from hardware_aeroGreenHouse import realClock
+
+
+
+RECORD = struct.Struct('<dddHB37s')
+RECORD_SIZE = RECORD.size # 64 bytes
+SNAPSHOT_FILE = 'actuation_snapshot.json'
+SNAPSHOT_VERSION = 1
+
+EVENT_OFF = 0
+EVENT_ON = 1
+EVENT_ACTIVATE = 2 # zone job added, due: wall time of its first cycle
+EVENT_DEACTIVATE = 3
+
+
+
+class actuationJournal():
+
+    '''
+    Append-only journal of the actuations with snapshot compaction, see the module docstring.
+    Thread safe: the pump threads, the controller loop and the API threads record concurrently.
+    '''
+
+    def __init__(self, directory, clock=None, compact_every=1000, fsync=False, logger=None):
+        '''
+        :param directory: directory of the journal and snapshot files (created if missing)
+        :param clock: clock of the backend (monotonic and wall time of the records)
+        :param compact_every: records of a journal file before a snapshot
+        :param fsync: fsync every record (survives power cuts, slower on SD cards)
+        '''
+        self.directory = directory
+        self.clock = clock or realClock()
+        self.compact_every = compact_every
+        self.fsync = fsync
+        self.logger = logger or logging.getLogger(__name__)
+
+        self.pins = {} # {pin: {on, mono, wall, name}}, last transition
+        self.zones = {} # {name: {due, last_on}}, active zones
+        self.generation = 0
+        self.tail = 0 # records in the current journal file
+        self.counters = {'records': 0, 'compactions': 0, 'replayed': 0, 'truncated': 0}
+        self.recovery_time = None # (s)
+        self._file = None
+        self._compactor = None # thread writing a snapshot
+        self._lock = threading.Lock() # state and journal file
+        self._snapshot_lock = threading.Lock() # one compaction at a time, in generation order
+
+
+    @property
+    def snapshot_path(self):
+        return os.path.join(self.directory, SNAPSHOT_FILE)
+
+
+    def journal_path(self, generation):
+        return os.path.join(self.directory, f'actuation_{generation}.jnl')
+
+
+    ###########################################
+    # Recovery
+    ###########################################
+
+    def recover(self, read_only=False):
+        '''
+        Load the snapshot, replay the journal tail and open the journal for appending.
+        Returns the state found as {pin: {on, mono, wall, name}} of the pins left ON.
+
+        :param read_only: only load the state (no truncation, no journal opened)
+        '''
+        started = time.perf_counter()
+        if not read_only:
+            os.makedirs(self.directory, exist_ok=True)
+        with self._lock:
+            snapshot = self._load_snapshot()
+            # the journal of the snapshot and the newer ones (a compaction interrupted before
+            # its snapshot); without a (readable) snapshot all the journals left, oldest first
+            generations = sorted(g for g in (int(os.path.basename(p)[10:-4]) for p in
+                                             glob.glob(os.path.join(self.directory, 'actuation_*.jnl')))
+                                 if not snapshot or g >= self.generation)
+            if generations:
+                self.generation = max(generations[-1], self.generation)
+            for generation in generations:
+                self._replay(self.journal_path(generation), truncate=not read_only and generation == self.generation)
+            switched, stale = None, []
+            if not read_only:
+                self._file = open(self.journal_path(self.generation), 'ab', buffering=0)
+                if not snapshot and generations or len(generations) > 1:
+                    # the state of all the journals in one snapshot before removing them
+                    stale = [self.journal_path(g) for g in generations if g != self.generation]
+                    switched = self._switch()
+            left_on = {pin: dict(state) for pin, state in self.pins.items() if state['on']}
+        if switched is not None:
+            self._write_snapshot(*switched)
+            for path in stale:
+                os.remove(path)
+        self.recovery_time = time.perf_counter() - started
+        return left_on
+
+
+    def _load_snapshot(self):
+        try:
+            with open(self.snapshot_path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if data.get('version') != SNAPSHOT_VERSION:
+            return False
+        self.generation = data['generation']
+        self.pins = {int(pin): state for pin, state in data.get('pins', {}).items()}
+        self.zones = data.get('zones', {})
+        return True
+
+
+    def _replay(self, path, truncate=False):
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return
+        size = len(data) // RECORD_SIZE * RECORD_SIZE
+        if size != len(data):
+            self.counters['truncated'] += 1 # record cut by a crash / power cut
+            if truncate:
+                with open(path, 'r+b') as f:
+                    f.truncate(size)
+        for mono, wall, due, pin, event, name in RECORD.iter_unpack(data[:size]):
+            self._apply(mono, wall, due, pin, event, name.rstrip(b'\x00').decode('utf-8', 'replace'))
+            self.counters['replayed'] += 1
+        if truncate:
+            self.tail = size // RECORD_SIZE
+
+
+    def _apply(self, mono, wall, due, pin, event, name):
+        if event in (EVENT_ON, EVENT_OFF):
+            self.pins[pin] = {'on': event == EVENT_ON, 'mono': mono, 'wall': wall, 'name': name}
+            if event == EVENT_ON and name in self.zones:
+                self.zones[name]['last_on'] = wall
+        elif event == EVENT_ACTIVATE:
+            self.zones[name] = {'due': due, 'last_on': None}
+        elif event == EVENT_DEACTIVATE:
+            self.zones.pop(name, None)
+
+
+    def resume_due(self, intervals):
+        '''
+        {zone: wall time of the next cycle} of the zones active when the journal stopped:
+        one interval after their last cycle, or their first due time if they never ran
+
+        :param intervals: {zone: interval (s)} of the current configuration
+        '''
+        with self._lock:
+            out = {}
+            for name, zone in self.zones.items():
+                if name not in intervals:
+                    continue
+                out[name] = zone['due'] if zone['last_on'] is None else zone['last_on'] + intervals[name]
+            return out
+
+
+    ###########################################
+    # Recording
+    ###########################################
+
+    def record(self, event, pin=0, name='', due=0.0):
+        '''
+        Append one record (no-op before recover() / after close())
+        '''
+        with self._lock:
+            self._record(event, pin, name, due)
+
+
+    def set_pin(self, pin, on, name=''):
+        '''
+        Record an ON/OFF of <pin> if it changes the journaled state. True if recorded.
+        '''
+        with self._lock:
+            state = self.pins.get(pin)
+            if state is not None and state['on'] == on:
+                return False
+            self._record(EVENT_ON if on else EVENT_OFF, pin, name)
+            return True
+
+
+    def _record(self, event, pin, name, due=0.0):
+        if self._file is None:
+            return
+        mono, wall = self.clock.monotonic(), self.clock.time()
+        self._file.write(RECORD.pack(mono, wall, due, pin, event, name.encode()[:37]))
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self._apply(mono, wall, due, pin, event, name)
+        self.counters['records'] += 1
+        self.tail += 1
+        if self.tail >= self.compact_every and self._compactor is None:
+            # the snapshot is written by another thread, never between a record and the relay write
+            self._compactor = threading.Thread(target=self._background_compact, name='aeroJournal', daemon=True)
+            self._compactor.start()
+
+
+    def compact(self):
+        '''
+        Snapshot now (on the calling thread)
+        '''
+        with self._snapshot_lock:
+            with self._lock:
+                if self._file is None:
+                    return
+                switched = self._switch()
+            self._write_snapshot(*switched)
+
+
+    def _background_compact(self):
+        try:
+            with self._snapshot_lock:
+                with self._lock:
+                    switched = self._switch() if self._file is not None else None
+                if switched is not None:
+                    self._write_snapshot(*switched)
+        except OSError:
+            self.logger.exception('JOURNAL: compaction failed')
+        finally:
+            with self._lock:
+                self._compactor = None
+
+
+    def _switch(self):
+        # (lock held) the records go to the journal of the next generation from now on,
+        # the state up to here is what its snapshot will contain
+        generation = self.generation + 1
+        state = {'pins': {pin: dict(s) for pin, s in self.pins.items()},
+                 'zones': {name: dict(z) for name, z in self.zones.items()}}
+        old_file, old_path = self._file, self.journal_path(self.generation)
+        self._file = open(self.journal_path(generation), 'ab', buffering=0)
+        self.generation = generation
+        self.tail = 0
+        return generation, state, old_file, old_path
+
+
+    def _write_snapshot(self, generation, state, old_file, old_path):
+        # until the snapshot is replaced, recovery replays the old journal and the new one
+        old_file.close()
+        tmp = self.snapshot_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(dict(state, version=SNAPSHOT_VERSION, generation=generation, wall=self.clock.time()), f)
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp, self.snapshot_path)
+        os.remove(old_path)
+        with self._lock:
+            self.counters['compactions'] += 1
+
+
+    def close(self):
+        '''
+        Compact (the next start reads only the snapshot) and close
+        '''
+        with self._snapshot_lock:
+            with self._lock:
+                if self._file is None:
+                    return
+                switched = self._switch()
+                new_file, self._file = self._file, None
+            new_file.close()
+            try:
+                self._write_snapshot(*switched)
+            except OSError:
+                self.logger.exception('JOURNAL: compaction failed')
+
+
+    def collect_metrics(self):
+        '''
+        Metric families of the journal (see metrics_aeroGreenHouse.metricsRegistry.set_collector)
+        '''
+        return [('aero_journal_events_total', 'counter', 'Actuation journal records, compactions and replayed records',
+                 [({'event': k}, v) for k, v in self.counters.items()])]
+
+
+
+class journaledGpio():
+
+    '''
+    Proxy of the hardware backend recording the output transitions of the pump pins in
+    an actuationJournal (active low: False = ON). Everything else goes to the backend.
+    '''
+
+    def __init__(self, backend, journal, names=None):
+        '''
+        :param backend: piBackend / simBackend
+        :param journal: actuationJournal, already recovered
+        :param names: {pin: zone name} of the pump pins
+        '''
+        self._backend = backend
+        self.journal = journal
+        self.names = dict(names or {})
+
+
+    def __getattr__(self, name):
+        return getattr(self._backend, name)
+
+
+    def output(self, pin, value):
+        on = not value
+        if on:
+            self.journal.set_pin(pin, True, self.names.get(pin, '')) # write-ahead
+        self._backend.output(pin, value)
+        if not on:
+            self.journal.set_pin(pin, False, self.names.get(pin, ''))
+
+
+
+if __name__ == '__main__':
+    import sys
+    from datetime import datetime
+
+    journal = actuationJournal(sys.argv[1] if len(sys.argv) > 1 else '.')
+    left_on = journal.recover(read_only=True)
+    print(f'generation {journal.generation}, {journal.counters["replayed"]} records replayed '
+          f'in {journal.recovery_time*1000:.2f}ms')
+    for pin, state in sorted(journal.pins.items()):
+        print(f"  pin {pin:3d} {state['name'] or '-':16s} {'ON ' if state['on'] else 'OFF'} "
+              f"since {datetime.fromtimestamp(state['wall']):%Y/%m/%d %H:%M:%S}")
+    for name, zone in sorted(journal.zones.items()):
+        last = zone['last_on']
+        print(f"  zone {name:16s} last cycle {datetime.fromtimestamp(last):%Y/%m/%d %H:%M:%S}" if last else
+              f"  zone {name:16s} first cycle due {datetime.fromtimestamp(zone['due']):%Y/%m/%d %H:%M:%S}")
+    if left_on:
+        print(f'pins left ON: {sorted(left_on)}')
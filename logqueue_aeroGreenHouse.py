@@ -0,0 +1,135 @@
+import time
+import queue
+import threading
+import logging
+from collections import OrderedDict
+from logging.handlers import QueueHandler, QueueListener
+
+
+
+# extra of the pump ON/OFF records: an audit trail, never rate limited by dedupFilter
+ACTUATION = {'actuation': True}
+
+
+class deferredQueueHandler(QueueHandler):
+
+    '''
+    QueueHandler that only enqueues the record: formatting (and the exception text)
+    is left to the handlers of the listener thread, so the caller never does I/O or
+    string formatting beyond merging the message arguments.
+    '''
+
+    def prepare(self, record):
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+
+
+class dedupFilter(logging.Filter):
+
+    '''
+    Rate limiting of repetitive log lines.
+
+    A message (same logger, level and text) already logged less than <window> seconds
+    ago is suppressed and counted; the first occurrence after the window is logged with
+    the number of suppressed repetitions, e.g. "... (repeated 59 times)".
+    The actuation records (logged with extra=ACTUATION) always pass and start a new
+    window, so the untagged repetitions of the same line that follow are suppressed.
+    '''
+
+    def __init__(self, window=10.0, max_keys=256):
+        '''
+        :param window: (s), minimum time between two identical messages
+        :param max_keys: number of distinct messages tracked
+        '''
+        super().__init__()
+        self.window = window
+        self.max_keys = max_keys
+        self.suppressed_total = 0
+        self._seen = OrderedDict() # {key: [last logged time, suppressed count]}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        actuation = getattr(record, 'actuation', False)
+        key = (record.name, record.levelno, record.msg if not record.args else record.getMessage())
+        now = time.monotonic()
+        with self._lock:
+            entry = self._seen.get(key)
+            if entry is not None and now - entry[0] < self.window and not actuation:
+                entry[1] += 1
+                self.suppressed_total += 1
+                return False
+
+            repeated = entry[1] if entry is not None else 0
+            self._seen[key] = [now, 0]
+            self._seen.move_to_end(key)
+            while len(self._seen) > self.max_keys:
+                self._seen.popitem(last=False)
+
+        if repeated:
+            record.msg = f'{record.getMessage()} (repeated {repeated} times)'
+            record.args = None
+        return True
+
+
+
+# queue handler and listener of the process, shared by every setup_queue_logging call
+_shared = {'queue_handler': None, 'listener': None, 'users': 0}
+_shared_lock = threading.Lock()
+
+
+def setup_queue_logging(handlers, level=logging.INFO, dedup_window=0.0):
+    '''
+    Configure the root logger to only enqueue the records; a QueueListener thread
+    formats them and writes them to <handlers>. Returns (queue handler, listener).
+
+    The queue and the listener are shared by the process: a second call (e.g. a second
+    aeroHelper in a benchmark) adds its handlers to the running listener and returns the
+    same pair. Every call is undone by release_queue_logging.
+
+    :param handlers: handlers doing the I/O (file, stream, ...)
+    :param level: level of the root logger
+    :param dedup_window: (s), rate limit of repeated messages (0: disabled)
+    '''
+    root = logging.getLogger()
+    with _shared_lock:
+        if _shared['queue_handler'] is None:
+            log_queue = queue.SimpleQueue()
+            _shared['queue_handler'] = deferredQueueHandler(log_queue)
+            _shared['listener'] = QueueListener(log_queue, respect_handler_level=True)
+        queue_handler, listener = _shared['queue_handler'], _shared['listener']
+
+        if dedup_window > 0 and not any(isinstance(f, dedupFilter) for f in queue_handler.filters):
+            queue_handler.addFilter(dedupFilter(dedup_window))
+        if queue_handler not in root.handlers:
+            root.addHandler(queue_handler)
+        root.setLevel(level)
+
+        if _shared['users'] > 0:
+            listener.stop() # the records queued so far go to the handlers of before
+        listener.handlers = listener.handlers + tuple(handlers)
+        listener.start()
+        _shared['users'] += 1
+    return queue_handler, listener
+
+
+def release_queue_logging(handlers=()):
+    '''
+    Undo one setup_queue_logging call: write the queued records, remove and close
+    <handlers>. The listener thread stops with the last call.
+
+    :param handlers: handlers given to setup_queue_logging (and added to the listener since)
+    '''
+    with _shared_lock:
+        listener = _shared['listener']
+        if listener is None or _shared['users'] == 0:
+            return
+        listener.stop() # writes the records still in the queue
+        listener.handlers = tuple(h for h in listener.handlers if h not in handlers)
+        for handler in handlers:
+            handler.close()
+        _shared['users'] -= 1
+        if _shared['users'] > 0:
+            listener.start()
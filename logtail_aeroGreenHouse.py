@@ -0,0 +1,95 @@
+import os
+
+
+
+class logTailer():
+
+    '''
+    Incremental reader of a log file written by a TimedRotatingFileHandler.
+
+    The file is kept open and only the bytes appended since the last call are read.
+    The inode is checked at every call: when the file is rotated (renamed at midnight
+    and recreated) the rest of the old file is read and the new one is followed from
+    its beginning; a truncated file is read again from the start. Only complete lines
+    are returned, a partial last line is kept until its end is written.
+    '''
+
+    def __init__(self, path, initial_bytes=256*1024, encoding='utf-8'):
+        '''
+        :param path: log file to follow
+        :param initial_bytes: at the first read only the last <initial_bytes> of the file are read
+        :param encoding: encoding of the log file
+        '''
+        self.path = path
+        self.initial_bytes = initial_bytes
+        self.encoding = encoding
+
+        self.fid = None
+        self.inode = None
+        self.offset = 0 # bytes of the current file already read
+        self._partial = b''
+
+
+    def read_new(self):
+        '''
+        List of the complete lines appended since the last call
+        '''
+        chunks = []
+
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            st = None # rotation in progress, or file not created yet
+
+        if self.fid is not None and st is not None and st.st_ino != self.inode:
+            # rotated: finish the old file, then follow the new one from the start
+            chunks.append(self.fid.read())
+            self._close()
+
+        if self.fid is None:
+            if st is None:
+                return self._lines(chunks)
+            self._open(st)
+
+        elif st is not None and st.st_size < self.offset:
+            # truncated in place
+            self.fid.seek(0)
+            self.offset = 0
+            self._partial = b''
+
+        data = self.fid.read()
+        self.offset += len(data)
+        chunks.append(data)
+        return self._lines(chunks)
+
+
+    def close(self):
+        self._close()
+        self._partial = b''
+
+
+    def _open(self, st):
+        first = self.inode is None
+        self.fid = open(self.path, 'rb')
+        self.inode = st.st_ino
+        self.offset = 0
+        if first and st.st_size > self.initial_bytes:
+            # first open of a big file: start from its tail, at the beginning of a line
+            self.fid.seek(st.st_size - self.initial_bytes)
+            self.fid.readline()
+            self.offset = self.fid.tell()
+
+
+    def _close(self):
+        if self.fid is not None:
+            self.fid.close()
+            self.fid = None
+
+
+    def _lines(self, chunks):
+        data = self._partial + b''.join(chunks)
+        if not data:
+            return []
+        lines = data.split(b'\n')
+        self._partial = lines.pop() # incomplete last line (b'' if data ends with a newline)
+        return [line.decode(self.encoding, errors='ignore') for line in lines]
@@ -1,25 +1,39 @@
 from helper_aeroGreenHouse import aeroHelper
-import schedule
-from time import sleep
-import threading
-import datetime
+from daemon_aeroGreenHouse import aeroDaemon
+from metrics_aeroGreenHouse import REGISTRY, metricsServer
+import signal
 
-ah = aeroHelper()
+# config and logging only: the API is served while the hardware starts (status: initializing)
+ah = aeroHelper(defer_hardware=True)
 
+#Local API for the GUI and the other clients (see daemon_aeroGreenHouse.py)
+daemon = aeroDaemon(ah)
+daemon.start()
 
-#Setting up aerophonics
-aeroJOB = schedule.every(ah.configs['gpio_pins'][0]['interval']).minutes.do(ah.runner, ah.pump_aerophonics, gpio=ah.configs['gpio_pins'][0]['pin'] , irrigation_time=ah.configs['gpio_pins'][0]['on_time'])
+ah.init_hardware()
 
-#Setting up Idrophonics
-idroJOB = schedule.every(ah.configs['gpio_pins'][1]['interval']).minutes.do(ah.runner, ah.pump_idrophonics, gpio_pump = ah.configs['gpio_pins'][1]['pin'], gpio_sensor = ah.configs['gpio_pins'][2]['pin'], max_irrigation_time = ah.configs['gpio_pins'][1]['on_time'] )
+#Metrics endpoint (localhost only)
+metrics_port = ah.configs.get('metrics', {}).get('port', 0)
+if metrics_port:
+    metrics = metricsServer(REGISTRY, port=metrics_port)
+    metrics.start()
 
-try:
-    while True:
-        schedule.run_pending()
-        sleep(1)
-except KeyboardInterrupt:
-    ah.cleanup_gpios()
-    print('Program Terminated')
+#Setting up all the zones of gpio_pins (aeroponics and idroponics)
+ah.activate_zones()
+
+#Setting up TH reading (saved through the buffered TH writer)
+if ah.configs.get('dht22', {}).get('save', False):
+    daemon.start_ambient()
 
+def terminate(signum, frame):
+    raise KeyboardInterrupt
 
+signal.signal(signal.SIGTERM, terminate) # systemctl stop: same clean shutdown as Ctrl-C
 
+try:
+    # the scheduler (or asyncio controller) thread sleeps until the next deadline, nothing to poll here
+    ah.join()
+except KeyboardInterrupt:
+    daemon.stop()
+    ah.cleanup_gpios() # also flushes and closes the TH file
+    print('Program Terminated')
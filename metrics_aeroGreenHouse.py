@@ -0,0 +1,286 @@
+'''
+Low-overhead metrics of the controller, exposed in the Prometheus text format.
+
+Counters and histograms are plain Python numbers updated under a per-metric lock
+(about a microsecond per update); the counters already kept by the worker pool
+and the DHT22 sessions are read only when the metrics are scraped, through collectors.
+The catalog of the metrics is at the end of the module.
+
+    metricsServer(REGISTRY, port=9108).start()   # http://127.0.0.1:9108/metrics
+'''
+
+import bisect
+import threading
+import time
+
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels_text(names, values, extra=''):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+
+class _counterChild():
+
+    __slots__ = ('_lock', 'value')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+
+class _histogramChild():
+
+    __slots__ = ('_lock', 'buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self._lock = threading.Lock()
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) # last one: +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+
+
+class metric():
+
+    '''
+    Counter or histogram, optionally with labels: metric.labels('a', 'b').inc()
+    '''
+
+    def __init__(self, name, help, kind, labelnames=(), buckets=None):
+        self.name = name
+        self.help = help
+        self.kind = kind # counter | histogram
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) if buckets is not None else None
+        self._children = {} # {label values (str): child}
+        self._lookup = {} # {label values as passed: child}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self.labels()
+
+
+    def labels(self, *values):
+        child = self._lookup.get(values) # fast path: a dict lookup on the raw values
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f'{self.name}: expected labels {self.labelnames}, got {values}')
+            key = tuple(str(v) for v in values) # 15 and '15' are the same series
+            with self._lock:
+                child = self._children.setdefault(
+                    key, _counterChild() if self.kind == 'counter' else _histogramChild(self.buckets))
+                self._lookup[values] = child
+        return child
+
+
+    # unlabelled metrics
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            children = sorted(self._children.items())
+        for values, child in children:
+            if self.kind == 'counter':
+                lines.append(f'{self.name}{_labels_text(self.labelnames, values)} {_number(child.value)}')
+                continue
+            with child._lock:
+                counts, total, count = list(child.counts), child.sum, child.count
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float('inf'),), counts):
+                cumulative += n
+                le = f'le="{_number(bound)}"'
+                lines.append(f'{self.name}_bucket{_labels_text(self.labelnames, values, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels_text(self.labelnames, values)} {_number(total)}')
+            lines.append(f'{self.name}_count{_labels_text(self.labelnames, values)} {count}')
+        return lines
+
+
+
+class metricsRegistry():
+
+    '''
+    Metrics and collectors of the process
+    '''
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = {}
+        self._lock = threading.Lock()
+
+
+    def counter(self, name, help, labels=()):
+        return self._register(metric(name, help, 'counter', labels))
+
+
+    def histogram(self, name, help, buckets, labels=()):
+        return self._register(metric(name, help, 'histogram', labels, buckets))
+
+
+    def set_collector(self, key, func):
+        '''
+        Register (or replace) a function called at every scrape. It returns a list of
+        (name, kind, help, [(labels dict, value)]) with kind gauge or counter.
+        '''
+        with self._lock:
+            if func is None:
+                self._collectors.pop(key, None)
+            else:
+                self._collectors[key] = func
+
+
+    def render(self):
+        '''
+        All the metrics in the Prometheus text exposition format
+        '''
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors.values())
+
+        lines = []
+        for m in metrics:
+            lines += m.render()
+        for func in collectors:
+            try:
+                families = func()
+            except Exception as error:
+                lines.append(f'# collector error: {_escape(error)}')
+                continue
+            for name, kind, help, samples in families:
+                lines += [f'# HELP {name} {help}', f'# TYPE {name} {kind}']
+                for labels, value in samples:
+                    lines.append(f'{name}{_labels_text(labels.keys(), labels.values())} {_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+    def _register(self, m):
+        with self._lock:
+            if m.name in self._metrics:
+                raise ValueError(f'metric {m.name} already registered')
+            self._metrics[m.name] = m
+        return m
+
+
+
+def _metrics_handler():
+    # http.server is imported only when the endpoint is started (slow import on a Pi Zero)
+    from http.server import BaseHTTPRequestHandler
+
+    class _metricsHandler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/metrics', '/'):
+                self.send_error(404)
+                return
+            body = self.server.registry.render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass # no access log for the scrapes
+
+    return _metricsHandler
+
+
+
+class metricsServer():
+
+    '''
+    HTTP endpoint of a registry, bound to localhost by default
+    '''
+
+    def __init__(self, registry, port=9108, host='127.0.0.1'):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.httpd = None
+        self._thread = None
+
+
+    def start(self):
+        from http.server import ThreadingHTTPServer
+        self.httpd = ThreadingHTTPServer((self.host, self.port), _metrics_handler())
+        self.httpd.daemon_threads = True
+        self.httpd.registry = self.registry
+        self.port = self.httpd.server_address[1] # actual port if 0 was requested
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='metrics', daemon=True)
+        self._thread.start()
+
+
+    def stop(self):
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+
+
+
+###########################################
+# Catalog
+###########################################
+
+REGISTRY = metricsRegistry()
+STARTED = time.time()
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 60.0)
+ERROR_BUCKETS = (-1.0, -0.1, -0.01, 0.0, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+ON_TIME_BUCKETS = (0.5, 1, 2, 3, 5, 10, 20, 30, 60, 120, 300)
+
+SCHEDULER_FIRINGS = REGISTRY.counter('aero_scheduler_firings_total', 'Jobs dispatched by the scheduler', ('job',))
+SCHEDULER_MISSED = REGISTRY.counter('aero_scheduler_missed_total', 'Firings skipped because the scheduler was behind', ('job',))
+SCHEDULER_LATENESS = REGISTRY.histogram('aero_scheduler_lateness_seconds', 'Dispatch time - deadline of the scheduler jobs', LATENCY_BUCKETS)
+
+RUNNER_DISPATCH = REGISTRY.counter('aero_runner_dispatch_total', 'Firings submitted to the worker pool (result: accepted or skipped)', ('job', 'result'))
+POOL_START_LATENESS = REGISTRY.histogram('aero_pool_start_lateness_seconds', 'Task start time - firing time in the worker pool', LATENCY_BUCKETS)
+
+PUMP_CYCLES = REGISTRY.counter('aero_pump_cycles_total', 'Pump cycles (end: time, water_high, cancelled, error)', ('mode', 'pin', 'end'))
+PUMP_ON_SECONDS = REGISTRY.histogram('aero_pump_on_seconds', 'Measured pump ON time per cycle', ON_TIME_BUCKETS, ('mode', 'pin'))
+PUMP_ON_ERROR = REGISTRY.histogram('aero_pump_on_time_error_seconds', 'Measured - configured ON time of the aeroponics cycles', ERROR_BUCKETS, ('pin',))
+
+DHT22_READS = REGISTRY.counter('aero_dht22_reads_total', 'DHT22 sensor reads (result: ok or failed)', ('pin', 'result'))
+DHT22_ATTEMPTS = REGISTRY.histogram('aero_dht22_attempts_per_read', 'DHT22 attempts needed for a read', (1, 2, 3, 4, 5, 10), ('pin',))
+DHT22_READ_SECONDS = REGISTRY.histogram('aero_dht22_read_seconds', 'DHT22 read latency, retries included', LATENCY_BUCKETS, ('pin',))
+
+
+def _process_metrics():
+    return [
+        ('aero_threads', 'gauge', 'Live threads of the process', [({}, threading.active_count())]),
+        ('aero_uptime_seconds', 'gauge', 'Seconds since the process started', [({}, time.time() - STARTED)]),
+    ]
+
+
+REGISTRY.set_collector('process', _process_metrics)
@@ -0,0 +1,238 @@
+import time
+import threading
+import logging
+from collections import deque
+
+from hardware_aeroGreenHouse import realClock
+from metrics_aeroGreenHouse import POOL_START_LATENESS
+
+
+
+class poolTask():
+
+    '''
+    Single firing of a job handled by aeroWorkerPool
+    '''
+
+    def __init__(self, key, pins, func, args, kwargs, due):
+        self.key = key # job name
+        self.pins = tuple(pins) # GPIO pins driven by the task
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.due = due # monotonic time the firing was requested
+
+
+
+class aeroWorkerPool():
+
+    '''
+    Bounded, reusable pool of worker threads for the AeroSystems actuation jobs.
+
+    Every task knows the job (key) and the GPIO pins it belongs to: a task is never
+    started while another task of the same job or on the same pin is running. When a
+    firing arrives and the previous one is still active the per-job policy is applied:
+        - skip: the new firing is dropped
+        - coalesce: at most one firing is kept pending, newer firings replace it
+        - queue: firings are kept pending in order, up to <max_pending>
+    '''
+
+    POLICIES = ('skip', 'coalesce', 'queue')
+
+    def __init__(self, size=2, max_pending=4, late_tolerance=1.0, logger=None, clock=None):
+        '''
+        :param size: number of worker threads
+        :param max_pending: maximum number of pending firings per job (queue policy)
+        :param late_tolerance: (s), a firing starting later than this is counted as late
+        :param logger: logger used for the task errors (default: module logger)
+        :param clock: clock of the hardware backend (default: real clock)
+        '''
+        if size < 1:
+            raise ValueError(f'Worker pool size must be >= 1, got {size}')
+
+        self.size = size
+        self.max_pending = max_pending
+        self.late_tolerance = late_tolerance
+        self.logger = logger or logging.getLogger(__name__)
+        self.clock = clock or realClock()
+
+        self._cond = threading.Condition()
+        self._ready = deque() # tasks that can start now
+        self._pending = {} # {key: deque of tasks waiting for the job/pins to be free}
+        self._busy_keys = set() # jobs ready or running
+        self._busy_pins = set() # pins ready or running
+        self._workers = []
+        self._running = False
+        self._closed = False # shut down: never restarted, new firings are dropped
+
+        self.counters = dict.fromkeys(('submitted', 'started', 'completed', 'failed', 'dropped', 'coalesced', 'late'), 0)
+        self.max_lateness = 0.0
+
+
+    def start(self):
+        with self._cond:
+            if self._running or self._closed:
+                return
+            self._running = True
+            self._workers = [threading.Thread(target=self._worker, name=f'aeroWorker-{i}', daemon=True) for i in range(self.size)]
+        for w in self._workers:
+            w.start()
+
+
+    def grow(self, size):
+        '''
+        Raise the number of worker threads to <size> (the pool never shrinks while running)
+        '''
+        with self._cond:
+            if size <= self.size:
+                return
+            first, self.size = self.size, size
+            if not self._running:
+                return
+            new = [threading.Thread(target=self._worker, name=f'aeroWorker-{i}', daemon=True) for i in range(first, size)]
+            self._workers += new
+        for w in new:
+            w.start()
+
+
+    def shutdown(self, wait=True, timeout=None):
+        '''
+        Stop the workers for good. Pending firings are discarded, running ones are completed.
+
+        :param wait: wait for the running firings
+        :param timeout: (s), overall limit of the wait (None: no limit)
+        '''
+        with self._cond:
+            self._running = False
+            self._closed = True
+            for tasks in self._pending.values():
+                self.counters['dropped'] += len(tasks)
+            self._pending.clear()
+            self._cond.notify_all()
+        if wait:
+            end = None if timeout is None else time.monotonic() + timeout
+            for w in self._workers:
+                if w is not threading.current_thread():
+                    w.join(None if end is None else max(end - time.monotonic(), 0))
+
+
+    def submit(self, key, pins, func, *args, policy='skip', **kwargs):
+        '''
+        Submit a firing of job <key>. Returns True if the firing was accepted (started
+        or kept pending), False if it was dropped.
+
+        :param key: name of the job
+        :param pins: GPIO pins driven by the job
+        :param func: function to run
+        :param policy: skip, coalesce or queue (see class docstring)
+        '''
+        if policy not in self.POLICIES:
+            raise ValueError(f'Unknown overlap policy {policy}, expected one of {self.POLICIES}')
+
+        task = poolTask(key, pins, func, args, kwargs, self.clock.monotonic())
+        self.start() # first firing, no-op after shutdown
+
+        with self._cond:
+            self.counters['submitted'] += 1
+
+            if not self._running:
+                self.counters['dropped'] += 1
+                return False
+
+            pending = self._pending.get(key)
+            if not pending and self._is_free(task):
+                self._claim(task)
+                return True
+
+            if policy == 'skip':
+                self.counters['dropped'] += 1
+                self.logger.warning(f'{key}: previous run still active, firing skipped')
+                return False
+
+            pending = self._pending.setdefault(key, deque())
+            if policy == 'coalesce':
+                if pending:
+                    pending.pop()
+                    self.counters['coalesced'] += 1
+                pending.append(task)
+                return True
+
+            if len(pending) >= self.max_pending:
+                self.counters['dropped'] += 1
+                self.logger.warning(f'{key}: {len(pending)} firings already pending, firing dropped')
+                return False
+            pending.append(task)
+            return True
+
+
+    def stats(self):
+        '''
+        Snapshot of the pool counters
+        '''
+        with self._cond:
+            s = dict(self.counters)
+            s['running'] = len(self._busy_keys)
+            s['pending'] = sum(len(t) for t in self._pending.values())
+            s['max_lateness'] = self.max_lateness
+            s['threads'] = len(self._workers)
+            return s
+
+
+    def is_busy(self, key):
+        '''
+        True if a firing of job <key> is running or pending
+        '''
+        with self._cond:
+            return key in self._busy_keys or bool(self._pending.get(key))
+
+
+    def _is_free(self, task):
+        return task.key not in self._busy_keys and self._busy_pins.isdisjoint(task.pins)
+
+
+    def _claim(self, task):
+        self._busy_keys.add(task.key)
+        self._busy_pins.update(task.pins)
+        self._ready.append(task)
+        self._cond.notify()
+
+
+    def _release(self, task):
+        self._busy_keys.discard(task.key)
+        self._busy_pins.difference_update(task.pins)
+
+        # promote the pending firings that can now start
+        for key in list(self._pending):
+            tasks = self._pending[key]
+            if tasks and self._is_free(tasks[0]):
+                self._claim(tasks.popleft())
+            if not tasks:
+                del self._pending[key]
+
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while self._running and not self._ready:
+                    self._cond.wait()
+                if not self._ready:
+                    return
+                task = self._ready.popleft()
+                lateness = self.clock.monotonic() - task.due
+                POOL_START_LATENESS.observe(lateness)
+                self.counters['started'] += 1
+                if lateness > self.late_tolerance:
+                    self.counters['late'] += 1
+                self.max_lateness = max(self.max_lateness, lateness)
+
+            try:
+                task.func(*task.args, **task.kwargs)
+            except Exception:
+                self.logger.exception(f'{task.key}: job failed')
+                failed = True
+            else:
+                failed = False
+
+            with self._cond:
+                self.counters['failed' if failed else 'completed'] += 1
+                self._release(task)
@@ -0,0 +1,126 @@
+'''
+Psychrometrics of the AeroGreenHouse: saturation pressure, VPD, dew point and the
+temperature modifier of the aeroponics irrigation time.
+
+The scalar functions are the ones used by aeroHelper.VPD / aeroHelper.T_modifier, the
+*_batch functions compute the same quantities on NumPy arrays in a single vectorized
+pass, and psychro_store runs them chunk by chunk over the memory-mapped TH history.
+'''
+
+from math import exp
+
+
+
+# saturation vapour pressure es(T) = ES_A * exp(ES_B*T / (T + ES_C)), (kPa)
+ES_A = 0.6108
+ES_B = 17.27
+ES_C = 273.3 # kept as in the original aeroHelper.VPD (the Tetens formula uses 237.3)
+
+# T_modifier sigmoid
+T_MOD_A = -0.2
+T_MOD_AMP = 1.0
+
+
+###########################################
+# Scalar
+###########################################
+
+def es(T):
+    '''
+    Saturation vapour pressure (kPa) at the temperature T (°C)
+    '''
+    return ES_A * exp(ES_B * T / (T + ES_C))
+
+
+def vpd(T, H):
+    '''
+    Vapour pressure deficit (kPa) at temperature T (°C) and relative humidity H (%)
+    '''
+    e = es(T)
+    return e - H * e / 100
+
+
+def t_modifier(T, Topt):
+    '''
+    Irrigation time modifier in (-amp/2, amp/2), 0 at T = Topt
+    '''
+    return T_MOD_AMP / (exp(T_MOD_A * (T - Topt)) + 1) - T_MOD_AMP / 2
+
+
+
+###########################################
+# Batch (NumPy)
+###########################################
+
+def es_batch(T):
+    import numpy as np
+    T = np.asarray(T, dtype=np.float64)
+    return ES_A * np.exp(ES_B * T / (T + ES_C))
+
+
+def vpd_batch(T, H):
+    import numpy as np
+    e = es_batch(T)
+    return e - np.asarray(H, dtype=np.float64) * e / 100
+
+
+def dew_point_batch(T, H):
+    '''
+    Dew point (°C), inverse of es() at the actual vapour pressure (-inf for H = 0)
+    '''
+    import numpy as np
+    ea = np.asarray(H, dtype=np.float64) * es_batch(T) / 100
+    with np.errstate(divide='ignore'):
+        g = np.log(ea / ES_A)
+    return ES_C * g / (ES_B - g)
+
+
+def t_modifier_batch(T, Topt):
+    import numpy as np
+    T = np.asarray(T, dtype=np.float64)
+    return T_MOD_AMP / (np.exp(T_MOD_A * (T - Topt)) + 1) - T_MOD_AMP / 2
+
+
+def psychro_batch(T, H, Topt=None):
+    '''
+    Saturation pressure, actual vapour pressure, VPD, dew point and (if Topt is given)
+    the T_modifier factor of the arrays T (°C) and H (%) in one pass.
+    Returns a dictionary of float64 arrays: es, ea, VPD, dew_point, T_modifier.
+    '''
+    import numpy as np
+    T = np.asarray(T, dtype=np.float64)
+    H = np.asarray(H, dtype=np.float64)
+
+    e = ES_A * np.exp(ES_B * T / (T + ES_C))
+    ea = H * e / 100
+    with np.errstate(divide='ignore'):
+        g = np.log(ea / ES_A)
+
+    out = {
+        'es': e,
+        'ea': ea,
+        'VPD': e - ea,
+        'dew_point': ES_C * g / (ES_B - g),
+    }
+    if Topt is not None:
+        out['T_modifier'] = T_MOD_AMP / (np.exp(T_MOD_A * (T - Topt)) + 1) - T_MOD_AMP / 2
+    return out
+
+
+def psychro_chunks(records, Topt=None, chunk=65536):
+    '''
+    Generator of (time, psychro_batch) over a structured array with fields time, T, H
+    (e.g. a memory-mapped day of thStore), <chunk> records at a time.
+    '''
+    for i in range(0, len(records), chunk):
+        part = records[i:i + chunk]
+        yield part['time'], psychro_batch(part['T'], part['H'], Topt)
+
+
+def psychro_store(store, t0, t1, Topt=None, chunk=65536):
+    '''
+    Generator of (time, psychro_batch) over the thStore records with t0 <= time < t1.
+    Memory use is bounded by <chunk>, whatever the length of the range.
+    '''
+    for records in store.range(t0, t1):
+        yield from psychro_chunks(records, Topt, chunk)
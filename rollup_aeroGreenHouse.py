@@ -0,0 +1,371 @@
+'''
+Streaming rollups of the temperature/humidity/VPD history (minute, hour and day).
+
+rollupWriter sits next to the TH writers (it has the same write/flush/close interface,
+see aeroHelper.open_th_writer): for every level it keeps only the running count and
+min/max/mean of T, H and VPD of the current bucket, and appends each finished bucket
+to the rollup file of the level as a fixed-width little-endian record
+    start (float64, epoch s) | count (uint32) | T min, max, mean | H ... | VPD ... (float32)
+Buckets follow the local time (days start at midnight). Files:
+    TH_rollup_minute_YYYY_MM.thr    TH_rollup_hour_YYYY.thr    TH_rollup_day.thr
+
+rollupStore.summary(t0, t1) answers range questions ("VPD range of last month") from
+the coarsest buckets fully inside the range, going to the finer levels only at the edges.
+
+    python rollup_aeroGreenHouse.py build /path/TH_2026_01_*.txt [--out DIR]
+    python rollup_aeroGreenHouse.py summary DIR 2026-01-01 2026-02-01
+'''
+
+import os
+import mmap
+import time
+import struct
+import threading
+from datetime import datetime, timedelta
+
+
+
+RECORD = struct.Struct('<dI9f')
+RECORD_SIZE = RECORD.size # 48 bytes
+EXTENSION = '.thr'
+FIELDS = ('T', 'H', 'VPD')
+
+# level: (bucket width (s), partition of the files)
+LEVELS = {
+    'minute': (60, '%Y_%m'),
+    'hour': (3600, '%Y'),
+    'day': (86400, None),
+}
+
+
+def bucket_start(t, level):
+    '''
+    Epoch of the start of the bucket of <level> containing <t> (local time)
+    '''
+    if level == 'day':
+        return datetime.fromtimestamp(t).replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+    width = LEVELS[level][0]
+    offset = time.localtime(t).tm_gmtoff
+    return (t + offset) // width * width - offset
+
+
+def bucket_end(start, level):
+    if level == 'day':
+        return (datetime.fromtimestamp(start) + timedelta(days=1, hours=2)).replace(hour=0).timestamp() # 23/25 h days
+    return start + LEVELS[level][0]
+
+
+
+class rollupBucket():
+
+    '''
+    Running count and min/max/mean of T, H and VPD of one bucket
+    '''
+
+    __slots__ = ('start', 'count', 'mins', 'maxs', 'means')
+
+    def __init__(self, start, count=0, mins=None, maxs=None, means=None):
+        self.start = start
+        self.count = count
+        self.mins = list(mins) if mins is not None else [float('inf')] * 3
+        self.maxs = list(maxs) if maxs is not None else [float('-inf')] * 3
+        self.means = list(means) if means is not None else [0.0] * 3
+
+
+    def add(self, values):
+        self.count += 1
+        for i, v in enumerate(values):
+            if v < self.mins[i]:
+                self.mins[i] = v
+            if v > self.maxs[i]:
+                self.maxs[i] = v
+            self.means[i] += (v - self.means[i]) / self.count
+
+
+    def merge(self, other):
+        if not other.count:
+            return
+        total = self.count + other.count
+        for i in range(3):
+            self.mins[i] = min(self.mins[i], other.mins[i])
+            self.maxs[i] = max(self.maxs[i], other.maxs[i])
+            self.means[i] += (other.means[i] - self.means[i]) * other.count / total
+        self.count = total
+
+
+    def pack(self):
+        stats = [x for i in range(3) for x in (self.mins[i], self.maxs[i], self.means[i])]
+        return RECORD.pack(self.start, self.count, *stats)
+
+
+    @classmethod
+    def unpack(cls, record):
+        start, count, *stats = record
+        return cls(start, count, stats[0::3], stats[1::3], stats[2::3])
+
+
+    def as_dict(self):
+        '''
+        {count, T: (min, max, mean), H: ..., VPD: ...}
+        '''
+        out = {'start': self.start, 'count': self.count}
+        for i, name in enumerate(FIELDS):
+            out[name] = (self.mins[i], self.maxs[i], self.means[i]) if self.count else None
+        return out
+
+
+
+class rollupWriter():
+
+    '''
+    Streaming aggregator of the TH readings, same interface as thWriter (write/flush/close).
+    Memory is O(1): one open bucket per level. The open buckets are written on close and
+    resumed (merged) by the next writer if the readings continue in the same bucket.
+    '''
+
+    def __init__(self, saving_dir, levels=tuple(LEVELS), prefix='TH_'):
+        '''
+        :param saving_dir: directory of the rollup files
+        :param levels: levels to keep (minute, hour, day)
+        :param prefix: prefix of the file names
+        '''
+        self.saving_dir = saving_dir
+        self.levels = tuple(levels)
+        self.prefix = prefix
+        self.current = dict.fromkeys(self.levels) # {level: rollupBucket}
+        self.late = 0 # readings older than the open bucket, dropped
+        self._lock = threading.Lock()
+
+
+    def path(self, level, start):
+        return rollup_path(self.saving_dir, level, start, self.prefix)
+
+
+    def write(self, when, T, H, VPD):
+        '''
+        Add one reading
+
+        :param when: datetime (or epoch) of the reading
+        '''
+        t = when.timestamp() if isinstance(when, datetime) else when
+        values = (T, H, VPD)
+        with self._lock:
+            if any(bucket is not None and t < bucket.start for bucket in self.current.values()):
+                self.late += 1 # clock moved back: the bucket is already closed
+                return
+            for level in self.levels:
+                bucket = self.current[level]
+                if bucket is None or t >= bucket_end(bucket.start, level):
+                    if bucket is not None:
+                        self._append(level, bucket)
+                    bucket = self.current[level] = self._resume(level, bucket_start(t, level))
+                bucket.add(values)
+
+
+    def flush(self):
+        pass # finished buckets are written as soon as they are closed
+
+
+    def close(self):
+        '''
+        Write the open buckets (resumed by the next writer, see _resume)
+        '''
+        with self._lock:
+            for level, bucket in self.current.items():
+                if bucket is not None and bucket.count:
+                    self._append(level, bucket)
+                self.current[level] = None
+
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+    def _append(self, level, bucket):
+        with open(self.path(level, bucket.start), 'ab') as f:
+            size = f.tell()
+            if size % RECORD_SIZE:
+                f.truncate(size - size % RECORD_SIZE) # record truncated by a power cut
+            f.write(bucket.pack())
+
+
+    def _resume(self, level, start):
+        # the last record of the file is the bucket written by close(): take it back
+        path = self.path(level, start)
+        try:
+            with open(path, 'r+b') as f:
+                size = f.seek(0, os.SEEK_END) // RECORD_SIZE * RECORD_SIZE
+                if size:
+                    f.seek(size - RECORD_SIZE)
+                    last = rollupBucket.unpack(RECORD.unpack(f.read(RECORD_SIZE)))
+                    if last.start == start:
+                        f.truncate(size - RECORD_SIZE)
+                        return last
+        except FileNotFoundError:
+            pass
+        return rollupBucket(start)
+
+
+
+def rollup_path(saving_dir, level, start, prefix='TH_'):
+    partition = LEVELS[level][1]
+    suffix = f'_{datetime.fromtimestamp(start).strftime(partition)}' if partition else ''
+    return os.path.join(saving_dir, f'{prefix}rollup_{level}{suffix}{EXTENSION}')
+
+
+
+class rollupStore():
+
+    '''
+    Reader of the rollup files of a directory
+    '''
+
+    def __init__(self, saving_dir, prefix='TH_'):
+        self.saving_dir = saving_dir
+        self.prefix = prefix
+
+
+    def buckets(self, level, t0, t1):
+        '''
+        rollupBuckets of <level> with t0 <= start < t1 (binary search in each file)
+        '''
+        out = []
+        for path in self._paths(level, t0, t1):
+            try:
+                f = open(path, 'rb')
+            except FileNotFoundError:
+                continue
+            with f:
+                n = os.fstat(f.fileno()).st_size // RECORD_SIZE
+                if n == 0:
+                    continue
+                with mmap.mmap(f.fileno(), n * RECORD_SIZE, access=mmap.ACCESS_READ) as mm:
+                    i = self._search(mm, n, t0)
+                    while i < n:
+                        record = RECORD.unpack_from(mm, i * RECORD_SIZE)
+                        if record[0] >= t1:
+                            break
+                        out.append(rollupBucket.unpack(record))
+                        i += 1
+        return out
+
+
+    def summary(self, t0, t1):
+        '''
+        Merged rollupBucket (count, min/max/mean of T, H, VPD) of the readings in [t0, t1),
+        at minute resolution at the edges
+        '''
+        total = rollupBucket(t0)
+        for bucket in self._cover(t0, t1, list(LEVELS)[::-1]):
+            total.merge(bucket)
+        return total
+
+
+    def series(self, t0, t1, max_points=500):
+        '''
+        Buckets of the finest level giving at most <max_points> buckets in [t0, t1)
+        '''
+        for level in LEVELS:
+            if (t1 - t0) / LEVELS[level][0] <= max_points:
+                return level, self.buckets(level, t0, t1)
+        return 'day', self.buckets('day', t0, t1)
+
+
+    def _cover(self, t0, t1, levels):
+        level, finer = levels[0], levels[1:]
+        if not finer:
+            return self.buckets(level, t0, t1)
+
+        out = []
+        cursor = t0
+        for bucket in self.buckets(level, t0, t1):
+            end = bucket_end(bucket.start, level)
+            if end > t1:
+                break
+            if bucket.start > cursor:
+                out += self._cover(cursor, bucket.start, finer) # gap or partial bucket at the start
+            out.append(bucket)
+            cursor = end
+        if cursor < t1:
+            out += self._cover(cursor, t1, finer)
+        return out
+
+
+    def _paths(self, level, t0, t1):
+        partition = LEVELS[level][1]
+        if partition is None:
+            return [rollup_path(self.saving_dir, level, t0, self.prefix)]
+        paths = []
+        day = datetime.fromtimestamp(t0).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        while day.timestamp() < t1:
+            path = rollup_path(self.saving_dir, level, day.timestamp(), self.prefix)
+            if path not in paths:
+                paths.append(path)
+            day = (day + timedelta(days=32)).replace(day=1)
+        return paths
+
+
+    @staticmethod
+    def _search(mm, n, t):
+        lo, hi = 0, n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if RECORD.unpack_from(mm, mid * RECORD_SIZE)[0] < t:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+
+
+def build_rollups(th_paths, out_dir):
+    '''
+    Rollups of existing TH files (text or binary), processed in date order. Returns the readings added.
+    '''
+    from thstore_aeroGreenHouse import RECORD as TH_RECORD, HEADER_SIZE
+    from thparser_aeroGreenHouse import iter_records
+
+    writer = rollupWriter(out_dir)
+    n = 0
+    for path in sorted(th_paths, key=os.path.basename):
+        if path.endswith('.thb'):
+            with open(path, 'rb') as f:
+                f.seek(HEADER_SIZE)
+                data = f.read()
+            records = TH_RECORD.iter_unpack(data[:len(data) // TH_RECORD.size * TH_RECORD.size])
+        else:
+            records = sorted(iter_records(path))
+        for t, T, H, VPD in records:
+            writer.write(t, T, H, VPD)
+            n += 1
+    writer.close()
+    return n
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='TH rollups (minute/hour/day)')
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    build = sub.add_parser('build', help='build the rollups of TH_*.txt / TH_*.thb files')
+    build.add_argument('files', nargs='+')
+    build.add_argument('--out', default=None, help='output directory (default: directory of the first file)')
+    summ = sub.add_parser('summary', help='count and min/max/mean of T, H, VPD in a date range')
+    summ.add_argument('dir')
+    summ.add_argument('start', help='YYYY-MM-DD[THH:MM]')
+    summ.add_argument('end', help='YYYY-MM-DD[THH:MM], excluded')
+    args = parser.parse_args()
+
+    if args.cmd == 'build':
+        out = args.out or os.path.dirname(os.path.abspath(args.files[0]))
+        print(f'{build_rollups(args.files, out)} readings -> {out}')
+    else:
+        t0 = datetime.fromisoformat(args.start).timestamp()
+        t1 = datetime.fromisoformat(args.end).timestamp()
+        s = rollupStore(args.dir).summary(t0, t1).as_dict()
+        print(f"{args.start} - {args.end}: {s['count']} readings")
+        for name, unit in zip(FIELDS, ('°C', '%', 'kPa')):
+            if s[name] is not None:
+                print(f'  {name:4s} min {s[name][0]:.2f}  max {s[name][1]:.2f}  mean {s[name][2]:.2f} {unit}')
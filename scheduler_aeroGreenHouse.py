@@ -0,0 +1,242 @@
+import heapq
+import itertools
+import threading
+import logging
+
+from hardware_aeroGreenHouse import realClock
+from metrics_aeroGreenHouse import SCHEDULER_FIRINGS, SCHEDULER_MISSED, SCHEDULER_LATENESS
+
+
+
+class scheduledJob():
+
+    '''
+    Single periodic job handled by aeroScheduler
+    '''
+
+    def __init__(self, name, interval, func, args, kwargs, deadline):
+        self.name = name
+        self.interval = interval # (s)
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.deadline = deadline # monotonic time of the next firing
+        self.cancelled = False
+        self.fired = 0
+        self.missed = 0 # periods skipped because the engine was behind
+
+
+
+class aeroScheduler():
+
+    '''
+    Deadline scheduler for the AeroSystems jobs.
+
+    All the jobs are kept in a min-heap keyed on their monotonic deadline and served by
+    a single engine thread, which sleeps until the earliest deadline or until it is woken
+    up by add_job / cancel_job / stop. Idle cost does not depend on the number of jobs.
+
+    Deadlines are anchored on the first one (deadline_k = deadline_0 + k*interval), so the
+    dispatch time never accumulates drift. If the engine falls behind by more than a
+    period the missed firings are skipped, not run in a burst.
+    '''
+
+    def __init__(self, logger=None, clock=None):
+        '''
+        :param logger: logger used for the job errors (default: module logger)
+        :param clock: clock of the hardware backend (default: real clock)
+        '''
+        self.logger = logger or logging.getLogger(__name__)
+        self.clock = clock or realClock()
+
+        self._heap = [] # [(deadline, seq, job)]
+        self._jobs = {} # {name: scheduledJob}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+
+
+    def start(self):
+        '''
+        Start the engine thread (no-op if already running)
+        '''
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+            self._thread = threading.Thread(target=self.run, name='aeroScheduler', daemon=True)
+            self._thread.start()
+
+
+    def stop(self, timeout=None):
+        '''
+        Stop the engine thread. Jobs already dispatched are not interrupted.
+        '''
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+
+
+    def join(self):
+        '''
+        Block the caller until the engine thread is stopped
+        '''
+        if self._thread is not None:
+            self._thread.join()
+
+
+    def add_job(self, name, interval, func, *args, first_delay=None, **kwargs):
+        '''
+        Add (or replace) a periodic job and wake up the engine
+
+        :param name: unique name of the job (e.g. the gpio_pins entry name)
+        :param interval: (s), period of the job
+        :param func: function to call at every deadline
+        :param first_delay: (s), delay of the first firing (default: interval)
+        :param args: Arguments of the function <func>
+        :param kwargs: Keyworkds arguments of the function <func>
+        '''
+        if interval <= 0:
+            raise ValueError(f'Job {name}: interval must be > 0, got {interval}')
+
+        delay = interval if first_delay is None else max(first_delay, 0)
+        job = scheduledJob(name, interval, func, args, kwargs, self.clock.monotonic() + delay)
+
+        with self._cond:
+            old = self._jobs.pop(name, None)
+            if old is not None:
+                old.cancelled = True
+            self._jobs[name] = job
+            heapq.heappush(self._heap, (job.deadline, next(self._seq), job))
+            self._cond.notify_all()
+
+        self.start()
+        return job
+
+
+    def cancel_job(self, name):
+        '''
+        Remove a job from the schedule. Returns True if the job was scheduled.
+        '''
+        with self._cond:
+            job = self._jobs.pop(name, None)
+            if job is None:
+                return False
+            job.cancelled = True # lazy removal from the heap
+            self._cond.notify_all()
+            return True
+
+
+    def update_jobs(self, remove=(), add=(), first_delay=None):
+        '''
+        Remove and add/replace several jobs as a single change: the engine never sees a
+        partially applied update. A replaced job keeps its phase: with the same interval
+        the next deadline is unchanged, with a new interval it is counted from the last
+        firing (but never in the past).
+
+        :param remove: names of the jobs to remove
+        :param add: (name, interval, func, args, kwargs) of the jobs to add or replace
+        :param first_delay: {name: (s)}, delay of the first firing of the new jobs (default: interval)
+        '''
+        for name, interval, *_ in add:
+            if interval <= 0:
+                raise ValueError(f'Job {name}: interval must be > 0, got {interval}')
+
+        with self._cond:
+            now = self.clock.monotonic()
+            for name in remove:
+                job = self._jobs.pop(name, None)
+                if job is not None:
+                    job.cancelled = True
+
+            for name, interval, func, args, kwargs in add:
+                old = self._jobs.pop(name, None)
+                if old is None:
+                    deadline = now + max((first_delay or {}).get(name, interval), 0)
+                else:
+                    old.cancelled = True
+                    deadline = old.deadline if interval == old.interval else max(old.deadline - old.interval + interval, now)
+                job = scheduledJob(name, interval, func, tuple(args), dict(kwargs), deadline)
+                if old is not None:
+                    job.fired, job.missed = old.fired, old.missed
+                self._jobs[name] = job
+                heapq.heappush(self._heap, (job.deadline, next(self._seq), job))
+            self._cond.notify_all()
+
+        if add:
+            self.start()
+
+
+    def has_job(self, name):
+        with self._cond:
+            return name in self._jobs
+
+
+    def next_deadline(self, name):
+        '''
+        Monotonic deadline of the next firing of <name> (None if not scheduled)
+        '''
+        with self._cond:
+            job = self._jobs.get(name)
+            return None if job is None else job.deadline
+
+
+    def interval(self, name):
+        '''
+        Current interval (s) of <name> (None if not scheduled)
+        '''
+        with self._cond:
+            job = self._jobs.get(name)
+            return None if job is None else job.interval
+
+
+    def _next_due(self):
+        '''
+        Wait for the next due job and reschedule it. Returns None when stopped.
+        '''
+        with self._cond:
+            while self._running:
+                while self._heap and self._heap[0][2].cancelled:
+                    heapq.heappop(self._heap)
+
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+
+                delay = self._heap[0][0] - self.clock.monotonic()
+                if delay > 0:
+                    self.clock.wait(self._cond, delay)
+                    continue
+
+                _, _, job = heapq.heappop(self._heap)
+                now = self.clock.monotonic()
+                job.fired += 1
+                SCHEDULER_FIRINGS.labels(job.name).inc()
+                SCHEDULER_LATENESS.observe(now - job.deadline)
+                job.deadline += job.interval # anchored on the previous deadline, no drift
+                if job.deadline <= now:
+                    missed = int((now - job.deadline) // job.interval) + 1
+                    job.deadline += missed * job.interval # stay on the original phase
+                    job.missed += missed
+                    SCHEDULER_MISSED.labels(job.name).inc(missed)
+                    self.logger.warning(f'Scheduler: job {job.name} is behind, {missed} firings skipped')
+                heapq.heappush(self._heap, (job.deadline, next(self._seq), job))
+                return job
+            return None
+
+
+    def run(self):
+        '''
+        Engine loop: dispatch the jobs as their deadlines expire
+        '''
+        while True:
+            job = self._next_due()
+            if job is None:
+                break
+            try:
+                job.func(*job.args, **job.kwargs)
+            except Exception:
+                self.logger.exception(f'Scheduler: job {job.name} failed')
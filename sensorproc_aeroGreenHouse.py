@@ -0,0 +1,299 @@
+'''
+DHT22 acquisition in a separate process (dht22: process: True in the config).
+
+The bit-banged DHT22 reads are CPU-heavy and timing-sensitive: in their own process
+they do not compete for the GIL with the pump threads. The acquisition process
+publishes the latest reading in a small fixed-size record in shared memory (an
+mmap of a file in /dev/shm), read by the controller, the daemon and the GUI without
+locks: the record is protected by a sequence number (seqlock), odd while the
+single writer is updating it, so a reader retries only if it overlaps a write.
+
+Record: seq (u64), then
+    stamp       monotonic time (s) of the last valid reading (time.monotonic, system wide)
+    wall        epoch time of the last valid reading
+    T, H, VPD   last valid reading
+    heartbeat   monotonic time of the last attempt, checked by the supervisor
+    status      STATUS_EMPTY / STATUS_OK / STATUS_ERROR (last attempt failed, values of the last valid reading)
+    reads, failures, pid
+
+sensorProcess starts the acquisition process and restarts it if it dies or stops
+updating the heartbeat.
+'''
+
+import os
+import sys
+import json
+import mmap
+import time
+import struct
+import signal
+import logging
+import threading
+import subprocess
+from collections import namedtuple
+
+
+
+DEFAULT_RECORD = '/dev/shm/aeroGreenHouse_th'
+
+STATUS_EMPTY = 0
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+_SEQ = struct.Struct('<Q')
+_PAYLOAD = struct.Struct('<ddddddIIII')
+RECORD_SIZE = _SEQ.size + _PAYLOAD.size
+
+thSample = namedtuple('thSample', 'stamp wall T H VPD heartbeat status reads failures pid')
+
+
+
+class thRecord():
+
+    '''
+    Latest reading record in shared memory, see the module docstring.
+    One writer (create), any number of readers (open).
+    '''
+
+    def __init__(self, path, mm, writable):
+        self.path = path
+        self._mm = mm
+        self.writable = writable
+
+
+    @classmethod
+    def create(cls, path):
+        '''
+        Open the record for writing, creating it empty if missing. An existing record
+        keeps its content (a restarted acquisition process continues it).
+        '''
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size != RECORD_SIZE:
+                os.ftruncate(fd, RECORD_SIZE) # zero filled: seq 0, STATUS_EMPTY
+            mm = mmap.mmap(fd, RECORD_SIZE)
+        finally:
+            os.close(fd)
+        record = cls(path, mm, True)
+        seq = record._seq()
+        if seq & 1:
+            _SEQ.pack_into(mm, 0, seq + 1) # previous writer died in the middle of an update
+        return record
+
+
+    @classmethod
+    def open(cls, path):
+        '''
+        Open an existing record read-only (OSError if missing)
+        '''
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            mm = mmap.mmap(fd, RECORD_SIZE, prot=mmap.PROT_READ)
+        finally:
+            os.close(fd)
+        return cls(path, mm, False)
+
+
+    def _seq(self):
+        return _SEQ.unpack_from(self._mm, 0)[0]
+
+
+    def write(self, stamp, wall, T, H, VPD, heartbeat, status, reads, failures, pid):
+        seq = self._seq()
+        _SEQ.pack_into(self._mm, 0, seq + 1) # odd: update in progress
+        _PAYLOAD.pack_into(self._mm, _SEQ.size, stamp, wall, T, H, VPD, heartbeat, status, reads, failures, pid)
+        _SEQ.pack_into(self._mm, 0, seq + 2)
+
+
+    def read(self, retries=100):
+        '''
+        Consistent thSample, or None if the record is empty (or a write never completes)
+        '''
+        for _ in range(retries):
+            seq = self._seq()
+            if seq & 1:
+                time.sleep(0) # writer in the middle of an update
+                continue
+            values = _PAYLOAD.unpack_from(self._mm, _SEQ.size)
+            if self._seq() == seq:
+                sample = thSample(*values)
+                return None if sample.status == STATUS_EMPTY else sample
+        return None
+
+
+    def close(self):
+        self._mm.close()
+
+
+
+###########################################
+# Acquisition process
+###########################################
+
+def acquisition_main(path, configs, parent_pid=None):
+    '''
+    Body of the acquisition process: read the DHT22 every dht22 read_interval seconds
+    and publish the result in the record <path>, until SIGTERM or the parent exits
+    '''
+    from hardware_aeroGreenHouse import get_sensor_backend
+    from sensors_aeroGreenHouse import dht22Session
+    from psychro_aeroGreenHouse import vpd
+
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+    signal.signal(signal.SIGINT, signal.SIG_IGN) # Ctrl-C is handled by the parent, which stops us
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s [%(levelname)s] sensor process: %(message)s')
+
+    cfg = configs.get('dht22', {})
+    interval = cfg.get('read_interval', 5)
+    session = dht22Session(get_sensor_backend(configs), cfg.get('pin', 27),
+                           min_interval=cfg.get('min_interval', 2.0),
+                           max_attempts=cfg.get('max_attempts', 5),
+                           max_backoff=cfg.get('max_backoff', 30.0))
+    record = thRecord.create(path)
+    pid = os.getpid()
+
+    last = record.read()
+    stamp, wall, T, H, VPD = last[:5] if last is not None else (0.0, 0.0, 0.0, 0.0, 0.0)
+    reads = failures = 0
+    try:
+        while not stop_event.is_set() and (parent_pid is None or os.getppid() == parent_pid):
+            try:
+                T, H = session.read(max_age=0)
+                VPD = vpd(T, H)
+                stamp, wall = time.monotonic(), time.time()
+                status = STATUS_OK
+                reads += 1
+            except RuntimeError as error:
+                status = STATUS_ERROR
+                failures += 1
+                logging.warning(str(error))
+            record.write(stamp, wall, T, H, VPD, time.monotonic(), status, reads, failures, pid)
+            stop_event.wait(interval)
+    finally:
+        session.close()
+        record.close()
+
+
+
+class sensorProcess():
+
+    '''
+    Supervisor of the acquisition process: starts it, restarts it (with backoff) if it
+    exits or its heartbeat is older than <hang_timeout> seconds, and reads its record.
+
+    The process runs this module as a script (python sensorproc_aeroGreenHouse.py), so
+    it imports neither the caller's main module nor its threads.
+    '''
+
+    def __init__(self, configs, path=DEFAULT_RECORD, hang_timeout=120.0, check_interval=1.0, logger=None):
+        '''
+        :param configs: configuration dictionary, its dht22 and hardware sections are passed to the process
+        :param path: path of the shared record
+        :param hang_timeout: (s), maximum age of the heartbeat before the process is killed
+        :param check_interval: (s), period of the supervisor checks
+        :param logger: logger of the restarts (default: module logger)
+        '''
+        self.configs = {k: configs.get(k, {}) for k in ('dht22', 'hardware')}
+        self.path = path
+        self.gpio = self.configs['dht22'].get('pin', 27)
+        self.hang_timeout = hang_timeout
+        self.check_interval = check_interval
+        self.logger = logger or logging.getLogger(__name__)
+
+        self._stop = threading.Event()
+        self.proc = None
+        self.started = None # monotonic time of the last process start
+        self._thread = None
+        self.counters = dict.fromkeys(('starts', 'restarts', 'hangs'), 0)
+
+        thRecord.create(path).close() # readers can open the record at once
+        self.record = thRecord.open(path)
+
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._spawn()
+        self._thread = threading.Thread(target=self._supervise, name='sensorSupervisor', daemon=True)
+        self._thread.start()
+
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self._terminate(timeout)
+        self.record.close()
+
+
+    def latest(self):
+        '''
+        Last thSample published by the process (None if there is none yet), never blocks
+        '''
+        return self.record.read()
+
+
+    def _spawn(self):
+        self.proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), self.path,
+                                      json.dumps(self.configs), str(os.getpid())])
+        self.started = time.monotonic()
+        self.counters['starts'] += 1
+        self.logger.info(f'SENSOR: acquisition process started (pid {self.proc.pid})')
+
+
+    def _terminate(self, timeout):
+        if self.proc is None:
+            return
+        self.proc.terminate()
+        try:
+            self.proc.wait(timeout)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+            self.proc.wait()
+        self.proc = None
+
+
+    def _supervise(self):
+        backoff = 1.0
+        while not self._stop.wait(self.check_interval):
+            now = time.monotonic()
+            if self.proc.poll() is None:
+                sample = self.record.read()
+                beat = sample.heartbeat if sample is not None and sample.pid == self.proc.pid else 0.0
+                beat = max(beat, self.started)
+                if now - beat <= self.hang_timeout:
+                    if now - self.started > 60:
+                        backoff = 1.0 # the process has been running fine for a while
+                    continue
+                self.counters['hangs'] += 1
+                self.logger.error(f'SENSOR: acquisition process not responding for {now - beat:.0f}s, restarting it')
+            else:
+                self.logger.error(f'SENSOR: acquisition process exited (code {self.proc.returncode}), restarting it in {backoff:.0f}s')
+                if self._stop.wait(backoff):
+                    break
+                backoff = min(backoff * 2, 60.0)
+
+            self._terminate(self.check_interval)
+            self.counters['restarts'] += 1
+            self._spawn()
+
+
+    def collect_metrics(self):
+        '''
+        Metric families of the process (see metrics_aeroGreenHouse.metricsRegistry.set_collector)
+        '''
+        sample = self.record.read()
+        families = [('aero_sensor_process_events_total', 'counter', 'Starts, restarts and hangs of the DHT22 acquisition process',
+                     [({'event': k}, v) for k, v in self.counters.items()])]
+        if sample is not None:
+            families.append(('aero_sensor_process_reads_total', 'counter', 'DHT22 reads of the current acquisition process',
+                             [({'result': 'ok'}, sample.reads), ({'result': 'failed'}, sample.failures)]))
+        return families
+
+
+
+if __name__ == '__main__':
+    # python sensorproc_aeroGreenHouse.py <record path> <configs json> [<parent pid>]
+    acquisition_main(sys.argv[1], json.loads(sys.argv[2]), int(sys.argv[3]) if len(sys.argv) > 3 else None)
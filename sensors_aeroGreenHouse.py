@@ -0,0 +1,125 @@
+import threading
+import logging
+
+from hardware_aeroGreenHouse import realClock
+from metrics_aeroGreenHouse import DHT22_READS, DHT22_ATTEMPTS, DHT22_READ_SECONDS
+
+
+
+class dht22Session():
+
+    '''
+    Long-lived DHT22 session on one GPIO pin.
+
+    The device object is created once and reused. Reads respect the DHT22 minimum
+    read interval, failed reads are retried with bounded exponential backoff up to
+    <max_attempts>, and concurrent callers are served from the cached reading when
+    it is fresh enough instead of issuing duplicate reads.
+    '''
+
+    def __init__(self, backend, gpio, min_interval=2.0, max_age=2.0, max_attempts=5, max_backoff=30.0, logger=None):
+        '''
+        :param backend: hardware backend providing dht22(gpio) and the clock
+        :param gpio: GPIO number of the sensor
+        :param min_interval: (s), minimum time between two reads of the sensor
+        :param max_age: (s), default age under which the cached reading is returned
+        :param max_attempts: number of reads before giving up
+        :param max_backoff: (s), maximum wait between two failed reads
+        :param logger: logger of the read errors (default: module logger)
+        '''
+        self.backend = backend
+        self.clock = backend.clock if backend is not None else realClock()
+        self.gpio = gpio
+        self.min_interval = min_interval
+        self.max_age = max_age
+        self.max_attempts = max_attempts
+        self.max_backoff = max_backoff
+        self.logger = logger or logging.getLogger(__name__)
+
+        self.device = None
+        self.last = None # (monotonic time, T, H) of the last valid reading
+        self._last_attempt = None
+        self._lock = threading.Lock() # one physical read at a time
+
+        self.counters = dict.fromkeys(('reads', 'attempts', 'failures', 'cache_hits'), 0)
+
+
+    def read(self, max_age=None):
+        '''
+        Temperature (°C) and humidity (%), from the cache if not older than <max_age> seconds.
+        Raises RuntimeError if no valid reading is obtained in <max_attempts> attempts.
+        '''
+        max_age = self.max_age if max_age is None else max_age
+
+        cached = self._fresh(max_age)
+        if cached is not None:
+            return cached
+
+        with self._lock:
+            # another caller may have completed a read while we were waiting
+            cached = self._fresh(max_age)
+            if cached is not None:
+                return cached
+            return self._acquire()
+
+
+    def latest(self):
+        '''
+        Last valid reading (monotonic time, T, H) or None, never blocks
+        '''
+        return self.last
+
+
+    def close(self):
+        with self._lock:
+            if self.device is not None:
+                self.device.exit()
+                self.device = None
+
+
+    def _fresh(self, max_age):
+        last = self.last
+        if last is not None and self.clock.monotonic() - last[0] <= max_age:
+            self.counters['cache_hits'] += 1
+            return last[1], last[2]
+        return None
+
+
+    def _acquire(self):
+        if self.device is None:
+            self.device = self.backend.dht22(self.gpio)
+
+        backoff = self.min_interval
+        started = self.clock.monotonic()
+        for attempt in range(1, self.max_attempts + 1):
+            if self._last_attempt is not None:
+                self.clock.sleep(self._last_attempt + self.min_interval - self.clock.monotonic())
+            self._last_attempt = self.clock.monotonic()
+            self.counters['attempts'] += 1
+
+            try:
+                T = self.device.temperature
+                H = self.device.humidity
+                if T is None or H is None:
+                    raise RuntimeError('DHT22 returned no data')
+            except RuntimeError as error:
+                # DHT22 read errors are frequent and expected, retry later
+                self.counters['failures'] += 1
+                self.logger.debug(f'DHT22 GPIO {self.gpio}: attempt {attempt}/{self.max_attempts} failed ({error.args[0]})')
+                if attempt == self.max_attempts:
+                    DHT22_READS.labels(self.gpio, 'failed').inc()
+                    raise RuntimeError(f'DHT22 GPIO {self.gpio}: no valid reading after {attempt} attempts ({error.args[0]})') from error
+                self.clock.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+                continue
+            except Exception:
+                self.device.exit()
+                self.device = None
+                raise
+
+            self.counters['reads'] += 1
+            self.last = (self.clock.monotonic(), T, H)
+            DHT22_READS.labels(self.gpio, 'ok').inc()
+            DHT22_ATTEMPTS.labels(self.gpio).observe(attempt)
+            DHT22_READ_SECONDS.labels(self.gpio).observe(self.last[0] - started)
+            return T, H
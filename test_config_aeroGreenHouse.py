@@ -0,0 +1,69 @@
+'''
+Tests of the configuration hot-reload helpers: diff_zones and validate_config.
+
+    python -m pytest -q test_config_aeroGreenHouse.py
+'''
+
+import os
+import copy
+
+import pytest
+
+from config_aeroGreenHouse import diff_zones, validate_config, load_yaml
+
+
+
+@pytest.fixture
+def configs():
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.yaml'), 'r') as f:
+        return load_yaml(f)
+
+
+def pumps(configs):
+    return [z for z in configs['gpio_pins'] if z.get('what_type') == 'pump']
+
+
+def test_diff_zones_by_name():
+    old = [{'name': 'A', 'pin': 17, 'interval': 8}, {'name': 'B', 'pin': 27}, {'name': 'C', 'pin': 13}]
+    new = [{'name': 'C', 'pin': 13}, {'name': 'A', 'pin': 17, 'interval': 10}, {'name': 'D', 'pin': 22}]
+    assert diff_zones(old, new) == {'added': ['D'], 'removed': ['B'], 'changed': ['A'], 'unchanged': ['C']}
+
+
+def test_diff_zones_reordered_is_unchanged():
+    old = [{'name': 'A', 'pin': 17}, {'name': 'B', 'pin': 27}]
+    diff = diff_zones(old, list(reversed(copy.deepcopy(old))))
+    assert diff['changed'] == [] and sorted(diff['unchanged']) == ['A', 'B']
+
+
+def test_diff_zones_empty():
+    assert diff_zones(None, [{'name': 'A'}])['added'] == ['A']
+    assert diff_zones([{'name': 'A'}], [])['removed'] == ['A']
+
+
+def test_shipped_config_is_valid(configs):
+    assert validate_config(configs) is configs
+
+
+@pytest.mark.parametrize('key, value', [
+    ('interval', 0), ('on_time', -1), ('overlap_policy', 'burst'), ('cutoff', 'irq'),
+    ('poll_interval', 0), ('debounce_ms', 0), ('debounce_ms', 2.5), ('debounce_ms', True),
+])
+def test_invalid_pump_values(configs, key, value):
+    pumps(configs)[0][key] = value
+    with pytest.raises(ValueError, match=key):
+        validate_config(configs)
+
+
+def test_all_problems_are_reported(configs):
+    zone = pumps(configs)[0]
+    zone['interval'] = 0
+    zone['on_time'] = 'x'
+    with pytest.raises(ValueError) as error:
+        validate_config(configs)
+    assert 'interval' in str(error.value) and 'on_time' in str(error.value)
+
+
+def test_gpio_pins_must_be_a_list(configs):
+    configs['gpio_pins'] = 3
+    with pytest.raises(ValueError, match='gpio_pins'):
+        validate_config(configs)
@@ -0,0 +1,188 @@
+'''
+Tests of the actuation journal: recovery after a crash, snapshot compaction, torn
+records and a compaction interrupted before its snapshot.
+
+A crash is simulated by dropping the journal without close(): the file is unbuffered,
+so every record is already on disk.
+
+    python -m pytest -q test_journal_aeroGreenHouse.py
+'''
+
+import os
+import time
+
+import pytest
+
+from journal_aeroGreenHouse import actuationJournal, journaledGpio, EVENT_ACTIVATE, EVENT_DEACTIVATE, SNAPSHOT_FILE
+from hardware_aeroGreenHouse import simBackend, realClock
+
+
+
+def open_journal(directory, **options):
+    journal = actuationJournal(str(directory), **options)
+    left_on = journal.recover()
+    return journal, left_on
+
+
+def wait_compactions(journal, count, timeout=5):
+    end = time.monotonic() + timeout
+    while journal.counters['compactions'] < count or journal._compactor is not None:
+        if time.monotonic() > end:
+            raise AssertionError(f'compactions: {journal.counters}')
+        time.sleep(0.005)
+
+
+def journals(directory):
+    return sorted(n for n in os.listdir(directory) if n.endswith('.jnl'))
+
+
+def test_crash_recovery_reports_pins_left_on(tmp_path):
+    journal, left_on = open_journal(tmp_path)
+    assert left_on == {}
+    journal.record(EVENT_ACTIVATE, name='AEROPONICS', due=1000.0)
+    journal.set_pin(17, True, 'AEROPONICS')
+    on_wall = journal.pins[17]['wall']
+    journal.set_pin(17, False, 'AEROPONICS')
+    journal.set_pin(27, True, 'IDROPONICS')
+    # crash: no close()
+
+    recovered, left_on = open_journal(tmp_path)
+    assert sorted(left_on) == [27]
+    assert left_on[27]['name'] == 'IDROPONICS'
+    assert recovered.pins[17]['on'] is False
+    assert recovered.zones['AEROPONICS']['last_on'] == on_wall
+    recovered.close()
+
+
+def test_set_pin_records_only_changes(tmp_path):
+    journal, _ = open_journal(tmp_path)
+    assert journal.set_pin(17, True)
+    assert not journal.set_pin(17, True)
+    assert journal.set_pin(17, False)
+    assert journal.counters['records'] == 2
+    journal.close()
+
+
+def test_background_compaction_and_recovery(tmp_path):
+    journal, _ = open_journal(tmp_path, compact_every=10)
+    journal.record(EVENT_ACTIVATE, name='A', due=1.0)
+    for k in range(24):
+        journal.set_pin(17, k % 2 == 0, 'A')
+        wait_compactions(journal, journal.counters['records'] // 10)
+    journal.set_pin(27, True, 'B')
+    assert journal.counters['compactions'] == 2
+    assert os.path.exists(tmp_path / SNAPSHOT_FILE)
+    assert journals(tmp_path) == [f'actuation_{journal.generation}.jnl'] # old journals removed
+
+    recovered, left_on = open_journal(tmp_path, compact_every=10)
+    assert sorted(left_on) == [27]
+    assert recovered.pins[17]['on'] is False # 24 transitions, the last one OFF
+    assert 'A' in recovered.zones
+    assert recovered.counters['replayed'] == 6 # 26 records: only the tail after the last snapshot
+    recovered.close()
+
+
+def test_close_leaves_only_the_snapshot_to_read(tmp_path):
+    journal, _ = open_journal(tmp_path)
+    journal.set_pin(17, True, 'A')
+    journal.record(EVENT_ACTIVATE, name='A', due=5.0)
+    journal.record(EVENT_DEACTIVATE, name='A')
+    journal.close()
+    journal.close() # no-op
+
+    recovered = actuationJournal(str(tmp_path))
+    left_on = recovered.recover(read_only=True)
+    assert sorted(left_on) == [17]
+    assert recovered.zones == {}
+    assert recovered.counters['replayed'] == 0
+
+
+def test_torn_record_is_truncated(tmp_path):
+    journal, _ = open_journal(tmp_path)
+    journal.set_pin(17, True, 'A')
+    journal.set_pin(17, False, 'A')
+    with open(journal.journal_path(journal.generation), 'ab') as f:
+        f.write(b'\x01' * 20) # record cut by a power cut
+
+    recovered, left_on = open_journal(tmp_path)
+    assert left_on == {}
+    assert recovered.counters['truncated'] == 1
+    assert recovered.counters['replayed'] == 2
+    # appended after the cut record: readable at the next recovery
+    recovered.set_pin(27, True, 'B')
+    assert os.path.getsize(recovered.journal_path(recovered.generation)) % 64 == 0
+    recovered, left_on = open_journal(tmp_path)
+    assert sorted(left_on) == [27]
+    recovered.close()
+
+
+def test_compaction_interrupted_before_the_snapshot(tmp_path):
+    journal, _ = open_journal(tmp_path)
+    journal.set_pin(17, True, 'A')
+    journal.compact() # snapshot of generation 1
+    journal.set_pin(17, False, 'A')
+    journal.set_pin(27, True, 'B')
+    # crash right after the switch to the next journal, before its snapshot
+    with journal._lock:
+        journal._switch()
+    journal.set_pin(22, True, 'C')
+
+    recovered, left_on = open_journal(tmp_path)
+    assert sorted(left_on) == [22, 27] # records of both journals replayed
+    assert recovered.pins[17]['on'] is False
+    recovered.close()
+
+    # the recovery compacted both journals in one snapshot
+    final = actuationJournal(str(tmp_path))
+    assert sorted(final.recover(read_only=True)) == [22, 27]
+    assert final.counters['replayed'] == 0
+
+
+def test_recovery_without_snapshot_replays_all_journals(tmp_path):
+    journal, _ = open_journal(tmp_path)
+    journal.set_pin(17, True, 'A')
+    # two switches whose snapshots were never written: three journals, no snapshot
+    for pin in (27, 22):
+        with journal._lock:
+            journal._switch()
+        journal.set_pin(pin, True)
+    journal.set_pin(17, False, 'A')
+    assert len(journals(tmp_path)) == 3
+    assert not os.path.exists(tmp_path / SNAPSHOT_FILE)
+
+    recovered, left_on = open_journal(tmp_path)
+    assert sorted(left_on) == [22, 27] # oldest journal first: pin 17 ends OFF
+    assert recovered.counters['replayed'] == 4
+    assert journals(tmp_path) == [f'actuation_{recovered.generation}.jnl']
+    recovered.close()
+
+
+def test_resume_due(tmp_path):
+    journal, _ = open_journal(tmp_path)
+    journal.record(EVENT_ACTIVATE, name='A', due=100.0)
+    journal.record(EVENT_ACTIVATE, name='B', due=200.0)
+    journal.set_pin(17, True, 'A')
+    wall = journal.pins[17]['wall']
+    assert journal.resume_due({'A': 60, 'B': 30}) == {'A': wall + 60, 'B': 200.0}
+    assert journal.resume_due({'B': 30}) == {'B': 200.0}
+    journal.close()
+
+
+def test_journaled_gpio_is_write_ahead(tmp_path):
+    journal, _ = open_journal(tmp_path)
+    backend = simBackend(realClock())
+    backend.setup(17, backend.OUT, initial=True)
+    seen = []
+    original = backend.output
+    def output(pin, value):
+        seen.append(journal.pins.get(pin, {}).get('on')) # journaled state when the relay switches
+        original(pin, value)
+    backend.output = output
+
+    gpio = journaledGpio(backend, journal, {17: 'A'})
+    gpio.output(17, False) # ON: recorded before the relay
+    gpio.output(17, True) # OFF: recorded after the relay
+    assert seen == [True, True]
+    assert journal.pins[17]['on'] is False
+    assert gpio.OUT == backend.OUT
+    journal.close()
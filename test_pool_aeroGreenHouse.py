@@ -0,0 +1,145 @@
+'''
+Tests of the worker pool: overlap policies (skip, coalesce, queue), pin exclusion
+and shutdown.
+
+    python -m pytest -q test_pool_aeroGreenHouse.py
+'''
+
+import time
+import threading
+
+import pytest
+
+from pool_aeroGreenHouse import aeroWorkerPool
+
+
+
+class blockingJob():
+
+    '''
+    Job function recording its runs; every run waits until release()
+    '''
+
+    def __init__(self):
+        self.runs = []
+        self.running = threading.Semaphore(0) # one release per started run
+        self._gate = threading.Event()
+
+    def __call__(self, tag=None):
+        self.runs.append(tag)
+        self.running.release()
+        self._gate.wait(5)
+
+    def started(self, timeout=5):
+        return self.running.acquire(timeout=timeout)
+
+    def release(self):
+        self._gate.set()
+
+
+
+def wait_idle(pool, timeout=5):
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        s = pool.stats()
+        if s['running'] == 0 and s['pending'] == 0:
+            return s
+        time.sleep(0.005)
+    raise AssertionError(f'pool still busy: {pool.stats()}')
+
+
+@pytest.fixture
+def pool():
+    pool = aeroWorkerPool(size=2, max_pending=2)
+    yield pool
+    pool.shutdown(wait=True, timeout=5)
+
+
+def test_skip_drops_the_overlapping_firing(pool):
+    job = blockingJob()
+    assert pool.submit('A', [17], job, 1, policy='skip')
+    assert job.started()
+    assert not pool.submit('A', [17], job, 2, policy='skip')
+    job.release()
+    s = wait_idle(pool)
+    assert job.runs == [1]
+    assert s['dropped'] == 1 and s['completed'] == 1
+
+
+def test_coalesce_keeps_only_the_newest_firing(pool):
+    job = blockingJob()
+    pool.submit('A', [17], job, 1, policy='coalesce')
+    assert job.started()
+    for tag in (2, 3, 4):
+        assert pool.submit('A', [17], job, tag, policy='coalesce')
+    assert pool.stats()['pending'] == 1
+    job.release()
+    s = wait_idle(pool)
+    assert job.runs == [1, 4]
+    assert s['coalesced'] == 2 and s['dropped'] == 0
+
+
+def test_queue_runs_in_order_up_to_max_pending(pool):
+    job = blockingJob()
+    pool.submit('A', [17], job, 1, policy='queue')
+    assert job.started()
+    assert pool.submit('A', [17], job, 2, policy='queue')
+    assert pool.submit('A', [17], job, 3, policy='queue')
+    assert not pool.submit('A', [17], job, 4, policy='queue') # max_pending 2
+    job.release()
+    s = wait_idle(pool)
+    assert job.runs == [1, 2, 3]
+    assert s['dropped'] == 1 and s['completed'] == 3
+
+
+def test_jobs_on_the_same_pin_never_overlap(pool):
+    job = blockingJob()
+    pool.submit('A', [17], job, 'A', policy='queue')
+    assert job.started()
+    # free thread, but pin 17 is busy: B waits for A
+    assert pool.submit('B', [17], job, 'B', policy='queue')
+    assert not job.started(timeout=0.1)
+    assert job.runs == ['A']
+    job.release()
+    wait_idle(pool)
+    assert job.runs == ['A', 'B']
+
+
+def test_jobs_on_different_pins_run_together(pool):
+    job = blockingJob()
+    pool.submit('A', [17], job, 'A')
+    pool.submit('B', [27], job, 'B')
+    assert job.started() and job.started()
+    job.release()
+    wait_idle(pool)
+    assert sorted(job.runs) == ['A', 'B']
+
+
+def test_failed_job_frees_the_pin(pool):
+    def broken():
+        raise RuntimeError('relay')
+    pool.submit('A', [17], broken)
+    wait_idle(pool)
+    done = threading.Event()
+    assert pool.submit('A', [17], done.set)
+    assert done.wait(5)
+    s = wait_idle(pool)
+    assert s['failed'] == 1 and s['completed'] == 1
+
+
+def test_shutdown_drops_pending_and_never_restarts(pool):
+    job = blockingJob()
+    pool.submit('A', [17], job, 1, policy='queue')
+    assert job.started()
+    pool.submit('A', [17], job, 2, policy='queue')
+    threading.Timer(0.1, job.release).start()
+    pool.shutdown(wait=True, timeout=5)
+    assert job.runs == [1] # the running firing completes, the pending one is discarded
+    assert not pool.submit('A', [17], job, 3)
+    assert pool.stats()['threads'] == 2
+    assert all(not w.is_alive() for w in pool._workers)
+
+
+def test_unknown_policy(pool):
+    with pytest.raises(ValueError):
+        pool.submit('A', [17], print, policy='burst')
@@ -0,0 +1,128 @@
+'''
+Tests of the deadline scheduler: anchored deadlines (no drift), skipped firings when
+the engine is behind and phase kept by update_jobs.
+
+The engine is stepped by hand (_next_due) on a clock that jumps to the deadline instead
+of sleeping, so the firing times are exact.
+
+    python -m pytest -q test_scheduler_aeroGreenHouse.py
+'''
+
+import pytest
+
+from scheduler_aeroGreenHouse import aeroScheduler
+from hardware_aeroGreenHouse import realClock
+
+
+
+class jumpingClock(realClock):
+
+    '''
+    Clock advanced by the test; a wait jumps to its timeout instead of sleeping
+    '''
+
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+    def wait(self, waiter, timeout=None):
+        self.now += timeout
+        return False
+
+
+
+@pytest.fixture
+def clock():
+    return jumpingClock()
+
+
+@pytest.fixture
+def scheduler(clock):
+    sched = aeroScheduler(clock=clock)
+    sched.start = lambda: None # no engine thread, stepped by fire()
+    sched._running = True
+    return sched
+
+
+def fire(scheduler, clock, duration=0.0):
+    '''
+    Next firing: (job name, clock time of the dispatch); the job then runs for <duration>
+    '''
+    job = scheduler._next_due()
+    at = clock.now
+    clock.now += duration
+    return job.name, at
+
+
+def test_deadlines_are_anchored(scheduler, clock):
+    scheduler.add_job('A', 10, print, first_delay=5)
+    # jobs taking 0.7 s do not push the next firings later
+    times = [fire(scheduler, clock, duration=0.7)[1] for _ in range(50)]
+    assert times == [5 + 10 * k for k in range(50)]
+    assert scheduler._jobs['A'].fired == 50
+    assert scheduler._jobs['A'].missed == 0
+
+
+def test_firings_of_several_jobs_in_deadline_order(scheduler, clock):
+    scheduler.add_job('A', 10, print)
+    scheduler.add_job('B', 4, print)
+    fired = [fire(scheduler, clock) for _ in range(7)]
+    assert fired == [('B', 4), ('B', 8), ('A', 10), ('B', 12), ('B', 16), ('A', 20), ('B', 20)]
+
+
+def test_behind_skips_missed_firings(scheduler, clock):
+    scheduler.add_job('A', 10, print, first_delay=5)
+    assert fire(scheduler, clock) == ('A', 5)
+
+    # the engine is blocked until 31: the firings of 15 and 25 are one late firing, not a burst
+    clock.now = 31
+    assert fire(scheduler, clock) == ('A', 31)
+    assert scheduler._jobs['A'].missed == 1
+    # back on the original phase
+    assert fire(scheduler, clock) == ('A', 35)
+    assert fire(scheduler, clock) == ('A', 45)
+
+
+def test_update_jobs_keeps_phase(scheduler, clock):
+    scheduler.add_job('A', 10, print, first_delay=5)
+    fire(scheduler, clock)
+    clock.now = 8
+    assert scheduler.next_deadline('A') == 15
+
+    # same interval (e.g. only on_time changed): deadline unchanged
+    scheduler.update_jobs(add=[('A', 10, print, (), {})])
+    assert scheduler.next_deadline('A') == 15
+
+    # new interval: counted from the last firing
+    scheduler.update_jobs(add=[('A', 20, print, (), {})])
+    assert scheduler.next_deadline('A') == 25
+    assert fire(scheduler, clock) == ('A', 25)
+    assert fire(scheduler, clock) == ('A', 45)
+
+
+def test_update_jobs_new_interval_never_in_the_past(scheduler, clock):
+    scheduler.add_job('A', 10, print, first_delay=5)
+    fire(scheduler, clock)
+    clock.now = 9
+    scheduler.update_jobs(add=[('A', 2, print, (), {})])
+    assert scheduler.next_deadline('A') == 9
+
+
+def test_update_jobs_remove_and_first_delay(scheduler, clock):
+    scheduler.add_job('A', 10, print)
+    scheduler.update_jobs(remove=['A'], add=[('B', 10, print, (), {})], first_delay={'B': 3})
+    assert not scheduler.has_job('A')
+    assert fire(scheduler, clock) == ('B', 3)
+
+
+def test_invalid_interval(scheduler):
+    with pytest.raises(ValueError):
+        scheduler.add_job('A', 0, print)
+    with pytest.raises(ValueError):
+        scheduler.update_jobs(add=[('A', -1, print, (), {})])
+    assert not scheduler.has_job('A')
@@ -0,0 +1,102 @@
+'''
+Tests of the chunked TH text parser and of its sidecar index: lines split across
+chunks, truncated / corrupted lines, range queries and incremental indexing.
+
+    python -m pytest -q test_thparser_aeroGreenHouse.py
+'''
+
+import time
+from datetime import datetime, timedelta
+
+from thparser_aeroGreenHouse import iter_records, parseStats, thTextIndex
+from thwriter_aeroGreenHouse import thWriter
+
+
+
+START = datetime(2025, 3, 14, 10, 0, 0)
+
+
+def write_day(directory, start, rows, step=5):
+    with thWriter(str(directory), flush_records=1000) as writer:
+        for k in range(rows):
+            writer.write(start + timedelta(seconds=step * k), 20 + k % 7, 50 + k % 11, 1.0 + k / 1000)
+    return writer.path(start.strftime('%Y_%m_%d'))
+
+
+def epoch(when):
+    return time.mktime(when.timetuple())
+
+
+def test_records_across_chunk_boundaries(tmp_path):
+    path = write_day(tmp_path, START, 500)
+    stats = parseStats()
+    # chunks much smaller than a line: every line is split
+    records = list(iter_records(path, stats=stats, chunk_size=7))
+    assert len(records) == 500 and stats.rows == 500 and stats.bad_lines == 0
+    assert records[0] == (epoch(START), 20.0, 50.0, 1.0)
+    assert records[499][0] == epoch(START) + 5 * 499
+    assert records == list(iter_records(path))
+
+
+def test_truncated_and_corrupted_lines_are_skipped(tmp_path):
+    path = write_day(tmp_path, START, 10)
+    with open(path, 'ab') as f:
+        f.write(b'\x00' * 16 + b'\n') # power cut: NUL block
+        f.write(b'2025/03/14 10:01:00\t 21.00\xc2\xb0C\t 5\n') # cut line
+        f.write(b'2025/03/14 10:01:05\t 22.00\xc2\xb0C\t 51.00%\t 1.2000kPa \n')
+        f.write(b'2025/03/14 10:01:1') # last line without newline
+    stats = parseStats()
+    records = list(iter_records(path, stats=stats))
+    assert len(records) == 11
+    assert records[-1] == (epoch(START) + 65, 22.0, 51.0, 1.2)
+    assert stats.bad_lines == 2 # NUL-only lines are not counted
+
+
+def test_range_stops_at_t1(tmp_path):
+    path = write_day(tmp_path, START, 100)
+    t0, t1 = epoch(START) + 50, epoch(START) + 100
+    assert [r[0] for r in iter_records(path, t0=t0, t1=t1)] == [t0 + 5 * k for k in range(10)]
+
+
+def test_index_range_over_days(tmp_path):
+    # 10:00-18:15 of two days
+    write_day(tmp_path, START, 100, step=300)
+    write_day(tmp_path, START + timedelta(days=1), 100, step=300)
+    index = thTextIndex(str(tmp_path), every=10)
+    assert index.refresh() == 2
+    assert index.refresh() == 0 # unchanged files are not read again
+
+    t0 = epoch(START + timedelta(hours=8))
+    t1 = epoch(START + timedelta(days=1, minutes=30))
+    day2 = epoch(START + timedelta(days=1))
+    assert [r[0] for r in index.range(t0, t1)] == [t0 + 300 * k for k in range(4)] + [day2 + 300 * k for k in range(6)]
+    assert len(index.select(t0, t1)) == 2
+    assert len(index.select(t0 + 3600, day2)) == 0 # the night between the two days
+    assert index.select(t1 + 86400 * 5, t1 + 86400 * 6) == []
+
+
+def test_index_grows_incrementally(tmp_path):
+    path = write_day(tmp_path, START, 100)
+    index = thTextIndex(str(tmp_path), every=10)
+    index.refresh()
+    checkpoints = [list(cp) for cp in index.files['TH_2025_03_14.txt']['checkpoints']]
+    assert index.files['TH_2025_03_14.txt']['rows'] == 100 and len(checkpoints) == 10
+
+    with open(path, 'ab') as f:
+        f.write(b'2025/03/14 11:00:00\t 21.00\xc2\xb0C\t 51.00%\t 1.2000kPa \n')
+        f.write(b'2025/03/14 11:00:0') # being written: indexed at the next refresh
+    index.refresh()
+    grown = index.files['TH_2025_03_14.txt']
+    assert grown['rows'] == 101
+    assert grown['checkpoints'][:10] == checkpoints # extended, not rebuilt
+    assert len(grown['checkpoints']) == 11
+
+    with open(path, 'ab') as f:
+        f.write(b'5\t 21.50\xc2\xb0C\t 51.00%\t 1.2000kPa \n')
+    index.refresh()
+    assert index.files['TH_2025_03_14.txt']['rows'] == 102
+    assert index.files['TH_2025_03_14.txt']['last'] == epoch(START) + 3605
+
+    # the index file is read back by a new instance with the same checkpoint spacing
+    assert thTextIndex(str(tmp_path), every=10).files['TH_2025_03_14.txt']['rows'] == 102
+    assert thTextIndex(str(tmp_path), every=50).files == {} # other spacing: rebuilt
@@ -0,0 +1,125 @@
+'''
+Tests of the buffered TH writer: flush on count / interval, day rollover and close.
+
+    python -m pytest -q test_thwriter_aeroGreenHouse.py
+'''
+
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+import thwriter_aeroGreenHouse
+from thwriter_aeroGreenHouse import thWriter
+from hardware_aeroGreenHouse import realClock
+
+
+
+class steppedClock(realClock):
+
+    '''
+    Clock advanced only by the test
+    '''
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+
+
+DAY = datetime(2025, 3, 14, 23, 59, 0)
+
+
+def lines(writer, day):
+    path = writer.path(day.strftime('%Y_%m_%d'))
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding='utf-8') as f:
+        return f.read().splitlines()
+
+
+@pytest.fixture
+def clock():
+    return steppedClock()
+
+
+def test_flush_on_record_count(tmp_path, clock):
+    writer = thWriter(str(tmp_path), flush_records=3, flush_interval=3600, clock=clock)
+    writer.write(DAY, 20.0, 50.0, 1.17)
+    writer.write(DAY, 20.1, 50.0, 1.18)
+    assert lines(writer, DAY) == []
+
+    writer.write(DAY, 20.2, 50.0, 1.19)
+    assert len(lines(writer, DAY)) == 3
+    assert lines(writer, DAY)[0] == '2025/03/14 23:59:00\t 20.00°C\t 50.00%\t 1.1700kPa '
+    writer.close()
+
+
+def test_flush_on_interval(tmp_path, clock):
+    writer = thWriter(str(tmp_path), flush_records=100, flush_interval=60, clock=clock)
+    writer.write(DAY, 20.0, 50.0, 1.17)
+    clock.now += 59
+    writer.write(DAY, 20.1, 50.0, 1.18)
+    assert lines(writer, DAY) == []
+
+    clock.now += 1
+    writer.write(DAY, 20.2, 50.0, 1.19)
+    assert len(lines(writer, DAY)) == 3
+
+    # the interval restarts from the last flush
+    clock.now += 30
+    writer.write(DAY, 20.3, 50.0, 1.20)
+    assert len(lines(writer, DAY)) == 3
+    writer.close()
+
+
+def test_day_rollover(tmp_path, clock):
+    writer = thWriter(str(tmp_path), flush_records=100, flush_interval=3600, clock=clock)
+    writer.write(DAY, 20.0, 50.0, 1.17)
+    writer.write(DAY + timedelta(seconds=30), 20.1, 50.0, 1.18)
+    next_day = DAY + timedelta(minutes=2)
+    writer.write(next_day, 19.0, 55.0, 0.99)
+
+    # the records of the previous day are flushed to its own file before the rotation
+    assert [l[:10] for l in lines(writer, DAY)] == ['2025/03/14', '2025/03/14']
+    assert lines(writer, next_day) == []
+    assert writer.day == '2025_03_15'
+
+    writer.close()
+    assert [l[:10] for l in lines(writer, next_day)] == ['2025/03/15']
+    assert sorted(os.listdir(tmp_path)) == ['TH_2025_03_14.txt', 'TH_2025_03_15.txt']
+
+
+def test_close_flushes_and_is_idempotent(tmp_path, clock):
+    writer = thWriter(str(tmp_path), flush_records=100, flush_interval=3600, clock=clock)
+    writer.write(DAY, 20.0, 50.0, 1.17)
+    writer.write(DAY, 20.1, 50.0, 1.18)
+    writer.close()
+    assert len(lines(writer, DAY)) == 2
+    assert writer.fid is None
+
+    writer.close()
+    assert len(lines(writer, DAY)) == 2
+
+    # written after close: the daily file is opened again in append mode
+    with writer:
+        writer.write(DAY, 20.2, 50.0, 1.19)
+    assert len(lines(writer, DAY)) == 3
+    assert writer.records == 3
+
+
+def test_fsync_after_flush(tmp_path, clock, monkeypatch):
+    synced = []
+    monkeypatch.setattr(thwriter_aeroGreenHouse.os, 'fsync', synced.append)
+    writer = thWriter(str(tmp_path), flush_records=2, flush_interval=3600, fsync=True, clock=clock)
+    writer.write(DAY, 20.0, 50.0, 1.17)
+    assert synced == []
+    writer.write(DAY, 20.1, 50.0, 1.18)
+    assert len(synced) == 1
+    writer.close()
+    assert len(synced) == 1 # nothing left to write
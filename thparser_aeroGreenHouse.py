@@ -0,0 +1,313 @@
+'''
+Fast reader of the TH_YYYY_MM_DD.txt daily files (thWriter text format)
+    2026/01/30 13:07:03<TAB> 23.45°C<TAB> 56.78%<TAB> 1.2345kPa
+
+The files are read in large binary chunks and split in lines; the unit suffixes are
+checked and cut with slices (no regex) and the timestamps are computed from the epoch
+of their hour, cached, plus minutes and seconds. Lines that do not parse (truncated by
+a power cut, NUL bytes) are skipped and counted.
+
+thTextIndex keeps a small sidecar index (TH_index.json) with the time bounds, the row
+count and a sparse (time, byte offset) checkpoint list of each file: a date-range query
+opens only the files overlapping the range and seeks to the last checkpoint before it.
+Growing files (the current day) are indexed incrementally from the last indexed offset.
+
+    python thparser_aeroGreenHouse.py index DIR
+    python thparser_aeroGreenHouse.py range DIR 2026-01-01T00:00 2026-01-02T00:00
+'''
+
+import os
+import json
+import time
+import glob
+import bisect
+from datetime import datetime
+
+
+
+CHUNK_SIZE = 1 << 20
+INDEX_FILE = 'TH_index.json'
+INDEX_VERSION = 1
+
+_SUFFIX_T = '°C'.encode()
+_SUFFIX_H = b'%'
+_SUFFIX_VPD = b'kPa'
+
+
+
+class parseStats():
+
+    '''
+    Counters of a parse: rows parsed and lines skipped
+    '''
+
+    def __init__(self):
+        self.rows = 0
+        self.bad_lines = 0
+
+
+
+class _lineParser():
+
+    '''
+    Line -> (epoch, T, H, VPD) with the epoch of each hour (local time) cached
+    '''
+
+    def __init__(self):
+        self._hours = {}
+
+
+    def hour_epoch(self, key):
+        epoch = self._hours.get(key)
+        if epoch is None:
+            # b'YYYY/MM/DD HH', raises ValueError if malformed
+            if len(key) != 13 or key[4:5] != b'/' or key[7:8] != b'/' or key[10:11] != b' ':
+                raise ValueError(key)
+            epoch = time.mktime((int(key[0:4]), int(key[5:7]), int(key[8:10]), int(key[11:13]), 0, 0, 0, 0, -1))
+            self._hours[key] = epoch
+        return epoch
+
+
+    def parse(self, line):
+        '''
+        (epoch, T, H, VPD) of a line (bytes), None if it is not a complete valid line
+        '''
+        fields = line.split(b'\t')
+        if len(fields) != 4:
+            return None
+        ts, T, H, VPD = fields
+        VPD = VPD.rstrip()
+        if not (T.endswith(_SUFFIX_T) and H.endswith(_SUFFIX_H) and VPD.endswith(_SUFFIX_VPD)):
+            return None
+        try:
+            ts = ts.strip()
+            if len(ts) != 19 or ts[13:14] != b':' or ts[16:17] != b':':
+                return None
+            t = self.hour_epoch(ts[:13]) + int(ts[14:16]) * 60 + int(ts[17:19])
+            return t, float(T[:-3]), float(H[:-1]), float(VPD[:-3])
+        except ValueError:
+            return None
+
+
+
+def _chunks(path, offset=0, chunk_size=CHUNK_SIZE):
+    '''
+    (offset of the first line, [complete lines]) of the file from <offset>. A last line
+    without newline is returned alone at the end (possibly truncated).
+    '''
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        rest = b''
+        base = offset
+        while True:
+            data = f.read(chunk_size)
+            if not data:
+                break
+            data = rest + data
+            cut = data.rfind(b'\n') + 1
+            if cut:
+                yield base, data[:cut - 1].split(b'\n')
+                base += cut
+            rest = data[cut:]
+        if rest:
+            yield base, [rest]
+
+
+def iter_records(path, offset=0, t0=None, t1=None, stats=None, chunk_size=CHUNK_SIZE):
+    '''
+    Generator of the (epoch, T, H, VPD) records of a TH text file
+
+    :param offset: byte offset of the first line to read (e.g. an index checkpoint)
+    :param t0, t1: only the records with t0 <= time < t1 (the file is in time order:
+                   the read stops at the first record >= t1)
+    :param stats: parseStats updated with the rows and the skipped lines
+    '''
+    parser = _lineParser()
+    parse = parser.parse
+    lo = float('-inf') if t0 is None else t0
+    hi = float('inf') if t1 is None else t1
+    for _, lines in _chunks(path, offset, chunk_size):
+        for line in lines:
+            rec = parse(line)
+            if rec is None:
+                if stats is not None and line.strip(b'\x00 \r'):
+                    stats.bad_lines += 1
+                continue
+            if rec[0] < lo:
+                continue
+            if rec[0] >= hi:
+                return
+            if stats is not None:
+                stats.rows += 1
+            yield rec
+
+
+def iter_blocks(path, rows=65536, **kwargs):
+    '''
+    Generator of NumPy structured arrays (thstore th_dtype: time, T, H, VPD) of at most
+    <rows> records, same arguments as iter_records
+    '''
+    import numpy as np
+    from thstore_aeroGreenHouse import th_dtype
+
+    dtype = th_dtype()
+    block = []
+    for rec in iter_records(path, **kwargs):
+        block.append(rec)
+        if len(block) == rows:
+            yield np.array(block, dtype=dtype)
+            block = []
+    if block:
+        yield np.array(block, dtype=dtype)
+
+
+
+class thTextIndex():
+
+    '''
+    Sidecar index of the TH text files of a directory, see the module docstring
+    '''
+
+    def __init__(self, saving_dir, prefix='TH_', every=1000, index_file=INDEX_FILE):
+        '''
+        :param saving_dir: directory of the TH_YYYY_MM_DD.txt files
+        :param every: rows between two checkpoints (about 80 minutes at 5 s)
+        '''
+        self.saving_dir = saving_dir
+        self.prefix = prefix
+        self.every = every
+        self.path = os.path.join(saving_dir, index_file)
+        self.files = {} # {file name: entry}
+        self._load()
+
+
+    def refresh(self):
+        '''
+        Index the new and changed files (a grown file from its last indexed offset), drop
+        the removed ones and save the index. Returns the number of files (re)indexed.
+        '''
+        names = {os.path.basename(p) for p in glob.glob(os.path.join(self.saving_dir, f'{self.prefix}????_??_??.txt'))}
+        changed = 0
+        for name in list(self.files):
+            if name not in names:
+                del self.files[name]
+                changed += 1
+
+        for name in sorted(names):
+            path = os.path.join(self.saving_dir, name)
+            st = os.stat(path)
+            entry = self.files.get(name)
+            if entry is not None and entry['size'] == st.st_size and entry['mtime'] == st.st_mtime:
+                continue
+            if entry is None or st.st_size <= entry['indexed']: # new, truncated or rewritten
+                entry = {'first': None, 'last': None, 'rows': 0, 'checkpoints': [], 'indexed': 0}
+            self._extend(path, entry)
+            entry['size'], entry['mtime'] = st.st_size, st.st_mtime
+            self.files[name] = entry
+            changed += 1
+
+        if changed:
+            self._save()
+        return changed
+
+
+    def _extend(self, path, entry):
+        # continue the entry from the offset after its last complete line
+        parser = _lineParser()
+        rows = entry['rows']
+        size = os.path.getsize(path)
+        for base, lines in _chunks(path, entry['indexed']):
+            pos = base
+            for line in lines:
+                line_offset = pos
+                pos += len(line) + 1
+                if pos > size:
+                    break # last line without newline, maybe still being written: next refresh
+                rec = parser.parse(line)
+                if rec is not None:
+                    if rows % self.every == 0:
+                        entry['checkpoints'].append([rec[0], line_offset])
+                    if entry['first'] is None:
+                        entry['first'] = rec[0]
+                    entry['last'] = rec[0]
+                    rows += 1
+                entry['indexed'] = pos
+        entry['rows'] = rows
+
+
+    def select(self, t0, t1):
+        '''
+        [(path, offset)] of the files with records in [t0, t1), offset of the last
+        checkpoint before t0
+        '''
+        out = []
+        for name in sorted(self.files):
+            entry = self.files[name]
+            if entry['first'] is None or entry['last'] < t0 or entry['first'] >= t1:
+                continue
+            cps = entry['checkpoints']
+            k = bisect.bisect_right([cp[0] for cp in cps], t0) - 1
+            out.append((os.path.join(self.saving_dir, name), cps[k][1] if k >= 0 else 0))
+        return out
+
+
+    def range(self, t0, t1, stats=None):
+        '''
+        Generator of the (epoch, T, H, VPD) records with t0 <= time < t1
+        '''
+        for path, offset in self.select(t0, t1):
+            yield from iter_records(path, offset, t0, t1, stats)
+
+
+    def range_blocks(self, t0, t1, rows=65536):
+        '''
+        NumPy structured arrays of the records with t0 <= time < t1 (one or more per file)
+        '''
+        for path, offset in self.select(t0, t1):
+            yield from iter_blocks(path, rows, offset=offset, t0=t0, t1=t1)
+
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get('version') == INDEX_VERSION and data.get('every') == self.every:
+            self.files = data.get('files', {})
+
+
+    def _save(self):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'version': INDEX_VERSION, 'every': self.every, 'files': self.files}, f)
+        os.replace(tmp, self.path)
+
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='TH text files: index and range queries')
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    idx = sub.add_parser('index', help='build / update the sidecar index of a directory')
+    idx.add_argument('dir')
+    rng = sub.add_parser('range', help='print the records of a time range')
+    rng.add_argument('dir')
+    rng.add_argument('start', help='YYYY-MM-DD[THH:MM]')
+    rng.add_argument('end', help='YYYY-MM-DD[THH:MM], excluded')
+    args = parser.parse_args()
+
+    index = thTextIndex(args.dir)
+    t = time.perf_counter()
+    n = index.refresh()
+    if args.cmd == 'index':
+        rows = sum(e['rows'] for e in index.files.values())
+        print(f'{len(index.files)} files, {rows} rows ({n} indexed in {time.perf_counter() - t:.2f}s)')
+    else:
+        stats = parseStats()
+        t0 = datetime.fromisoformat(args.start).timestamp()
+        t1 = datetime.fromisoformat(args.end).timestamp()
+        for when, T, H, VPD in index.range(t0, t1, stats):
+            print(f'{datetime.fromtimestamp(when):%Y/%m/%d %H:%M:%S}\t{T:.2f}\t{H:.2f}\t{VPD:.4f}')
+        if stats.bad_lines:
+            print(f'# {stats.bad_lines} lines skipped')
@@ -0,0 +1,213 @@
+'''
+Compact binary store of the temperature/humidity/VPD history.
+
+One file per day (TH_YYYY_MM_DD.thb): a 16 bytes header followed by fixed-width
+little-endian records
+    time (float64, epoch s) | T (float32, °C) | H (float32, %) | VPD (float32, kPa)
+appended in time order. The files can be memory-mapped as NumPy structured arrays:
+time-range lookups are binary searches on the time column and the returned slices are
+views of the mapped file (no copy).
+
+    python thstore_aeroGreenHouse.py convert /path/TH_2026_01_01.txt [...] [--out DIR]
+'''
+
+import os
+import glob
+import struct
+import bisect
+from datetime import datetime
+
+from thwriter_aeroGreenHouse import thWriter, FORMAT_FILE_DATE, FORMAT_TIMESTAMP
+
+
+
+MAGIC = b'AGHTH\x01' # format version 1
+HEADER = MAGIC.ljust(16, b'\x00')
+HEADER_SIZE = len(HEADER)
+RECORD = struct.Struct('<dfff')
+RECORD_SIZE = RECORD.size # 20 bytes
+EXTENSION = '.thb'
+
+
+def th_dtype():
+    '''
+    NumPy dtype of a record (numpy is imported only when needed)
+    '''
+    import numpy as np
+    return np.dtype([('time', '<f8'), ('T', '<f4'), ('H', '<f4'), ('VPD', '<f4')])
+
+
+
+class thBinaryWriter(thWriter):
+
+    '''
+    Buffered, day-rotating writer of the binary TH files (same policy as thWriter)
+    '''
+
+    extension = EXTENSION
+    binary = True
+
+    def encode(self, when, T, H, VPD):
+        return RECORD.pack(when.timestamp(), T, H, VPD)
+
+    def _open(self, path):
+        fid = open(path, 'ab')
+        size = fid.tell()
+        if size < HEADER_SIZE:
+            fid.truncate(0)
+            fid.write(HEADER)
+        elif (size - HEADER_SIZE) % RECORD_SIZE:
+            # last record truncated by a power cut: drop it to keep the records aligned
+            fid.truncate(size - (size - HEADER_SIZE) % RECORD_SIZE)
+        return fid
+
+
+
+class thStore():
+
+    '''
+    Reader of the binary TH files of a directory
+    '''
+
+    def __init__(self, saving_dir, prefix='TH_'):
+        self.saving_dir = saving_dir
+        self.prefix = prefix
+
+
+    def path(self, day):
+        return os.path.join(self.saving_dir, f'{self.prefix}{day}{EXTENSION}')
+
+
+    def days(self):
+        '''
+        Sorted list of the available days (YYYY_MM_DD)
+        '''
+        files = glob.glob(os.path.join(self.saving_dir, f'{self.prefix}*{EXTENSION}'))
+        return sorted(os.path.basename(f)[len(self.prefix):-len(EXTENSION)] for f in files)
+
+
+    def count(self, day):
+        '''
+        Number of complete records of <day>
+        '''
+        try:
+            size = os.path.getsize(self.path(day))
+        except FileNotFoundError:
+            return 0
+        return max(0, (size - HEADER_SIZE) // RECORD_SIZE)
+
+
+    def load_day(self, day):
+        '''
+        Memory-mapped structured array of <day> (fields time, T, H, VPD)
+        '''
+        import numpy as np
+        n = self.count(day)
+        if n == 0:
+            return np.empty(0, dtype=th_dtype())
+        with open(self.path(day), 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f'{self.path(day)} is not a TH binary file')
+        return np.memmap(self.path(day), dtype=th_dtype(), mode='r', offset=HEADER_SIZE, shape=(n,))
+
+
+    def range(self, t0, t1):
+        '''
+        Records with t0 <= time < t1 (epoch s), as a list of zero-copy slices of the
+        memory-mapped daily files (one per day). Each lookup is a binary search.
+        '''
+        import numpy as np
+        out = []
+        for day in self._days_between(t0, t1):
+            data = self.load_day(day)
+            if len(data) == 0:
+                continue
+            times = data['time']
+            i0 = int(np.searchsorted(times, t0, side='left'))
+            i1 = int(np.searchsorted(times, t1, side='left'))
+            if i1 > i0:
+                out.append(data[i0:i1])
+        return out
+
+
+    def range_array(self, t0, t1):
+        '''
+        Records with t0 <= time < t1 as a single array (copied if more than one day)
+        '''
+        import numpy as np
+        parts = self.range(t0, t1)
+        if len(parts) == 1:
+            return parts[0]
+        return np.concatenate(parts) if parts else np.empty(0, dtype=th_dtype())
+
+
+    def records(self, day):
+        '''
+        Iterator of the (time, T, H, VPD) records of <day>, without NumPy
+        '''
+        with open(self.path(day), 'rb') as f:
+            f.seek(HEADER_SIZE)
+            data = f.read(self.count(day) * RECORD_SIZE)
+        return RECORD.iter_unpack(data)
+
+
+    def _days_between(self, t0, t1):
+        available = self.days()
+        first = datetime.fromtimestamp(t0).strftime(FORMAT_FILE_DATE)
+        last = datetime.fromtimestamp(t1).strftime(FORMAT_FILE_DATE)
+        i0 = bisect.bisect_left(available, first)
+        i1 = bisect.bisect_right(available, last)
+        return available[i0:i1]
+
+
+
+def parse_th_line(line):
+    '''
+    (epoch, T, H, VPD) of a line of the TH text files, None if the line is not valid
+    '''
+    fields = line.split('\t')
+    if len(fields) != 4:
+        return None
+    try:
+        when = datetime.strptime(fields[0].strip(), FORMAT_TIMESTAMP)
+        T = float(fields[1].strip()[:-2]) # °C
+        H = float(fields[2].strip()[:-1]) # %
+        VPD = float(fields[3].strip()[:-3]) # kPa
+    except ValueError:
+        return None
+    return when.timestamp(), T, H, VPD
+
+
+def convert_txt(txt_path, out_dir=None):
+    '''
+    Convert a TH_YYYY_MM_DD.txt file to the binary format, returns (output path, records)
+
+    :param txt_path: text file to convert
+    :param out_dir: output directory (default: same directory of the text file)
+    '''
+    out_dir = out_dir or os.path.dirname(txt_path)
+    out_path = os.path.join(out_dir, os.path.splitext(os.path.basename(txt_path))[0] + EXTENSION)
+
+    from thparser_aeroGreenHouse import iter_records
+    records = sorted(iter_records(txt_path), key=lambda r: r[0])
+
+    tmp_path = out_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER)
+        f.write(b''.join(RECORD.pack(*r) for r in records))
+    os.replace(tmp_path, out_path)
+    return out_path, len(records)
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='TH binary store tools')
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    conv = sub.add_parser('convert', help='convert TH_*.txt files to the binary format')
+    conv.add_argument('files', nargs='+')
+    conv.add_argument('--out', default=None, help='output directory')
+    args = parser.parse_args()
+
+    for txt in args.files:
+        out, n = convert_txt(txt, args.out)
+        print(f'{txt} -> {out} ({n} records)')
@@ -0,0 +1,159 @@
+import os
+import atexit
+import threading
+
+from hardware_aeroGreenHouse import realClock
+
+
+
+# one line of the TH_YYYY_MM_DD.txt daily files
+FORMAT_DATA_OUT = "%s\t %5.2f°C\t %5.2f%%\t %5.4fkPa \n"
+FORMAT_TIMESTAMP = "%Y/%m/%d %H:%M:%S"
+FORMAT_FILE_DATE = "%Y_%m_%d"
+
+
+
+class thWriter():
+
+    '''
+    Buffered writer of the temperature/humidity/VPD daily files (TH_YYYY_MM_DD.txt).
+
+    The file of the current day is kept open and the records are buffered: they are
+    written every <flush_records> records or <flush_interval> seconds, whichever comes
+    first, optionally followed by an fsync. The file is rotated when the date of the
+    records changes (midnight) and the buffer is always flushed on close / exit.
+
+    Subclasses change the file format through extension / binary / encode.
+    '''
+
+    extension = '.txt'
+    binary = False
+
+    def __init__(self, saving_dir, flush_records=12, flush_interval=60.0, fsync=False, prefix='TH_', clock=None):
+        '''
+        :param saving_dir: directory of the daily files
+        :param flush_records: write the buffer every N records
+        :param flush_interval: (s), write the buffer at least every T seconds
+        :param fsync: fsync the file after every flush
+        :param prefix: prefix of the daily file names
+        :param clock: clock of the hardware backend (default: real clock)
+        '''
+        self.saving_dir = saving_dir
+        self.flush_records = max(1, flush_records)
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.prefix = prefix
+        self.clock = clock or realClock()
+
+        self.fid = None
+        self.day = None
+        self.records = 0 # records written since the creation
+        self._buffer = []
+        self._last_flush = self.clock.monotonic()
+        self._lock = threading.Lock()
+
+        atexit.register(self.close)
+
+
+    def path(self, day):
+        '''
+        Daily file of <day> (YYYY_MM_DD)
+        '''
+        return os.path.join(self.saving_dir, f'{self.prefix}{day}{self.extension}')
+
+
+    def write(self, when, T, H, VPD):
+        '''
+        Buffer one record
+
+        :param when: datetime of the reading
+        :param T: (°C), temperature
+        :param H: (%), relative humidity
+        :param VPD: (kPa), vapour pressure deficit
+        '''
+        day = when.strftime(FORMAT_FILE_DATE)
+        with self._lock:
+            if day != self.day:
+                self._rotate(day)
+            self._buffer.append(self.encode(when, T, H, VPD))
+            self.records += 1
+            if len(self._buffer) >= self.flush_records or self.clock.monotonic() - self._last_flush >= self.flush_interval:
+                self._flush()
+
+
+    def encode(self, when, T, H, VPD):
+        '''
+        Record as written in the file
+        '''
+        return FORMAT_DATA_OUT % (when.strftime(FORMAT_TIMESTAMP), T, H, VPD)
+
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+
+    def close(self):
+        '''
+        Flush the buffer and close the daily file (can be called more than once)
+        '''
+        with self._lock:
+            self._flush()
+            if self.fid is not None:
+                self.fid.close()
+                self.fid = None
+                self.day = None
+
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+    def _flush(self):
+        self._last_flush = self.clock.monotonic()
+        if not self._buffer or self.fid is None:
+            return
+        self.fid.write((b'' if self.binary else '').join(self._buffer))
+        self._buffer.clear()
+        self.fid.flush()
+        if self.fsync:
+            os.fsync(self.fid.fileno())
+
+
+    def _rotate(self, day):
+        # records of the previous day go to the previous file
+        self._flush()
+        if self.fid is not None:
+            self.fid.close()
+        self.fid = self._open(self.path(day))
+        self.day = day
+
+
+    def _open(self, path):
+        return open(path, 'a', encoding='utf-8')
+
+
+
+class thMultiWriter():
+
+    '''
+    Same records written to several TH writers (e.g. text and binary)
+    '''
+
+    def __init__(self, writers):
+        self.writers = list(writers)
+
+    def write(self, when, T, H, VPD):
+        for w in self.writers:
+            w.write(when, T, H, VPD)
+
+    def flush(self):
+        for w in self.writers:
+            w.flush()
+
+    def close(self):
+        for w in self.writers:
+            w.close()
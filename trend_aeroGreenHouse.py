@@ -0,0 +1,313 @@
+'''
+Trend charts of T, H and VPD for the Ambient tab of the GUI.
+
+The readings received by the GUI go in a bounded ring buffer (raw samples of the last
+hours); older history comes from the minute rollups (see rollup_aeroGreenHouse), which
+already carry the min/max of each minute. A chart never plots the samples: they are
+reduced to one min/max bar per pixel column of the widget, so the canvas holds at
+most <width> items whatever the window (hour, day, week). A new reading only updates
+the last column, or shifts the existing items left when time moves to a new column;
+a full redraw happens only on resize, window change or when the value leaves the y range.
+'''
+
+import math
+import time
+import tkinter as tk
+from array import array
+from collections import deque
+
+
+
+WINDOWS = {'1h': 3600, '24h': 86400, '7g': 7 * 86400}
+
+
+
+class ringBuffer():
+
+    '''
+    Last <capacity> samples (time, value_1..value_n) in preallocated arrays, O(1) append
+    '''
+
+    def __init__(self, capacity, fields=3):
+        self.capacity = capacity
+        self.times = array('d', bytes(8 * capacity))
+        self.values = [array('d', bytes(8 * capacity)) for _ in range(fields)]
+        self.start = 0
+        self.size = 0
+
+
+    def append(self, t, *values):
+        i = (self.start + self.size) % self.capacity
+        self.times[i] = t
+        for column, v in zip(self.values, values):
+            column[i] = v
+        if self.size < self.capacity:
+            self.size += 1
+        else:
+            self.start = (self.start + 1) % self.capacity
+
+
+    def __len__(self):
+        return self.size
+
+
+    def time(self, k):
+        '''
+        Time of the k-th oldest sample
+        '''
+        return self.times[(self.start + k) % self.capacity]
+
+
+    def first_time(self):
+        return self.time(0) if self.size else None
+
+
+    def last_time(self):
+        return self.time(self.size - 1) if self.size else None
+
+
+    def samples(self, field, t0=float('-inf')):
+        '''
+        Iterator of (time, value) of <field> with time >= t0, oldest first (binary search on t0)
+        '''
+        k, hi = 0, self.size # bisect_left by hand: no key= before Python 3.10
+        while k < hi:
+            mid = (k + hi) // 2
+            if self.time(mid) < t0:
+                k = mid + 1
+            else:
+                hi = mid
+        column = self.values[field]
+        for j in range(k, self.size):
+            i = (self.start + j) % self.capacity
+            yield self.times[i], column[i]
+
+
+
+class trendSource():
+
+    '''
+    Data of the charts: the ring buffer of the live readings, preceded by the minute
+    rollups of the TH directory (if available)
+    '''
+
+    def __init__(self, capacity, rollups=None):
+        '''
+        :param capacity: samples kept in the ring buffer
+        :param rollups: rollupStore of the TH directory (None: only the live readings)
+        '''
+        self.ring = ringBuffer(capacity)
+        self.rollups = rollups
+
+
+    def add(self, t, T, H, VPD):
+        '''
+        Add a reading, False if it is not newer than the last one
+        '''
+        last = self.ring.last_time()
+        if last is not None and t <= last:
+            return False
+        self.ring.append(t, T, H, VPD)
+        return True
+
+
+    def limited_from(self, t0):
+        '''
+        Time of the oldest reading if the data do not reach back to <t0> (no rollups:
+        only the readings of the ring buffer), else None
+        '''
+        if self.rollups is not None:
+            return None
+        first = self.ring.first_time()
+        return first if first is not None and first > t0 else None
+
+
+    def points(self, field, t0, t1):
+        '''
+        Iterator of (time, min, max) of <field> (0: T, 1: H, 2: VPD) in [t0, t1)
+        '''
+        ring_start = self.ring.first_time()
+        if self.rollups is not None and (ring_start is None or ring_start > t0):
+            end = t1 if ring_start is None else min(ring_start, t1)
+            try:
+                buckets = self.rollups.buckets('minute', t0, end)
+            except (OSError, ValueError):
+                buckets = []
+            for b in buckets:
+                yield b.start, b.mins[field], b.maxs[field]
+        for t, v in self.ring.samples(field, t0):
+            if t >= t1:
+                break
+            yield t, v, v
+
+
+
+class trendChart():
+
+    '''
+    Min/max per pixel column chart of one field of a trendSource on a tk.Canvas
+    '''
+
+    MARGIN_LEFT = 48
+    MARGIN_Y = 8
+
+    def __init__(self, parent, source, field, title, unit, color, window=3600, height=110):
+        '''
+        :param parent: Tk container
+        :param source: trendSource
+        :param field: 0: T, 1: H, 2: VPD
+        :param window: (s), time shown
+        '''
+        self.source = source
+        self.field = field
+        self.title = title
+        self.unit = unit
+        self.color = color
+        self.window = window
+
+        self.canvas = tk.Canvas(parent, height=height, bg='white', highlightthickness=0)
+        self.canvas.bind('<Configure>', self._on_configure)
+        self._resize_job = None
+
+        self.width = 0 # pixel columns of the plot
+        self.dt = 1.0 # (s) per column
+        self.last_col = None # absolute column (time // dt) of the right edge
+        self.bins = deque() # [min, max] or None, one per column, oldest first
+        self.items = deque() # canvas line id or None, aligned with bins
+        self.y_lo = self.y_hi = None
+        self.now = None
+        self.limited_from = None # time of the oldest data, if newer than the left edge
+
+
+    def set_window(self, window, now=None):
+        self.window = window
+        self.redraw(now)
+
+
+    def redraw(self, now=None):
+        '''
+        Full redraw from the source, right edge at <now> (default: last reading)
+        '''
+        c = self.canvas
+        c.delete('all')
+        self.width = max(c.winfo_width() - self.MARGIN_LEFT - 4, 10)
+        self.dt = self.window / self.width
+        self.now = now if now is not None else (self.source.ring.last_time() or self.now)
+        self.bins = deque([None] * self.width)
+        self.items = deque([None] * self.width)
+        if self.now is None:
+            self.last_col = None
+            self.limited_from = None
+            self._draw_frame()
+            return
+
+        self.last_col = math.floor(self.now / self.dt)
+        first = self.last_col - self.width + 1
+        self.limited_from = self.source.limited_from(first * self.dt)
+        for t, lo, hi in self.source.points(self.field, first * self.dt, (self.last_col + 1) * self.dt):
+            k = math.floor(t / self.dt) - first
+            if 0 <= k < self.width:
+                b = self.bins[k]
+                if b is None:
+                    self.bins[k] = [lo, hi]
+                else:
+                    b[0], b[1] = min(b[0], lo), max(b[1], hi)
+
+        values = [v for b in self.bins if b is not None for v in b]
+        if values:
+            lo, hi = min(values), max(values)
+            pad = max((hi - lo) * 0.1, 0.05 * max(abs(hi), 1.0))
+            self.y_lo, self.y_hi = lo - pad, hi + pad
+        else:
+            self.y_lo = self.y_hi = None
+        self._draw_frame()
+        for k in range(self.width):
+            self._draw_column(k)
+
+
+    def add(self, t, value):
+        '''
+        Incremental update with a new reading
+        '''
+        if self.last_col is None or self.y_lo is None or not self.y_lo <= value <= self.y_hi:
+            self.redraw(t)
+            return
+
+        col = math.floor(t / self.dt)
+        if col < self.last_col - self.width + 1:
+            return
+        if col > self.last_col:
+            shift = col - self.last_col
+            if shift >= self.width:
+                self.redraw(t)
+                return
+            self.canvas.move('data', -shift, 0)
+            for _ in range(shift):
+                self.bins.popleft()
+                item = self.items.popleft()
+                if item is not None:
+                    self.canvas.delete(item)
+                self.bins.append(None)
+                self.items.append(None)
+            self.last_col = col
+            self.now = t
+
+        k = col - (self.last_col - self.width + 1)
+        b = self.bins[k]
+        if b is None:
+            self.bins[k] = [value, value]
+        elif b[0] <= value <= b[1]:
+            return # nothing to draw
+        else:
+            b[0], b[1] = min(b[0], value), max(b[1], value)
+        self._draw_column(k)
+
+
+    def _y(self, v):
+        h = self.canvas.winfo_height()
+        span = self.y_hi - self.y_lo
+        return self.MARGIN_Y + (self.y_hi - v) / span * (h - 2 * self.MARGIN_Y)
+
+
+    def _draw_column(self, k):
+        b = self.bins[k]
+        if b is None:
+            return
+        x = self.MARGIN_LEFT + k
+        y0, y1 = self._y(b[1]), self._y(b[0]) + 1 # a 1 px bar also for a single value
+        if self.items[k] is None:
+            self.items[k] = self.canvas.create_line(x, y0, x, y1, fill=self.color, width=1, tags='data')
+        else:
+            self.canvas.coords(self.items[k], x, y0, x, y1)
+
+
+    def _draw_frame(self):
+        c = self.canvas
+        h = c.winfo_height()
+        c.create_line(self.MARGIN_LEFT - 1, self.MARGIN_Y, self.MARGIN_LEFT - 1, h - self.MARGIN_Y, fill='#999999')
+        c.create_text(self.MARGIN_LEFT + 4, 2, text=f'{self.title} ({self.unit})', anchor='nw',
+                      font=('Arial', 9, 'bold'), fill=self.color)
+        if self.limited_from is not None:
+            # without the minute rollups the older part of the window is empty, not missing readings
+            since = time.strftime('%d/%m %H:%M', time.localtime(self.limited_from))
+            c.create_text(self.MARGIN_LEFT + self.width, 2, text=f'dati dal {since} (storico: dht22 rollup)', anchor='ne',
+                          font=('Arial', 8), fill='gray')
+        if self.y_lo is None:
+            c.create_text(self.MARGIN_LEFT + self.width // 2, h // 2, text='nessun dato', fill='gray')
+            return
+        for v in (self.y_hi, (self.y_hi + self.y_lo) / 2, self.y_lo):
+            y = self._y(v)
+            c.create_text(self.MARGIN_LEFT - 4, y, text=f'{v:.1f}', anchor='e', font=('Arial', 8), fill='gray')
+            c.create_line(self.MARGIN_LEFT, y, self.MARGIN_LEFT + self.width, y, fill='#eeeeee', dash=(2, 4))
+
+
+    def _on_configure(self, event):
+        # redraw once the resize is over
+        if self._resize_job is not None:
+            self.canvas.after_cancel(self._resize_job)
+        self._resize_job = self.canvas.after(150, self._resized)
+
+
+    def _resized(self):
+        self._resize_job = None
+        self.redraw(self.now)
@@ -0,0 +1,100 @@
+'''
+Registry of the zones of the controller, built from the gpio_pins entries of the config.
+
+Every pump entry is a zone; its mode selects the irrigation cycle:
+    aeroponics  timed spray (on_time seconds every interval minutes)
+    idroponics  fill until the level sensor named in <sensor> reports high water,
+                on_time is the maximum pump time
+Sensor entries are referenced by name, so the order of gpio_pins does not matter.
+
+    - name: IDROPONICS
+      pin: 27
+      what_type: pump
+      mode: idroponics
+      sensor: MOISTURE
+'''
+
+MODES = ('aeroponics', 'idroponics')
+
+
+
+def zone_mode(zone):
+    '''
+    Mode of a pump entry: the <mode> key, else idroponics if it references a sensor or is
+    named IDROPONICS (configs written before the mode key), else aeroponics
+    '''
+    mode = zone.get('mode')
+    if mode is not None:
+        return mode
+    if zone.get('sensor') is not None or str(zone.get('name', '')).upper() == 'IDROPONICS':
+        return 'idroponics'
+    return 'aeroponics'
+
+
+
+class zoneRegistry():
+
+    '''
+    Pumps and sensors of a configuration, indexed by name (constant-time lookups)
+    '''
+
+    def __init__(self, gpio_pins):
+        '''
+        :param gpio_pins: gpio_pins list of the config. Raises ValueError on unknown modes
+                          or on pumps whose sensor is missing.
+        '''
+        self.pumps = {}
+        self.sensors = {}
+        for entry in gpio_pins or []:
+            if entry.get('what_type', 'pump') == 'sensor':
+                self.sensors[entry['name']] = entry
+            else:
+                self.pumps[entry['name']] = entry
+
+        self._sensor_of = {}
+        for name, zone in self.pumps.items():
+            mode = zone_mode(zone)
+            if mode not in MODES:
+                raise ValueError(f'zone {name}: mode must be one of {MODES}, got {mode}')
+            if mode != 'idroponics':
+                continue
+
+            sensor = zone.get('sensor')
+            if sensor is None and len(self.sensors) == 1:
+                sensor = next(iter(self.sensors)) # configs written before the sensor key
+            if sensor not in self.sensors:
+                raise ValueError(f'zone {name}: sensor {sensor} is not a sensor entry of gpio_pins')
+            self._sensor_of[name] = self.sensors[sensor]
+
+
+    def __contains__(self, name):
+        return name in self.pumps
+
+
+    def __len__(self):
+        return len(self.pumps)
+
+
+    def names(self, mode=None):
+        '''
+        Names of the zones (of <mode> only, if given), in config order
+        '''
+        return [name for name, zone in self.pumps.items() if mode is None or zone_mode(zone) == mode]
+
+
+    def get(self, name):
+        '''
+        gpio_pins entry of the zone <name> (KeyError if unknown)
+        '''
+        return self.pumps[name]
+
+
+    def mode(self, name):
+        return zone_mode(self.pumps[name])
+
+
+    def sensor(self, name):
+        '''
+        gpio_pins entry of the level sensor of the zone <name> (None for aeroponics zones)
+        '''
+        return self._sensor_of.get(name)